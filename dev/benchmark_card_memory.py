@@ -0,0 +1,69 @@
+# Copyright 2023 The Gaggle Authors. All Rights Reserved.
+#
+# This file is part of Gaggle.
+#
+# Gaggle is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Gaggle is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Gaggle. If not, see <https://www.gnu.org/licenses/>.
+"""Measures the memory used per AnkiCard, excluding the field values.
+
+Compares gaggle.AnkiCard against a reference card which stores its fields in a
+per-instance collections.OrderedDict, as AnkiCard did before it was slotted.
+
+Usage: python dev/benchmark_card_memory.py [number of cards]
+"""
+import collections
+import sys
+import tracemalloc
+
+from gaggle import gaggle
+
+NUM_FIELDS = 7
+HEADER = {'guid_idx': 0, 'note_type_idx': 1, 'deck_idx': 2, 'tags_idx': 6}
+
+
+class OrderedDictAnkiCard:
+  """Reference card using the previous per-instance storage."""
+
+  def __init__(self, fields, names):
+    self.has_html = False
+    self.fields = collections.OrderedDict(zip(names, fields))
+
+
+def measure_bytes_per_card(factory, rows):
+  tracemalloc.start()
+  start, _ = tracemalloc.get_traced_memory()
+  cards = [factory(row) for row in rows]
+  end, _ = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  # The list holding the cards is not part of the per card cost
+  list_size = sys.getsizeof(cards)
+  return (end - start - list_size) / len(cards)
+
+
+def main(num_cards):
+  # Lists, as produced by csv.reader, so that each card pays for its storage
+  rows = [[
+      f'card{card_idx}_field{field_idx}' for field_idx in range(NUM_FIELDS)
+  ] for card_idx in range(num_cards)]
+  schema = gaggle.FieldSchema.from_header(HEADER)
+  names = schema.names_for(NUM_FIELDS)
+  ordered_dict_cost = measure_bytes_per_card(
+      lambda row: OrderedDictAnkiCard(row, names), rows)
+  slotted_cost = measure_bytes_per_card(
+      lambda row: gaggle.AnkiCard.from_schema(row, schema), rows)
+  print(f'Cards measured: {num_cards} ({NUM_FIELDS} fields each)')
+  print(f'OrderedDict AnkiCard: {ordered_dict_cost:.0f} bytes per card')
+  print(f'Slotted AnkiCard:     {slotted_cost:.0f} bytes per card')
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
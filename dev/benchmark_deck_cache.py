@@ -0,0 +1,88 @@
+# Copyright 2023 The Gaggle Authors. All Rights Reserved.
+#
+# This file is part of Gaggle.
+#
+# Gaggle is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Gaggle is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Gaggle. If not, see <https://www.gnu.org/licenses/>.
+"""Measures AnkiDeck.from_file() with a gaggle.cache.DeckCache.
+
+For each storage, reports the time to parse an export without a cache, on a
+cache miss (parse and store a snapshot), and on a cache hit (restore the
+snapshot), and the same hit with verify_content. The export is dated an hour
+back, as a settled file would be, so that a hit without verify_content only
+hashes both ends of the file; files modified within the last two seconds are
+always hashed whole.
+
+Usage: python dev/benchmark_deck_cache.py [number of rows]
+"""
+import gc
+import os
+import sys
+import tempfile
+import time
+
+from gaggle import cache
+from gaggle import gaggle
+
+NUM_FIELDS = 7
+HEADER_LINES = '#separator:tab\n#html:false\n#guid column:1\n#tags column:7\n'
+
+
+def write_export(path, num_rows):
+  with open(path, 'w', encoding='utf-8', newline='') as f:
+    f.write(HEADER_LINES)
+    for row_idx in range(num_rows):
+      fields = [f'row{row_idx}_field{idx}' for idx in range(NUM_FIELDS)]
+      f.write('\t'.join(fields) + '\n')
+  modified = time.time() - 3600
+  os.utime(path, (modified, modified))
+
+
+def best_time(function, setup=lambda: None, repeat=3):
+  """Returns the fastest of repeat calls, each after setup and a collection."""
+  timings = []
+  for _ in range(repeat):
+    setup()
+    gc.collect()
+    start = time.perf_counter()
+    function()
+    timings.append(time.perf_counter() - start)
+  return min(timings)
+
+
+def main(num_rows):
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'export.txt')
+    write_export(path, num_rows)
+    deck_cache = cache.DeckCache(os.path.join(directory, 'cache'))
+    verified_cache = cache.DeckCache(
+        os.path.join(directory, 'verified_cache'), verify_content=True)
+    print(f'Rows: {num_rows} ({os.path.getsize(path) / 2**20:.1f} MiB)')
+    for storage in (gaggle.DeckStorage.ROWS, gaggle.DeckStorage.COLUMNAR):
+      no_cache_seconds = best_time(
+          lambda: gaggle.AnkiDeck.from_file(path, storage=storage))
+      miss_seconds = best_time(
+          lambda: gaggle.AnkiDeck.from_file(
+              path, storage=storage, cache=deck_cache),
+          setup=deck_cache.clear)
+      hit_seconds = best_time(lambda: gaggle.AnkiDeck.from_file(
+          path, storage=storage, cache=deck_cache))
+      gaggle.AnkiDeck.from_file(path, cache=verified_cache)
+      verified_hit_seconds = best_time(lambda: gaggle.AnkiDeck.from_file(
+          path, storage=storage, cache=verified_cache))
+      print(f'{storage}: no cache {no_cache_seconds:.3f} s, '
+            f'miss {miss_seconds:.3f} s, hit {hit_seconds:.3f} s, '
+            f'verified hit {verified_hit_seconds:.3f} s')
+
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,92 @@
+# Copyright 2023 The Gaggle Authors. All Rights Reserved.
+#
+# This file is part of Gaggle.
+#
+# Gaggle is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Gaggle is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Gaggle. If not, see <https://www.gnu.org/licenses/>.
+"""Measures AnkiDeck.from_file() through a text stream and through mmap.
+
+The mapped reader keeps unquoted rows encoded until a value is used, see
+gaggle.EncodedAnkiCard. Reports the time to parse, the time to then read one
+field of every card, which decodes every row, and the memory held by the
+parsed cards. Every nth row holds a quoted field with a newline, which is
+decoded while parsing.
+
+Usage: python dev/benchmark_memory_map.py [number of rows] [n, 0 for none]
+"""
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from gaggle import gaggle
+
+NUM_FIELDS = 7
+HEADER_LINES = '#separator:tab\n#html:false\n#guid column:1\n#tags column:7\n'
+
+
+def write_export(path, num_rows, quote_every):
+  with open(path, 'w', encoding='utf-8', newline='') as f:
+    f.write(HEADER_LINES)
+    for row_idx in range(num_rows):
+      fields = [f'row{row_idx}_field{idx}' for idx in range(NUM_FIELDS)]
+      if quote_every and not row_idx % quote_every:
+        fields[3] = f'"quoted\nrow{row_idx}"'
+      f.write('\t'.join(fields) + '\n')
+
+
+def measure(path, memory_map, repeat=3):
+  """Returns the fastest parse, the fastest read of the GUID of every card
+  after that parse, and the bytes allocated by one parse."""
+  parse_timings = []
+  read_timings = []
+  for _ in range(repeat):
+    gc.collect()
+    start = time.perf_counter()
+    deck = gaggle.AnkiDeck.from_file(path, memory_map=memory_map)
+    parse_timings.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    for card in deck:
+      _ = card.guid
+    read_timings.append(time.perf_counter() - start)
+    del deck
+  gc.collect()
+  tracemalloc.start()
+  deck = gaggle.AnkiDeck.from_file(path, memory_map=memory_map)
+  allocated, _ = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return min(parse_timings), min(read_timings), allocated
+
+
+def main(num_rows, quote_every):
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'export.txt')
+    write_export(path, num_rows, quote_every)
+    size = os.path.getsize(path)
+    results = {
+        'text stream': measure(path, memory_map=False),
+        'memory_map': measure(path, memory_map=True),
+    }
+  quoted = f'every {quote_every} rows' if quote_every else 'none'
+  print(f'Rows parsed: {num_rows} ({size / 2**20:.1f} MiB), quoted: {quoted}')
+  for name, (parse_seconds, read_seconds, allocated) in results.items():
+    print(f'{name:>12}: parse {parse_seconds:.3f} s, then read every GUID '
+          f'{read_seconds:.3f} s, {allocated / 2**20:.1f} MiB held')
+
+
+if __name__ == '__main__':
+  main(
+      int(sys.argv[1]) if len(sys.argv) > 1 else 200_000,
+      int(sys.argv[2]) if len(sys.argv) > 2 else 5,
+  )
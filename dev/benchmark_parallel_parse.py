@@ -0,0 +1,83 @@
+# Copyright 2023 The Gaggle Authors. All Rights Reserved.
+#
+# This file is part of Gaggle.
+#
+# Gaggle is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Gaggle is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Gaggle. If not, see <https://www.gnu.org/licenses/>.
+"""Measures parsing an Anki export with AnkiDeck.from_file(workers=...).
+
+Reports the time to parse the whole file sequentially and with workers. Both
+parses map the file, as workers implies memory_map. Every fifth row holds a
+quoted field, so that csv.reader() runs in the workers. Workers only pay off
+when the machine has as many free CPUs; with fewer, the processes share them and
+the parallel parse is slower by the cost of starting them and pickling rows.
+
+Usage: python dev/benchmark_parallel_parse.py [number of rows] [workers]
+"""
+import gc
+import os
+import sys
+import tempfile
+import time
+
+from gaggle import gaggle
+
+NUM_FIELDS = 7
+HEADER_LINES = '#separator:tab\n#html:false\n#guid column:1\n#tags column:7\n'
+
+
+def write_export(path, num_rows):
+  with open(path, 'w', encoding='utf-8', newline='') as f:
+    f.write(HEADER_LINES)
+    for row_idx in range(num_rows):
+      fields = [f'row{row_idx}_field{idx}' for idx in range(NUM_FIELDS)]
+      if not row_idx % 5:
+        fields[3] = f'"quoted\nrow{row_idx}"'
+      f.write('\t'.join(fields) + '\n')
+
+
+def time_call(function, *args):
+  start = time.perf_counter()
+  result = function(*args)
+  return time.perf_counter() - start, result
+
+
+def best_time(function, *args, repeat=3):
+  """Returns the fastest of repeat calls, each from a collected heap."""
+  timings = []
+  for _ in range(repeat):
+    gc.collect()
+    seconds, _ = time_call(function, *args)
+    timings.append(seconds)
+  return min(timings)
+
+
+def main(num_rows, workers):
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'export.txt')
+    write_export(path, num_rows)
+    sequential_seconds = best_time(
+        lambda: gaggle.AnkiDeck.from_file(path, memory_map=True))
+    parallel_seconds = best_time(
+        lambda: gaggle.AnkiDeck.from_file(path, workers=workers))
+    size = os.path.getsize(path)
+  print(f'Rows parsed: {num_rows} ({size / 2**20:.1f} MiB, '
+        f'{os.cpu_count()} CPUs)')
+  print(f'from_file(memory_map=True): {sequential_seconds:.3f} s')
+  print(f'from_file(workers={workers}):      {parallel_seconds:.3f} s')
+
+
+if __name__ == '__main__':
+  main(
+      int(sys.argv[1]) if len(sys.argv) > 1 else 200_000,
+      int(sys.argv[2]) if len(sys.argv) > 2 else 4,
+  )
@@ -0,0 +1,540 @@
+# Copyright 2023 The Gaggle Authors. All Rights Reserved.
+#
+# This file is part of Gaggle.
+#
+# Gaggle is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Gaggle is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Gaggle. If not, see <https://www.gnu.org/licenses/>.
+"""Reading and writing of Anki packages (.apkg) and collections (.anki2)
+without a text export. Notes are read directly from the SQLite collection and
+returned as rows in the layout of a "Notes in Plain Text" export. Rows in that
+layout are written back as a legacy (schema 11) package, importable by every
+Anki version."""
+from __future__ import annotations
+
+import hashlib
+import html
+import itertools
+import json
+import os
+import re
+import secrets
+import shutil
+import sqlite3
+import tempfile
+import time
+import zipfile
+from typing import Any, IO, TYPE_CHECKING
+from collections.abc import Iterable, Iterator, Sequence
+
+if TYPE_CHECKING:
+  from types import TracebackType
+  from _typeshed import StrOrBytesPath
+
+# Newer Anki versions write both; collection.anki2 then holds a placeholder note
+_LEGACY_COLLECTION_MEMBER_NAME = 'collection.anki21'
+_COLLECTION_MEMBER_NAMES = (_LEGACY_COLLECTION_MEMBER_NAME, 'collection.anki2')
+_COMPRESSED_COLLECTION_MEMBER_NAME = 'collection.anki21b'
+_FIELD_SEPARATOR = '\x1f'
+# Schema 18 collections separate deck name components with the field separator
+_DECK_NAME_SEPARATOR = '::'
+_BATCH_SIZE = 1000
+# Columns of a row, before the fields of the note
+_GUID_COLUMN = 1
+_NOTE_TYPE_COLUMN = 2
+_DECK_COLUMN = 3
+_NUM_LEADING_COLUMNS = 3
+
+_PACKAGE_COLLECTION_MEMBER_NAME = 'collection.anki2'
+_PACKAGE_MEDIA_MEMBER_NAME = 'media'
+_LEGACY_SCHEMA_VERSION = 11
+_DEFAULT_DECK_ID = 1
+_DEFAULT_DECK_NAME = 'Default'
+_DEFAULT_DECK_CONFIG_ID = 1
+_DEFAULT_NOTE_TYPE_NAME = 'Basic'
+_GUID_CHARACTERS = ('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+                    '0123456789!#$%&()*+,-./:;<=>?@[]^_`{|}~')
+_HTML_TAG_PATTERN = re.compile(r'<[^>]*>')
+# Unpopulated usn, marking changes which have not been synced
+_UNSYNCED = -1
+# Note types and decks are matched by id when a package is imported, so their
+# ids are drawn at random, each from its own range, rather than from the time
+_NOTE_TYPE_ID_RANGE = (2**30, 2**31)
+_DECK_ID_RANGE = (2**31, 2**32)
+
+_LEGACY_SCHEMA = """
+CREATE TABLE col (
+  id integer PRIMARY KEY, crt integer NOT NULL, mod integer NOT NULL,
+  scm integer NOT NULL, ver integer NOT NULL, dty integer NOT NULL,
+  usn integer NOT NULL, ls integer NOT NULL, conf text NOT NULL,
+  models text NOT NULL, decks text NOT NULL, dconf text NOT NULL,
+  tags text NOT NULL);
+CREATE TABLE notes (
+  id integer PRIMARY KEY, guid text NOT NULL, mid integer NOT NULL,
+  mod integer NOT NULL, usn integer NOT NULL, tags text NOT NULL,
+  flds text NOT NULL, sfld integer NOT NULL, csum integer NOT NULL,
+  flags integer NOT NULL, data text NOT NULL);
+CREATE TABLE cards (
+  id integer PRIMARY KEY, nid integer NOT NULL, did integer NOT NULL,
+  ord integer NOT NULL, mod integer NOT NULL, usn integer NOT NULL,
+  type integer NOT NULL, queue integer NOT NULL, due integer NOT NULL,
+  ivl integer NOT NULL, factor integer NOT NULL, reps integer NOT NULL,
+  lapses integer NOT NULL, left integer NOT NULL, odue integer NOT NULL,
+  odid integer NOT NULL, flags integer NOT NULL, data text NOT NULL);
+CREATE TABLE revlog (
+  id integer PRIMARY KEY, cid integer NOT NULL, usn integer NOT NULL,
+  ease integer NOT NULL, ivl integer NOT NULL, lastIvl integer NOT NULL,
+  factor integer NOT NULL, time integer NOT NULL, type integer NOT NULL);
+CREATE TABLE graves (
+  usn integer NOT NULL, oid integer NOT NULL, type integer NOT NULL);
+CREATE INDEX ix_notes_usn ON notes (usn);
+CREATE INDEX ix_cards_usn ON cards (usn);
+CREATE INDEX ix_revlog_usn ON revlog (usn);
+CREATE INDEX ix_cards_nid ON cards (nid);
+CREATE INDEX ix_cards_sched ON cards (did, queue, due);
+CREATE INDEX ix_revlog_cid ON revlog (cid);
+CREATE INDEX ix_notes_csum ON notes (csum);
+"""
+
+
+class AnkiPackage:
+  """An open Anki collection, either packaged in an .apkg file or a bare
+  .anki2 collection file. Packages are extracted to a temporary directory,
+  which is removed on close().
+
+  Only collections readable by the stdlib are supported: legacy collections
+  (collection.anki2 and collection.anki21) and uncompressed schema 18
+  collections. Packages holding a zstd compressed collection.anki21b, with or
+  without a placeholder collection.anki2 beside it, must be re-exported with
+  "Support older Anki versions" enabled.
+
+  Attributes:
+    connection: The connection to the collection database.
+    note_types: A mapping of note type id to its name and number of fields.
+    deck_names: A mapping of deck id to the full name of the deck, with
+    subdecks separated by '::'.
+  """
+
+  def __init__(self, file: StrOrBytesPath):
+    """
+    Args:
+      file: The path of an .apkg package or .anki2 collection.
+
+    Raises:
+      FileNotFoundError: If file does not exist
+      ValueError: If the package does not contain a supported collection
+      sqlite3.DatabaseError: If the collection is not a valid Anki collection
+    """
+    self._temporary_directory: str | None = None
+    if zipfile.is_zipfile(file):
+      collection_path = self._extract_collection(file)
+    elif os.path.isfile(file):
+      collection_path = os.fsdecode(file)
+    else:
+      raise FileNotFoundError(f'No such file: {os.fsdecode(file)!r}')
+    self.connection = sqlite3.connect(collection_path)
+    try:
+      self.note_types, self.deck_names = self._read_collection_metadata()
+    except BaseException:
+      self.close()
+      raise
+
+  def _extract_collection(self, file: StrOrBytesPath) -> str:
+    with zipfile.ZipFile(os.fsdecode(file)) as package:
+      member_names = set(package.namelist())
+      # A compressed collection is the real one; collection.anki2 beside it
+      # only holds a placeholder note
+      if (_COMPRESSED_COLLECTION_MEMBER_NAME in member_names and
+          _LEGACY_COLLECTION_MEMBER_NAME not in member_names):
+        raise ValueError(
+            f'Expected an uncompressed collection but {os.fsdecode(file)} '
+            f'contains {_COMPRESSED_COLLECTION_MEMBER_NAME}. Export the '
+            f'package with "Support older Anki versions" enabled.')
+      for member_name in _COLLECTION_MEMBER_NAMES:
+        if member_name in member_names:
+          break
+      else:
+        raise ValueError(
+            f'Expected one of {_COLLECTION_MEMBER_NAMES} in package but '
+            f'instead got {sorted(member_names)}')
+      self._temporary_directory = tempfile.mkdtemp()
+      collection_path = os.path.join(self._temporary_directory, member_name)
+      with package.open(member_name) as source, open(collection_path,
+                                                     'wb') as destination:
+        shutil.copyfileobj(source, destination)
+    return collection_path
+
+  def _has_table(self, table_name: str) -> bool:
+    row = self.connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (table_name,)).fetchone()
+    return row is not None
+
+  def _read_collection_metadata(
+      self) -> tuple[dict[int, tuple[str, int]], dict[int, str]]:
+    if self._has_table('notetypes'):
+      field_counts = dict(
+          self.connection.execute(
+              'SELECT ntid, count(*) FROM fields GROUP BY ntid'))
+      note_types = {
+          note_type_id: (name, field_counts.get(note_type_id, 0))
+          for note_type_id, name in self.connection.execute(
+              'SELECT id, name FROM notetypes')
+      }
+      deck_names = {
+          deck_id: name.replace(_FIELD_SEPARATOR, _DECK_NAME_SEPARATOR) for
+          deck_id, name in self.connection.execute('SELECT id, name FROM decks')
+      }
+      return note_types, deck_names
+    models_json, decks_json = self.connection.execute(
+        'SELECT models, decks FROM col').fetchone()
+    models: dict[str, dict[str, Any]] = json.loads(models_json)
+    decks: dict[str, dict[str, Any]] = json.loads(decks_json)
+    note_types = {
+        int(model_id): (model['name'], len(model['flds']))
+        for model_id, model in models.items()
+    }
+    deck_names = {int(deck_id): deck['name'] for deck_id, deck in decks.items()}
+    return note_types, deck_names
+
+  def num_fields(self) -> int:
+    """Returns the greatest number of fields of any note type with at least
+    one note. Rows are padded to this width so that tags share a column."""
+    note_type_ids = [
+        note_type_id for note_type_id, in self.connection.execute(
+            'SELECT DISTINCT mid FROM notes')
+    ]
+    return max((self.note_types[note_type_id][1]
+                for note_type_id in note_type_ids
+                if note_type_id in self.note_types),
+               default=0)
+
+  def header(self) -> dict[str, str | int]:
+    """Returns the header settings of a "Notes in Plain Text" export of the
+    collection, in Anki format. See gaggle.read_header_settings()."""
+    return {
+        'separator': 'tab',
+        'html': 'true',
+        'guid column': _GUID_COLUMN,
+        'notetype column': _NOTE_TYPE_COLUMN,
+        'deck column': _DECK_COLUMN,
+        'tags column': _NUM_LEADING_COLUMNS + self.num_fields() + 1,
+    }
+
+  def iterate_records(self,
+                      batch_size: int = _BATCH_SIZE) -> Iterator[list[str]]:
+    """Reads every note of the collection, in creation order, fetching
+    batch_size notes per query.
+
+    The deck of a note is the deck of its first card, as in Anki's own export.
+    Fields are padded with empty strings up to num_fields().
+
+    Args:
+      batch_size: The number of notes fetched at once.
+
+    Yields:
+      The GUID, Note Type, Deck, fields, and Tags of each note.
+    """
+    num_fields = self.num_fields()
+    cursor = self.connection.execute(
+        'SELECT notes.guid, notes.mid, '
+        '(SELECT did FROM cards WHERE cards.nid = notes.id '
+        'ORDER BY cards.ord LIMIT 1), notes.flds, notes.tags '
+        'FROM notes ORDER BY notes.id')
+    try:
+      while rows := cursor.fetchmany(batch_size):
+        for guid, note_type_id, deck_id, fields, tags in rows:
+          note_type_name = self.note_types.get(note_type_id, ('', 0))[0]
+          deck_name = self.deck_names.get(deck_id, '')
+          fields = fields.split(_FIELD_SEPARATOR)
+          fields.extend([''] * (num_fields - len(fields)))
+          yield [guid, note_type_name, deck_name, *fields, tags.strip()]
+    finally:
+      cursor.close()
+
+  def close(self) -> None:
+    """Closes the collection and removes any extracted files."""
+    self.connection.close()
+    if self._temporary_directory is not None:
+      shutil.rmtree(self._temporary_directory, ignore_errors=True)
+      self._temporary_directory = None
+
+  def __enter__(self) -> AnkiPackage:
+    return self
+
+  def __exit__(self, exc_type: type[BaseException] | None,
+               exc_value: BaseException | None,
+               traceback: TracebackType | None) -> None:
+    self.close()
+
+
+def _strip_html(text: str) -> str:
+  return html.unescape(_HTML_TAG_PATTERN.sub('', text))
+
+
+def _field_checksum(text: str) -> int:
+  """The checksum Anki stores for duplicate detection: the first 8 hex digits
+  of the SHA-1 of the first field, without HTML."""
+  digest = hashlib.sha1(_strip_html(text).encode('utf-8')).hexdigest()
+  return int(digest[:8], 16)
+
+
+def _generate_guid() -> str:
+  return ''.join(secrets.choice(_GUID_CHARACTERS) for _ in range(10))
+
+
+def _random_id_base(id_range: tuple[int, int]) -> int:
+  """Draws the first of consecutive ids from the lower half of id_range, so
+  that the ids counted up from it stay within id_range."""
+  low, high = id_range
+  return low + secrets.randbelow((high - low) // 2)
+
+
+def _note_type_json(note_type_id: int, name: str, field_names: Sequence[str],
+                    modified: int) -> dict[str, Any]:
+  """A standard note type with one card template. The template shows the first
+  field on the front and the remaining fields on the back."""
+  fields: list[dict[str, Any]] = [{
+      'name': field_name,
+      'ord': idx,
+      'sticky': False,
+      'rtl': False,
+      'font': 'Arial',
+      'size': 20,
+      'media': [],
+  } for idx, field_name in enumerate(field_names)]
+  front = f'{{{{{field_names[0]}}}}}' if field_names else ''
+  back = '<br>'.join(f'{{{{{field_name}}}}}' for field_name in field_names[1:])
+  template = {
+      'name': 'Card 1',
+      'ord': 0,
+      'qfmt': front,
+      'afmt': f'{{{{FrontSide}}}}<hr id=answer>{back}',
+      'bqfmt': '',
+      'bafmt': '',
+      'did': None,
+      'bfont': '',
+      'bsize': 0,
+  }
+  return {
+      'id': note_type_id,
+      'name': name,
+      'type': 0,
+      'mod': modified,
+      'usn': _UNSYNCED,
+      'sortf': 0,
+      'did': _DEFAULT_DECK_ID,
+      'tmpls': [template],
+      'flds': fields,
+      'css': '.card { font-family: arial; font-size: 20px; }',
+      'latexPre': '',
+      'latexPost': '',
+      'latexsvg': False,
+      'tags': [],
+      'vers': [],
+      'req': [[0, 'any', [0]]],
+  }
+
+
+def _deck_json(deck_id: int, name: str, modified: int) -> dict[str, Any]:
+  return {
+      'id': deck_id,
+      'name': name,
+      'mod': modified,
+      'usn': _UNSYNCED,
+      'lrnToday': [0, 0],
+      'revToday': [0, 0],
+      'newToday': [0, 0],
+      'timeToday': [0, 0],
+      'collapsed': False,
+      'browserCollapsed': False,
+      'desc': '',
+      'dyn': 0,
+      'conf': _DEFAULT_DECK_CONFIG_ID,
+      'extendNew': 0,
+      'extendRev': 0,
+  }
+
+
+def _deck_config_json(modified: int) -> dict[str, Any]:
+  return {
+      'id': _DEFAULT_DECK_CONFIG_ID,
+      'name': 'Default',
+      'mod': modified,
+      'usn': _UNSYNCED,
+      'maxTaken': 60,
+      'autoplay': True,
+      'timer': 0,
+      'replayq': True,
+      'dyn': False,
+      'new': {
+          'bury': False,
+          'delays': [1, 10],
+          'initialFactor': 2500,
+          'ints': [1, 4, 0],
+          'order': 1,
+          'perDay': 20,
+      },
+      'lapse': {
+          'delays': [10],
+          'leechAction': 1,
+          'leechFails': 8,
+          'minInt': 1,
+          'mult': 0,
+      },
+      'rev': {
+          'perDay': 200,
+          'ease4': 1.3,
+          'maxIvl': 36500,
+          'hardFactor': 1.2,
+          'bury': False,
+      },
+  }
+
+
+class _PackageBuilder:
+  """Assigns note type and deck ids while the notes of a package are
+  generated. See _NOTE_TYPE_ID_RANGE and _DECK_ID_RANGE."""
+
+  def __init__(self, field_names: Sequence[str], modified: int):
+    self.field_names = field_names
+    self.modified = modified
+    self.note_type_ids: dict[str, int] = {}
+    self.deck_ids: dict[str, int] = {_DEFAULT_DECK_NAME: _DEFAULT_DECK_ID}
+    self._next_note_type_id = itertools.count(
+        _random_id_base(_NOTE_TYPE_ID_RANGE))
+    self._next_deck_id = itertools.count(_random_id_base(_DECK_ID_RANGE))
+
+  def note_type_id(self, name: str) -> int:
+    note_type_id = self.note_type_ids.get(name)
+    if note_type_id is None:
+      note_type_id = self.note_type_ids[name] = next(self._next_note_type_id)
+    return note_type_id
+
+  def deck_id(self, name: str) -> int:
+    deck_id = self.deck_ids.get(name)
+    if deck_id is None:
+      # Parent decks must exist for a subdeck to be shown in Anki
+      parent, separator, _ = name.rpartition(_DECK_NAME_SEPARATOR)
+      if separator:
+        self.deck_id(parent)
+      deck_id = self.deck_ids[name] = next(self._next_deck_id)
+    return deck_id
+
+  def collection_row(self) -> tuple[Any, ...]:
+    note_types = {
+        str(note_type_id):
+            _note_type_json(note_type_id, name, self.field_names, self.modified)
+        for name, note_type_id in self.note_type_ids.items()
+    }
+    decks = {
+        str(deck_id): _deck_json(deck_id, name, self.modified)
+        for name, deck_id in self.deck_ids.items()
+    }
+    deck_configs = {
+        str(_DEFAULT_DECK_CONFIG_ID): _deck_config_json(self.modified)
+    }
+    config = {
+        'curDeck': _DEFAULT_DECK_ID,
+        'curModel': next(iter(self.note_type_ids.values()), None),
+        'nextPos': 1,
+    }
+    return (1, self.modified, self.modified * 1000,
+            self.modified * 1000, _LEGACY_SCHEMA_VERSION, 0, 0, 0,
+            json.dumps(config), json.dumps(note_types), json.dumps(decks),
+            json.dumps(deck_configs), '{}')
+
+
+def write_package(
+    file: StrOrBytesPath | IO[bytes],
+    field_names: Sequence[str],
+    records: Iterable[Sequence[str]],
+    guid_idx: int | None = None,
+    note_type_idx: int | None = None,
+    deck_idx: int | None = None,
+    tags_idx: int | None = None,
+) -> None:
+  """Writes rows in the layout of a "Notes in Plain Text" export as an Anki
+  package.
+
+  The collection is built in memory: notes and cards are inserted with
+  executemany() inside a single transaction, and the serialized database is
+  written straight into the zip archive. Each row becomes one note with one
+  card. Every note type uses the non-reserved columns as its fields, in order,
+  and a single template. Notes and their cards share an id, counted up from the
+  current time in milliseconds as Anki's own ids are.
+
+  Args:
+    file: The path or binary stream the package is written to.
+    field_names: The name of each column of records.
+    records: The values of each note, in order.
+    guid_idx: The column holding the GUID. Generated for each note if None.
+    note_type_idx: The column holding the note type name. Every note is of
+    the note type 'Basic' if None.
+    deck_idx: The column holding the deck name. Every card is placed in the
+    deck 'Default' if None.
+    tags_idx: The column holding space separated tags. Notes are untagged if
+    None.
+  """
+  reserved_idxs = {guid_idx, note_type_idx, deck_idx, tags_idx} - {None}
+  field_idxs = [
+      idx for idx in range(len(field_names)) if idx not in reserved_idxs
+  ]
+  modified = int(time.time())
+  builder = _PackageBuilder([field_names[idx] for idx in field_idxs], modified)
+  note_ids = itertools.count(time.time_ns() // 10**6)
+
+  def generate_rows() -> Iterator[tuple[tuple[Any, ...], tuple[Any, ...]]]:
+    for position, record in enumerate(records):
+      note_id = next(note_ids)
+      guid = record[guid_idx] if guid_idx is not None else _generate_guid()
+      note_type_name = (
+          record[note_type_idx]
+          if note_type_idx is not None else _DEFAULT_NOTE_TYPE_NAME)
+      deck_name = (
+          record[deck_idx] if deck_idx is not None else _DEFAULT_DECK_NAME)
+      tags = record[tags_idx].strip() if tags_idx is not None else ''
+      fields = [record[idx] for idx in field_idxs]
+      sort_field = _strip_html(fields[0]) if fields else ''
+      checksum = _field_checksum(fields[0]) if fields else 0
+      note = (note_id, guid,
+              builder.note_type_id(note_type_name or _DEFAULT_NOTE_TYPE_NAME),
+              modified, _UNSYNCED, f' {tags} ' if tags else '',
+              _FIELD_SEPARATOR.join(fields), sort_field, checksum, 0, '')
+      card = (note_id, note_id, builder.deck_id(deck_name or
+                                                _DEFAULT_DECK_NAME), 0,
+              modified, _UNSYNCED, 0, 0, position, 0, 0, 0, 0, 0, 0, 0, 0, '')
+      yield note, card
+
+  connection = sqlite3.connect(':memory:')
+  try:
+    connection.executescript(_LEGACY_SCHEMA)
+    with connection:
+      rows = generate_rows()
+      while batch := list(itertools.islice(rows, _BATCH_SIZE)):
+        connection.executemany(
+            'INSERT INTO notes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [note for note, _ in batch])
+        connection.executemany(
+            'INSERT INTO cards VALUES '
+            '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [card for _, card in batch])
+      connection.execute(
+          'INSERT INTO col VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+          builder.collection_row())
+    collection = connection.serialize()
+  finally:
+    connection.close()
+  if isinstance(file, (str, bytes, os.PathLike)):
+    file = os.fsdecode(file)
+  with zipfile.ZipFile(file, 'w', compression=zipfile.ZIP_DEFLATED) as package:
+    package.writestr(_PACKAGE_COLLECTION_MEMBER_NAME, collection)
+    package.writestr(_PACKAGE_MEDIA_MEMBER_NAME, '{}')
@@ -0,0 +1,300 @@
+# Copyright 2023 The Gaggle Authors. All Rights Reserved.
+#
+# This file is part of Gaggle.
+#
+# Gaggle is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Gaggle is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Gaggle. If not, see <https://www.gnu.org/licenses/>.
+"""On-disk cache of parsed Anki exports, keyed by file identity.
+
+Snapshots are stored with pickle, and loading a snapshot can run arbitrary
+code. Only use a cache directory which no other user can write to; DeckCache
+refuses directories which are not owned by the current user or which are
+writable by group or others.
+"""
+from __future__ import annotations
+
+import array
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+import time
+from typing import Any, TypedDict, TYPE_CHECKING
+from collections.abc import Iterable
+
+if TYPE_CHECKING:
+  from _typeshed import StrOrBytesPath
+
+_CACHE_FILE_EXT = '.gaggle'
+_HASH_BLOCK_SIZE = 2**20
+_DEFAULT_MAX_BYTES = 2**30
+# Part of every key, so that snapshots of an older layout are never loaded
+_SNAPSHOT_FORMAT_VERSION = 3
+# The number of bytes hashed at each end of a file by every key()
+_PARTIAL_HASH_BYTES = 2**16
+# Files modified this recently may change again within the resolution of their
+# modification time, so their content is always hashed
+_RACY_MODIFICATION_NS = 2 * 10**9
+
+
+class DeckSnapshot(TypedDict):
+  """The parsed contents of an Anki export, stored column by column. See
+  gaggle.AnkiDeck.from_file() for how a snapshot is created and restored.
+
+  Each column is the list of its values, one per row. Rows shorter than the
+  widest row are padded with empty values, and their widths are kept in
+  row_widths; row_widths is None if every row has the same width.
+  """
+  header: dict[str, Any]
+  field_names: tuple[str, ...] | None
+  num_rows: int
+  columns: list[list[str]]
+  row_widths: array.array[int] | None
+
+
+def _hash_path(file: StrOrBytesPath) -> str:
+  path = os.fsencode(os.path.abspath(os.fsdecode(file)))
+  return hashlib.blake2b(path, digest_size=16).hexdigest()
+
+
+def hash_file_content(file: StrOrBytesPath,
+                      block_size: int = _HASH_BLOCK_SIZE) -> bytes:
+  """Hashes the content of a file with blake2b, reading it in blocks.
+
+  Args:
+    file: The file to hash.
+    block_size: The number of bytes read at once.
+
+  Returns:
+    The digest of the content of file.
+  """
+  content_hash = hashlib.blake2b(digest_size=32)
+  with open(file, 'rb') as f:
+    while block := f.read(block_size):
+      content_hash.update(block)
+  return content_hash.digest()
+
+
+def hash_file_ends(file: StrOrBytesPath,
+                   num_bytes: int = _PARTIAL_HASH_BYTES) -> bytes:
+  """Hashes the first and last num_bytes of a file with blake2b. Files of at
+  most twice num_bytes are hashed whole.
+
+  Args:
+    file: The file to hash.
+    num_bytes: The number of bytes read at each end of file.
+
+  Returns:
+    The digest of both ends of file.
+  """
+  ends_hash = hashlib.blake2b(digest_size=32)
+  with open(file, 'rb') as f:
+    head = f.read(num_bytes)
+    ends_hash.update(head)
+    if len(head) == num_bytes:
+      f.seek(max(f.tell(), os.fstat(f.fileno()).st_size - num_bytes))
+      ends_hash.update(f.read(num_bytes))
+  return ends_hash.digest()
+
+
+def _check_private_directory(directory: str) -> None:
+  """Raises PermissionError if another user could write snapshots into
+  directory. Skipped on platforms without POSIX user ids."""
+  if not hasattr(os, 'getuid'):
+    return
+  directory_stat = os.stat(directory)
+  if directory_stat.st_uid != os.getuid():
+    raise PermissionError(f'Expected a cache directory owned by the current '
+                          f'user but {directory!r} is owned by user '
+                          f'{directory_stat.st_uid}')
+  if directory_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+    raise PermissionError(f'Expected a cache directory writable only by its '
+                          f'owner but {directory!r} has mode '
+                          f'{stat.filemode(directory_stat.st_mode)}')
+
+
+class DeckCache:
+  """Stores parsed decks as binary snapshots in a directory. Snapshots are
+  keyed by the path, size, modification time, and the content of both ends of
+  the parsed file, together with any options which change the parsed result.
+  A snapshot therefore becomes unreachable as soon as its file changes, unless
+  the change keeps the size and modification time and only touches the middle
+  of a large file. With verify_content, the hash of the whole content is part
+  of the key instead.
+
+  The directory is kept below max_bytes by evicting the least recently used
+  snapshots whenever a snapshot is stored.
+
+  Snapshots are loaded with pickle.load(), which runs arbitrary code from a
+  crafted snapshot. The directory must therefore not be writable by other
+  users; see _check_private_directory().
+
+  Attributes:
+    directory: The directory holding the snapshots. Created if missing.
+    max_bytes: The maximum combined size of all snapshots.
+    verify_content: Whether keys include the content hash of the file.
+  """
+
+  def __init__(self,
+               directory: StrOrBytesPath,
+               max_bytes: int = _DEFAULT_MAX_BYTES,
+               verify_content: bool = False):
+    """
+    Args:
+      directory: The directory holding the snapshots. Created, readable and
+      writable only by the current user, if missing.
+      max_bytes: The maximum combined size of all snapshots.
+      verify_content: If True, every key() reads the whole file to hash its
+      content, so that a file rewritten in the middle with the same size and
+      modification time is not mistaken for the original. Otherwise, only the
+      first and last 64 KiB are hashed, except for files modified within the
+      last two seconds, which are always hashed whole.
+
+    Raises:
+      ValueError: If max_bytes is negative
+      PermissionError: If directory is not owned by the current user, or is
+      writable by group or others
+    """
+    if max_bytes < 0:
+      raise ValueError(f'Expected a non-negative max_bytes but instead got '
+                       f'{max_bytes}')
+    self.directory = os.fsdecode(directory)
+    self.max_bytes = max_bytes
+    self.verify_content = verify_content
+    os.makedirs(self.directory, mode=0o700, exist_ok=True)
+    _check_private_directory(self.directory)
+
+  def key(self, file: StrOrBytesPath, options: Iterable[Any] = ()) -> str:
+    """Computes the cache key of a file from its path, size, modification
+    time, and a hash of the content at both ends of the file. The whole content
+    is hashed instead if verify_content is set, or if the file was modified so
+    recently that a further change could keep the same modification time.
+
+    Args:
+      file: The file which is parsed.
+      options: Values which change the result of parsing file, such as field
+      names. Must have a stable repr().
+
+    Returns:
+      A key for use with DeckCache.load() and DeckCache.store(). Keys of the
+      same path share a common prefix, see DeckCache.invalidate().
+
+    Raises:
+      FileNotFoundError: If file does not exist
+    """
+    file_stat = os.stat(file)
+    identity = hashlib.blake2b(digest_size=16)
+    identity.update(f'{_SNAPSHOT_FORMAT_VERSION}:{file_stat.st_size}:'
+                    f'{file_stat.st_mtime_ns}:'.encode())
+    if (self.verify_content or
+        time.time_ns() - file_stat.st_mtime_ns < _RACY_MODIFICATION_NS):
+      identity.update(hash_file_content(file))
+    else:
+      identity.update(hash_file_ends(file))
+    identity.update(repr(tuple(options)).encode())
+    return f'{_hash_path(file)}-{identity.hexdigest()}'
+
+  def _entry_path(self, key: str) -> str:
+    return os.path.join(self.directory, f'{key}{_CACHE_FILE_EXT}')
+
+  def _entries(self) -> list[os.DirEntry[str]]:
+    with os.scandir(self.directory) as entries:
+      return [
+          entry for entry in entries
+          if entry.name.endswith(_CACHE_FILE_EXT) and entry.is_file()
+      ]
+
+  def load(self, key: str) -> DeckSnapshot | None:
+    """Returns the snapshot stored under key and marks it as recently used.
+
+    Args:
+      key: A key returned by DeckCache.key().
+
+    Returns:
+      The stored snapshot, or None if there is no snapshot for key or it cannot
+      be read.
+    """
+    entry_path = self._entry_path(key)
+    try:
+      with open(entry_path, 'rb') as f:
+        snapshot: DeckSnapshot = pickle.load(f)
+      os.utime(entry_path)
+    except FileNotFoundError:
+      return None
+    except (OSError, EOFError, pickle.UnpicklingError):
+      self._remove(entry_path)
+      return None
+    return snapshot
+
+  def store(self, key: str, snapshot: DeckSnapshot) -> None:
+    """Writes a snapshot under key, replacing any existing snapshot. Then
+    evicts least recently used snapshots until the cache fits in max_bytes.
+
+    The snapshot is written to a temporary file first, so a partially written
+    snapshot is never loaded.
+
+    Args:
+      key: A key returned by DeckCache.key().
+      snapshot: The parsed contents of the file identified by key.
+    """
+    file_descriptor, temporary_path = tempfile.mkstemp(
+        dir=self.directory, suffix='.tmp')
+    try:
+      with os.fdopen(file_descriptor, 'wb') as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+      os.replace(temporary_path, self._entry_path(key))
+    except BaseException:
+      self._remove(temporary_path)
+      raise
+    self.evict()
+
+  def evict(self) -> None:
+    """Removes least recently used snapshots until the combined size of all
+    snapshots is at most max_bytes."""
+    entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+    total_size = sum(entry.stat().st_size for entry in entries)
+    for entry in entries:
+      if total_size <= self.max_bytes:
+        break
+      self._remove(entry.path)
+      total_size -= entry.stat().st_size
+
+  def invalidate(self, file: StrOrBytesPath) -> int:
+    """Removes every snapshot of a file, regardless of its content or the
+    options used to parse it.
+
+    Args:
+      file: The path of the parsed file. The file need not exist.
+
+    Returns:
+      The number of snapshots removed.
+    """
+    prefix = f'{_hash_path(file)}-'
+    removed = 0
+    for entry in self._entries():
+      if entry.name.startswith(prefix):
+        self._remove(entry.path)
+        removed += 1
+    return removed
+
+  def clear(self) -> None:
+    """Removes every snapshot."""
+    for entry in self._entries():
+      self._remove(entry.path)
+
+  @staticmethod
+  def _remove(path: str) -> None:
+    try:
+      os.remove(path)
+    except FileNotFoundError:
+      pass
@@ -0,0 +1,73 @@
+# Copyright 2023 The Gaggle Authors. All Rights Reserved.
+#
+# This file is part of Gaggle.
+#
+# Gaggle is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Gaggle is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Gaggle. If not, see <https://www.gnu.org/licenses/>.
+"""Stable content fingerprints of cards and decks, for detecting changes
+without comparing field values."""
+from __future__ import annotations
+
+import hashlib
+from collections.abc import Iterable
+
+FINGERPRINT_SIZE = 16
+_LEAF_PREFIX = b'\x00'
+_NODE_PREFIX = b'\x01'
+
+
+def fingerprint_values(values: Iterable[str]) -> bytes:
+  """Hashes a sequence of strings with blake2b. Each value is prefixed with
+  its encoded length, so moving characters between neighbouring values changes
+  the fingerprint.
+
+  Args:
+    values: The strings to hash, in order.
+
+  Returns:
+    A digest of FINGERPRINT_SIZE bytes, stable across processes and Python
+    versions.
+  """
+  fingerprint = hashlib.blake2b(_LEAF_PREFIX, digest_size=FINGERPRINT_SIZE)
+  for value in values:
+    encoded = value.encode('utf-8', 'surrogatepass')
+    fingerprint.update(len(encoded).to_bytes(8, 'little'))
+    fingerprint.update(encoded)
+  return fingerprint.digest()
+
+
+def merkle_root(fingerprints: Iterable[bytes]) -> bytes:
+  """Combines fingerprints pairwise into the root of a Merkle tree. A level
+  with an odd number of nodes promotes its last node unchanged. Leaves and
+  inner nodes are hashed with different prefixes, so an inner node cannot
+  collide with the fingerprint of a card.
+
+  Args:
+    fingerprints: Digests returned by fingerprint_values(), in order.
+
+  Returns:
+    A digest of fingerprints. The root of no fingerprints is the fingerprint of
+    no values.
+  """
+  level = list(fingerprints)
+  if not level:
+    return fingerprint_values(())
+  while len(level) > 1:
+    next_level = [
+        hashlib.blake2b(
+            _NODE_PREFIX + left + right, digest_size=FINGERPRINT_SIZE).digest()
+        for left, right in zip(level[::2], level[1::2])
+    ]
+    if len(level) % 2:
+      next_level.append(level[-1])
+    level = next_level
+  return level[0]
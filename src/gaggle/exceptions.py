@@ -15,7 +15,7 @@
 # Gaggle. If not, see <https://www.gnu.org/licenses/>.
 """Definition of Gaggle exceptions. For internal use."""
 import itertools
-from collections.abc import Iterable, Iterator
+from collections.abc import Iterable, Iterator, Mapping
 from typing import Any, Self
 
 
@@ -37,6 +37,43 @@ class DecksNotWrittenException(Exception):
             f'Index {self.last_deck_written}')
 
 
+class DecksNotLoadedException(Exception):
+  """Gaggle exception for failure to load one or more Decks from file. The
+  remaining Decks were loaded successfully."""
+
+  def __init__(self, failures: Mapping[Any, BaseException]):
+    """
+    Args:
+      failures: A mapping of each file which failed to load to the exception
+      raised while loading it.
+    """
+    self.failures = dict(failures)
+
+  def __str__(self) -> str:
+    failed_files = ', '.join(str(file) for file in self.failures)
+    return (f'Failed to load {len(self.failures)} Decks from file. '
+            f'Files which failed to load: {failed_files}')
+
+
+class CardsNotTransformedException(Exception):
+  """Gaggle exception for failure to transform one or more chunks of cards.
+  The remaining chunks were transformed successfully."""
+
+  def __init__(self, failures: Mapping[range, BaseException]):
+    """
+    Args:
+      failures: A mapping of the card positions of each chunk which failed to
+      transform to the exception raised while transforming it.
+    """
+    self.failures = dict(failures)
+
+  def __str__(self) -> str:
+    failed_chunks = ', '.join(
+        f'{chunk.start}-{chunk.stop - 1}' for chunk in self.failures)
+    return (f'Failed to transform {len(self.failures)} chunks of cards. '
+            f'Cards which failed to transform: {failed_chunks}')
+
+
 class DuplicateWarning(Warning):
   """Gaggle warning when attempting to use a duplicate value when a unique value
   is expected. However, a replacement value can be generated at run time.
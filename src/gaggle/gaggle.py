@@ -18,23 +18,41 @@
 """Base class for collection, a class representing multiple Anki Decks."""
 from __future__ import annotations
 
+import array
+import asyncio
+import bisect
+import bz2
 import collections
+import concurrent.futures
+import contextlib
 import copy
 import csv
 import functools
+import gzip
+import io
+import lzma
+import mmap
 import os.path
+import pickle
+import sqlite3
 import itertools
 import operator
 import enum
+import sys
 import warnings
 from _csv import Dialect
-from typing import overload, Any, ParamSpec, Protocol, Self, SupportsIndex, SupportsInt, TypedDict, TypeVar, TYPE_CHECKING
-from collections.abc import Callable, Iterable, Iterator, Mapping, MutableMapping, Sized
+from typing import cast, overload, Any, BinaryIO, IO, ParamSpec, Protocol, Self, SupportsIndex, SupportsInt, TypedDict, TypeVar, TYPE_CHECKING
+from collections.abc import AsyncIterator, Callable, Generator, Hashable, Iterable, Iterator, Mapping, MutableMapping, Sequence, Sized
 
+from gaggle import apkg
+from gaggle import digest
 from gaggle import exceptions
+from gaggle import index
 
 if TYPE_CHECKING:
-  from _typeshed import ReadableBuffer, SupportsTrunc, SupportsWrite, StrOrBytesPath, SupportsReadline, SupportsRead
+  from gaggle.cache import DeckCache, DeckSnapshot
+  from types import TracebackType
+  from _typeshed import ReadableBuffer, SupportsTrunc, WriteableBuffer, SupportsWrite, StrOrBytesPath, SupportsRead
 
   _T = TypeVar('_T')
   _T_co = TypeVar('_T_co', covariant=True)
@@ -54,12 +72,9 @@ if TYPE_CHECKING:
     def append(self, obj: _T_contra) -> Any:
       ...
 
-  class Seekable(Protocol):
+  class SupportsFileno(Protocol):
 
-    def tell(self) -> int:
-      ...
-
-    def seek(self, __cookie: int, __whence: int = 0) -> int:  # pylint: disable=invalid-name
+    def fileno(self) -> int:
       ...
 
   class SupportsWriteRow(Protocol):
@@ -78,12 +93,20 @@ if TYPE_CHECKING:
                                 Protocol[_T]):
     ...
 
-  class ReadableAndSeekable(SupportsRead[_T_co], SupportsReadline[_T_co],
-                            Seekable, Protocol[_T_co]):
-    ...
-
   CastableToInt = (
       str | ReadableBuffer | SupportsInt | SupportsIndex | SupportsTrunc)
+  ByteBuffer = bytes | mmap.mmap
+  RowPredicate = Callable[[Sequence[str]], bool]
+  # A predicate over raw rows, or a mapping of reserved field name to the
+  # wanted value or a predicate over the value. See _compile_row_filter().
+  RowFilter = RowPredicate | Mapping[str, str | Callable[[str], bool]]
+  MergeKey = str | Callable[['AnkiCard'], Hashable]
+  ConflictResolver = Callable[['AnkiCard', 'AnkiCard'], 'AnkiCard']
+  FieldTransform = Callable[[str], str]
+  # Executor itself takes no max_workers, so the pool classes are listed
+  PoolExecutorClass = (
+      type[concurrent.futures.ProcessPoolExecutor]
+      | type[concurrent.futures.ThreadPoolExecutor])
   # dict() is invariant so value type [str | int] and [str] must be declared
   AnkiHeader = dict[str, str | int] | dict[str, str]
 
@@ -118,7 +141,13 @@ _ANKI_ORDERED_HEADER = [
 ]
 _ANKI_NOTESINPLAINTEXT_EXT = '.txt'
 _ANKI_CARDSINPLAINTEXT_EXT = '.txt'
+_ANKI_PACKAGE_EXT = '.apkg'
 _ANKI_EXPORT_CONTENT_DIALECT = 'excel-tab'
+_GUID_FIELD_NAME = 'GUID'
+_DEFAULT_TRANSFORM_CHUNK_SIZE = 1000
+_DEFAULT_VALIDATION_SAMPLE_SIZE = 5
+# Approximate number of bytes of an export body decoded or split at once
+_MAPPED_BLOCK_SIZE = 2**20
 
 GENERIC_EXPORT_FILE_NAME = 'GaggleFile'
 
@@ -129,6 +158,17 @@ class OpenOptions(TypedDict):
   newline: str
 
 
+class _WriteDeckOptions(TypedDict, total=False):
+  """Keyword arguments of Gaggle.write_deck_to_file()."""
+  filename: str | None
+  file_type: str
+  destination: str
+  extension: str
+  compression: Compression | str | None
+  compression_level: int | None
+  delta: bool
+
+
 EXCLUSIVE_OPEN_PARAMS: OpenOptions = {
     'mode': 'x',
     'encoding': _ANKI_EXPORT_ENCODING,
@@ -139,6 +179,9 @@ READ_PARAMS: OpenOptions = {
     'encoding': _ANKI_EXPORT_ENCODING,
     'newline': ''
 }
+# Field names assigned by the header settings tags_idx, deck_idx,
+# note_type_idx, and guid_idx, in that order. Cannot be set through field_names
+RESERVED_FIELD_NAMES: tuple[str, ...] = ('Tags', 'Deck', 'Note Type', 'GUID')
 
 
 class ReformatDirection(enum.StrEnum):
@@ -146,6 +189,81 @@ class ReformatDirection(enum.StrEnum):
   GAGGLE_TO_ANKI = 'gaggle_to_anki'
 
 
+class DeckStorage(enum.StrEnum):
+  """How the cards of an AnkiDeck are held in memory. ROWS stores a list of
+  AnkiCards; COLUMNAR stores one list of values per field; SQLITE stores rows
+  in a temporary on-disk SQLite database, which is deleted by AnkiDeck.close().
+  See ColumnarCards and SqliteCards documentation for more information."""
+  ROWS = 'rows'
+  COLUMNAR = 'columnar'
+  SQLITE = 'sqlite'
+
+
+class Compression(enum.StrEnum):
+  """Compression formats supported for reading and writing deck files. Read
+  compression is detected from the leading magic bytes of a file."""
+  GZIP = 'gzip'
+  BZ2 = 'bz2'
+  XZ = 'xz'
+
+
+_COMPRESSION_MAGIC_BYTES = {
+    Compression.GZIP: b'\x1f\x8b',
+    Compression.BZ2: b'BZh',
+    Compression.XZ: b'\xfd7zXZ\x00',
+}
+_COMPRESSION_MAGIC_BYTES_MAX_LENGTH = max(
+    map(len, _COMPRESSION_MAGIC_BYTES.values()))
+_COMPRESSION_EXTENSIONS = {
+    Compression.GZIP: '.gz',
+    Compression.BZ2: '.bz2',
+    Compression.XZ: '.xz',
+}
+_COMPRESSION_OPENERS: dict[Compression, Callable[..., IO[Any]]] = {
+    Compression.GZIP: gzip.open,
+    Compression.BZ2: bz2.open,
+    Compression.XZ: lzma.open,
+}
+# Keyword used by each opener for the compression level
+_COMPRESSION_LEVEL_KEYWORDS = {
+    Compression.GZIP: 'compresslevel',
+    Compression.BZ2: 'compresslevel',
+    Compression.XZ: 'preset',
+}
+
+
+class ExecutorType(enum.StrEnum):
+  """The kind of concurrent.futures executor used for concurrent work."""
+  PROCESS = 'process'
+  THREAD = 'thread'
+
+
+_EXECUTOR_CLASSES: dict[ExecutorType, PoolExecutorClass] = {
+    ExecutorType.PROCESS: concurrent.futures.ProcessPoolExecutor,
+    ExecutorType.THREAD: concurrent.futures.ThreadPoolExecutor,
+}
+
+
+def _new_executor(
+    executor: ExecutorType | str,
+    max_workers: int | None,
+) -> concurrent.futures.Executor:
+  """Returns a new executor of the given ExecutorType.
+
+  Raises:
+    ValueError: If executor is not a supported ExecutorType
+  """
+  return _EXECUTOR_CLASSES[ExecutorType(executor)](max_workers=max_workers)
+
+
+class MergeConflict(enum.StrEnum):
+  """Which card is kept when Gaggle.merge() finds two cards with the same
+  key. FIRST_WINS keeps the card of the earliest deck; LAST_WINS keeps the card
+  of the latest deck, at the position of the first."""
+  FIRST_WINS = 'first_wins'
+  LAST_WINS = 'last_wins'
+
+
 _DIRECTION_TRANSLATION_VALUE = {
     ReformatDirection.ANKI_TO_GAGGLE: -1,
     ReformatDirection.GAGGLE_TO_ANKI: 1
@@ -199,12 +317,15 @@ def propagate_warnings_from_generator(
 def _initialise_decks(
     exported_file: StrOrBytesPath | None = None,
     field_names: Iterable[str] | None = None,
+    lazy: bool = False,
 ) -> list[AnkiDeck]:
   """
 
   Args:
     exported_file:
     field_names:
+    lazy: If True, the deck is opened as a stream. See documentation for
+    AnkiDeck.open_stream() for more information.
 
   Returns:
 
@@ -212,6 +333,8 @@ def _initialise_decks(
     FileNotFoundError: If file specified by exported_file does not exist
   """
   if exported_file:
+    if lazy:
+      return [AnkiDeck.open_stream(exported_file, field_names)]
     return [AnkiDeck.from_file(exported_file, field_names)]
   else:
     empty_list: list[AnkiDeck] = []
@@ -375,17 +498,22 @@ class Gaggle:
 
   def __init__(self,
                exported_file: StrOrBytesPath | None = None,
-               field_names: Iterable[str] | None = None):
+               field_names: Iterable[str] | None = None,
+               lazy: bool = False):
     """
 
     Args:
       exported_file:
       field_names:
+      lazy: If True, cards of exported_file are parsed on demand each time the
+      deck is iterated instead of being read into memory. See documentation for
+      AnkiDeck.open_stream() for more information.
 
     Raises:
       FileNotFoundError: If file specified by exported_file does not exist
     """
-    self.decks: list[AnkiDeck] = _initialise_decks(exported_file, field_names)
+    self.decks: list[AnkiDeck] = _initialise_decks(exported_file, field_names,
+                                                   lazy)
 
   def __iter__(self) -> Iterator[AnkiDeck]:
     return iter(self.decks)
@@ -393,18 +521,67 @@ class Gaggle:
   def add_deck(self, deck: AnkiDeck) -> None:
     self.decks.append(deck)
 
-  def add_deck_from_file(self, file: str) -> None:
+  def add_deck_from_file(self, file: str, lazy: bool = False) -> None:
     """
 
     Args:
       file:
+      lazy: If True, the deck is opened as a stream. See documentation for
+      AnkiDeck.open_stream() for more information.
 
     Returns:
 
     """
-    deck = AnkiDeck.from_file(file)
+    if lazy:
+      deck = AnkiDeck.open_stream(file)
+    else:
+      deck = AnkiDeck.from_file(file)
     self.add_deck(deck)
 
+  def add_decks_from_files(
+      self,
+      files: Iterable[StrOrBytesPath],
+      field_names: Iterable[str] | None = None,
+      max_workers: int | None = None,
+      executor: ExecutorType | str = ExecutorType.PROCESS,
+  ) -> None:
+    """Reads in many files concurrently and adds a deck for each. Decks are
+    added in the order of files, regardless of the order in which parsing
+    finishes. A file which fails to load does not prevent the remaining files
+    from being added.
+
+    Args:
+      files: The file paths of the information used to construct each deck.
+      field_names: Strings representing the name of each field in each card.
+      Shared by every deck. See AnkiDeck.from_file() for more information.
+      max_workers: The maximum number of files parsed at once. See
+      concurrent.futures documentation for the default value.
+      executor: 'process' parses each file in a separate process, 'thread' in
+      a separate thread of this process. See ExecutorType.
+
+    Raises:
+      DecksNotLoadedException: If any file failed to load, after all other
+      files have been added. Maps each failed file to the raised exception.
+      ValueError: If executor is not a supported ExecutorType
+    """
+    files = list(files)
+    if field_names is not None:
+      field_names = tuple(field_names)
+    failures: dict[StrOrBytesPath, Exception] = {}
+    with _new_executor(executor, max_workers) as pool:
+      futures = [
+          pool.submit(AnkiDeck.from_file, file, field_names) for file in files
+      ]
+      for file, future in zip(files, futures):
+        try:
+          deck = future.result()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+          failures[file] = e
+        else:
+          self.add_deck(deck)
+    if failures:
+      raise exceptions.DecksNotLoadedException(failures)
+
   def write_deck_to_file(
       self,
       deck: AnkiDeck | int,
@@ -412,6 +589,9 @@ class Gaggle:
       file_type: str = _ANKI_NOTESINPLAINTEXT_EXT,
       destination: str = '.',
       extension: str = '',
+      compression: Compression | str | None = None,
+      compression_level: int | None = None,
+      delta: bool = False,
   ) -> None:
     """Writes a deck to a location in file storage. Supports various file naming
     features. See documentation for _generate_unique_file_path() for details on
@@ -423,29 +603,63 @@ class Gaggle:
       filename: The name to give to the newly created file. If none or if not
       unique, filename is generated by _generate_unique_file_path().
       file_type: The file type as designated by Anki. See
-      (https://docs.ankiweb.net/exporting.html) for more information.
+      (https://docs.ankiweb.net/exporting.html) for more information. '.apkg'
+      writes an Anki package, see AnkiDeck.write_as_apkg(); its extension is
+      appended to extension if not already present.
       destination: The directory to which the file will be written to.
       extension: The file extension, written after filename. Does not change
-      functionality of written file and is purely for naming.
+      functionality of written file unless it ends with the extension of a
+      Compression format (e.g. '.gz') and compression is None, in which case
+      that format is used.
+      compression: The Compression format of the written file. Its extension
+      is appended to extension if not already present.
+      compression_level: Passed to the compressor. See documentation for gzip,
+      bz2, and lzma for valid values. Uses the compressor default if None.
+      delta: If True, only the cards added or modified since the deck was
+      loaded or last checkpointed are written, under the full header. See
+      AnkiDeck.delta().
 
     Raises:
       OSError: Uses builtin open(). See open() Python documentation for more
       details (https://docs.python.org/3/library/functions.html#open)
       FileExistsError: _generate_unique_file_path() will generate unique
       filenames if a file already exists in a given path. Will not raise.
-      ValueError: If argument passed for file_type is not a supported file type
+      ValueError: If argument passed for file_type is not a supported file
+      type, or compression is not a supported Compression, or compression is
+      given for an '.apkg' file_type
     """
     if isinstance(deck, int):
       deck = self.get_deck(deck)
+    if delta:
+      deck = deck.delta()
+    if file_type == _ANKI_PACKAGE_EXT:
+      if compression is not None:
+        raise ValueError('Failed to write Deck to file. Packages are already '
+                         f'compressed but compression {compression} was given')
+      if not extension.endswith(_ANKI_PACKAGE_EXT):
+        extension = f'{extension}{_ANKI_PACKAGE_EXT}'
+      file_path = _generate_unique_file_path(filename, extension, destination)
+      with open(file_path, 'xb') as f:
+        deck.write_as_apkg(f)
+      return
+    if file_type not in (_ANKI_NOTESINPLAINTEXT_EXT,
+                         _ANKI_NOTESINPLAINTEXT_EXT):
+      raise ValueError('Failed to write Deck to file. Expected a valid '
+                       f'file_type but instead got {file_type}')
+    if compression is None:
+      compression = _compression_from_extension(extension)
+    else:
+      compression = Compression(compression)
+      compression_extension = _COMPRESSION_EXTENSIONS[compression]
+      if not extension.endswith(compression_extension):
+        extension = f'{extension}{compression_extension}'
     file_path = _generate_unique_file_path(filename, extension, destination)
-    with open(file_path, **EXCLUSIVE_OPEN_PARAMS) as f:
-      if file_type in (_ANKI_NOTESINPLAINTEXT_EXT, _ANKI_NOTESINPLAINTEXT_EXT):
-        deck.write_as_tsv(f)
-      else:
-        raise ValueError('Failed to write Deck to file. Expected a valid '
-                         f'file_type but instead got {file_type}')
+    with _open_export_for_writing(file_path, compression,
+                                  compression_level) as f:
+      deck.write_as_tsv(f)
 
-  def write_all_decks_to_file(self, **kwargs: Iterable[str | None]) -> None:
+  def write_all_decks_to_file(
+      self, **kwargs: Iterable[str | int | bool | Compression | None]) -> None:
     """Writes all Decks stored in Gaggle to file. **kwargs is flattened and
     write_deck_to_file is called with each group of arguments. If there are more
     Decks than argument groups, prints the remaining decks using default values.
@@ -464,12 +678,114 @@ class Gaggle:
         sentinel='', **kwargs)
     last_written_deck_idx = None
     for idx, deck in enumerate(self.decks):
-      empty_header: dict[str, Any] = {}
-      self.write_deck_to_file(deck, **next(flat_kwargs, empty_header))
+      default_options: _WriteDeckOptions = {}
+      options = cast(_WriteDeckOptions, next(flat_kwargs, default_options))
+      self.write_deck_to_file(deck, **options)
       last_written_deck_idx = idx
     if last_written_deck_idx != len(self.decks) - 1:
       raise exceptions.DecksNotWrittenException(last_written_deck_idx)
 
+  async def aadd_deck_from_file(self, file: StrOrBytesPath) -> None:
+    """Awaitable counterpart of add_deck_from_file(). The file is read and
+    parsed in a separate thread so the event loop is not blocked.
+
+    See add_deck_from_file() for documentation of arguments.
+    """
+    deck = await AnkiDeck.afrom_file(file)
+    self.add_deck(deck)
+
+  async def awrite_deck_to_file(
+      self,
+      deck: AnkiDeck | int,
+      filename: str | None = None,
+      file_type: str = _ANKI_NOTESINPLAINTEXT_EXT,
+      destination: str = '.',
+      extension: str = '',
+      compression: Compression | str | None = None,
+      compression_level: int | None = None,
+      delta: bool = False,
+  ) -> None:
+    """Awaitable counterpart of write_deck_to_file(). The deck is written in a
+    separate thread so the event loop is not blocked.
+
+    See write_deck_to_file() for documentation of arguments and exceptions.
+    """
+    await asyncio.to_thread(self.write_deck_to_file, deck, filename, file_type,
+                            destination, extension, compression,
+                            compression_level, delta)
+
+  async def awrite_all_decks_to_file(
+      self, **kwargs: Iterable[str | int | bool | Compression | None]) -> None:
+    """Awaitable counterpart of write_all_decks_to_file(). Decks are written
+    in a separate thread so the event loop is not blocked.
+
+    See write_all_decks_to_file() for documentation of arguments and
+    exceptions.
+    """
+    await asyncio.to_thread(self.write_all_decks_to_file, **kwargs)
+
+  def merge(
+      self,
+      key: MergeKey = _GUID_FIELD_NAME,
+      on_conflict: MergeConflict | str
+      | ConflictResolver = (MergeConflict.FIRST_WINS),
+  ) -> AnkiDeck:
+    """Combine every deck into one deck without duplicates, in a single pass.
+    Cards are placed in a hash table keyed on key; a card whose key is already
+    present is resolved by on_conflict. Cards keep the order in which their key
+    was first seen.
+
+    Decks whose field names disagree are reconciled: the merged deck has the
+    union of all field names, in order of first appearance, and cards are
+    padded with empty values for fields their deck does not have.
+
+    Args:
+      key: The field name whose value identifies a card, such as 'GUID', or a
+      function computing the identity of a card.
+      on_conflict: A MergeConflict policy, or a function given the kept card
+      and the incoming card which returns the card to keep.
+
+    Returns:
+      A new gaggle.AnkiDeck holding the merged cards. Its header marks the
+      reserved columns of the reconciled fields and has html:true if any deck
+      does.
+
+    Raises:
+      KeyError: If key is a field name which a card does not have
+      ValueError: If on_conflict is not a supported MergeConflict
+    """
+    if isinstance(key, str):
+      key = operator.methodcaller('get_field', key)
+    if isinstance(on_conflict, str):
+      on_conflict = MergeConflict(on_conflict)
+    merged: dict[Hashable, AnkiCard] = {}
+    for deck in self.decks:
+      for card in deck:
+        card_key = key(card)
+        kept_card = merged.get(card_key)
+        if kept_card is None or on_conflict == MergeConflict.LAST_WINS:
+          merged[card_key] = card
+        elif on_conflict != MergeConflict.FIRST_WINS:
+          merged[card_key] = on_conflict(kept_card, card)
+    return _reconcile_cards(merged.values())
+
+  def build_deck_trie(self) -> index.DeckTrie[tuple[int, int]]:
+    """Build one trie over the '::' hierarchy of the Deck column of every deck,
+    keyed by (deck index, card position). Built in one pass; keep the result
+    to answer repeated subtree queries. See gaggle.index.DeckTrie.
+
+    Returns:
+      A gaggle.index.DeckTrie of every card of every deck.
+
+    Raises:
+      KeyError: If a deck has no field with the name 'Deck'
+    """
+    deck_trie: index.DeckTrie[tuple[int, int]] = index.DeckTrie()
+    for deck_idx, deck in enumerate(self.decks):
+      for position, deck_name in enumerate(deck.column('Deck')):
+        deck_trie.add(deck_name, (deck_idx, position))
+    return deck_trie
+
   def get_deck(self, idx: int) -> AnkiDeck:
     return self.decks[idx]
 
@@ -583,69 +899,106 @@ def reformat_header_settings(
   header.update(reformatted_header)
 
 
-def read_header_settings(f: ReadableAndSeekable[str]) -> AnkiHeader:
-  """Reads in Anki Header from a stream and stores it into a dictionary. Strips
-  all trailing whitespace characters from header value.
+def read_header_settings(
+    lines: Iterable[str]) -> tuple[AnkiHeader, Iterator[str]]:
+  """Reads in Anki Header from the leading lines of an iterable and stores it
+  into a dictionary. Strips all trailing whitespace characters from header
+  value. The first line after the header is pushed back onto the returned
+  iterator, so lines need not be seekable; works with files, pipes, standard
+  input, sockets, and decompression streams.
 
-  Assumes input of a specific format, see documentation for parameter f.
+  Assumes input of a specific format, see documentation for parameter lines.
 
   Args:
-    f: A stream containing Anki Header information. Assumes input of format
+    lines: An iterable of lines, typically a text stream. Assumes input of
+    format
     <header symbol><header setting name><header delimiter><header setting value>
     where header symbol is the denotation that the line is a part of the file
-    header. The stream is left at the first line which does not contain
-    <header symbol> as its first component. <header symbol> and
-    <header delimiter> are specified by gaggle module constants.
+    header. <header symbol> and <header delimiter> are specified by gaggle
+    module constants.
 
   Returns:
-    A mapping of settings specified by the Anki file header.
+    A Tuple(header, body). header is a mapping of settings specified by the
+    Anki file header. body yields every line of lines which follows the header,
+    beginning with the first line which does not contain <header symbol>.
   """
   header_symbol = _ANKI_EXPORT_HEADER_LINE_SYMBOL
-  header_separator = _ANKI_EXPORT_HEADER_DELIMITER_SYMBOL
   header: AnkiHeader = {}
-  reader_pos = f.tell()
-  while f.read(1) == header_symbol:
-    line = f.readline()
-    setting, value = line.split(header_separator)
-    value = value.rstrip()
-    value = transform_integer_value(value)
-    assert isinstance(value, str | int)
+  lines = iter(lines)
+  for line in lines:
+    if not line.startswith(header_symbol):
+      return header, itertools.chain([line], lines)
+    setting, value = _parse_header_line(line[1:])
     header[setting] = value
-    reader_pos = f.tell()
-  f.seek(reader_pos)
-  return header
+  return header, lines
+
+
+def _parse_header_line(line: str) -> tuple[str, str | int]:
+  """Splits one line of an Anki Header into a setting name and its value.
+
+  Args:
+    line: A header line with the header symbol removed. Of the format
+    <header setting name><header delimiter><header setting value>
+
+  Returns:
+    A Tuple(setting, value). Trailing whitespace is stripped from value, which
+    is converted to an int if possible.
+  """
+  setting, value = line.split(_ANKI_EXPORT_HEADER_DELIMITER_SYMBOL)
+  value = value.rstrip()
+  value = transform_integer_value(value)
+  assert isinstance(value, str | int)
+  return setting, value
 
 
-def parse_header_settings(f: ReadableAndSeekable[str],) -> AnkiHeader:
+def parse_header_settings(
+    lines: Iterable[str]) -> tuple[AnkiHeader, Iterator[str]]:
   """Reads in all Anki file header settings, producing a mapping of setting
   name to setting value. Then reformats this mapping and returns it.
 
   Args:
-    f: A stream from which lines are read. Read until no longer contains header
-    information; stream left at first line with no header information, may be
-    depleted. See read_header_settings() for more information.
+    lines: An iterable of lines, typically a text stream. Read until a line no
+    longer contains header information. See read_header_settings() for more
+    information.
 
   Returns:
-    A mapping of setting name to setting value. The settings are formatted to
-    ensure internal consistency with AnkiCard and AnkiDeck. See
-    reformat_header_settings() documentation for more information.
+    A Tuple(header, body). header is a mapping of setting name to setting
+    value. The settings are formatted to ensure internal consistency with
+    AnkiCard and AnkiDeck. See reformat_header_settings() documentation for
+    more information. body yields the lines which follow the header.
   """
-  header = read_header_settings(f)
+  header, body = read_header_settings(lines)
   reformat_header_settings(header, direction=ReformatDirection.ANKI_TO_GAGGLE)
-  return header
+  return header, body
 
 
 def _parse_anki_export(
     exported_file: StrOrBytesPath,
     field_names: Iterable[str] | None = None,
-) -> tuple[AnkiHeader, list[AnkiCard]]:
+    storage: DeckStorage = DeckStorage.ROWS,
+    memory_map: bool = False,
+    workers: int | None = None,
+    where: RowFilter | None = None,
+    columns: Iterable[str | int] | None = None,
+    snapshot_builder: _SnapshotBuilder | None = None,
+) -> tuple[AnkiHeader, Iterable[AnkiCard]]:
   """Reads in a file exported from Anki. Determines file type through the header
   then parses all data accompanying the header using the header settings.
 
   Args:
     exported_file: A reference to a file exported by Anki
     field_names: The names to be used for referencing AnkiCard fields. See
-      _generate_unique_field_names() for implementation details.
+      _resolve_unique_field_names() for implementation details.
+    storage: The in-memory layout of the parsed cards. See DeckStorage.
+    memory_map: If True, the file is read through mmap instead of a text
+      stream. See _parse_mapped_anki_export() for more information.
+    workers: If greater than 1, the rows are split by this many processes.
+      Implies memory_map. See _iterate_records_in_parallel().
+    where: Skips rows before cards are created. See _compile_row_filter().
+    columns: Keeps only these field names or column indexes. See
+      _project_columns().
+    snapshot_builder: If given, receives the header and every row, before
+      where and columns are applied. See _SnapshotBuilder.
 
   Returns:
     A Tuple(header, cards). header is a dictionary mapping setting names to
@@ -657,204 +1010,2820 @@ def _parse_anki_export(
     information.
     FileNotFoundError: If file specified by exported_file does not exist
   """
-  seperator_setting_key = _ANKI_EXPORT_HEADER_SETTING_SEPARATOR_NAME
-  tsv = _ANKI_EXPORT_HEADER_SETTING_SEPARATOR_TSV_STRING
-  cards = []
-  with open(exported_file, **READ_PARAMS) as f:
-    header = parse_header_settings(f)
-    if header[seperator_setting_key] == tsv:
-      del header[seperator_setting_key]
-      cards = create_cards_from_tsv(f, field_names=field_names, header=header)
-      header[seperator_setting_key] = tsv
-  return header, cards
+  compression = _read_compression(exported_file)
+  if compression is None and (memory_map or workers is not None):
+    return _parse_mapped_anki_export(exported_file, field_names, storage,
+                                     workers, where, columns, snapshot_builder)
+  with open_export(exported_file, compression) as f:
+    return _parse_anki_lines(f, field_names, storage, where, columns,
+                             snapshot_builder)
+
+
+def _read_compression(exported_file: StrOrBytesPath) -> Compression | None:
+  """Returns the compression format of a file to be read. An extension of a
+  plain text export or of a Compression format settles it without opening the
+  file. Any other file is identified by its leading magic bytes."""
+  file_path = os.fsdecode(exported_file)
+  if file_path.endswith(_ANKI_NOTESINPLAINTEXT_EXT):
+    return None
+  compression = _compression_from_extension(file_path)
+  if compression is not None:
+    return compression
+  with open(exported_file, 'rb') as f:
+    return detect_compression(f.read(_COMPRESSION_MAGIC_BYTES_MAX_LENGTH))
+
+
+def detect_compression(magic_bytes: bytes) -> Compression | None:
+  """Identifies the compression format of a file from its first bytes.
 
+  Args:
+    magic_bytes: The leading bytes of a file. Should contain at least
+    _COMPRESSION_MAGIC_BYTES_MAX_LENGTH bytes when available.
 
-class AnkiDeck:
-  """Represents a collection of Notes and Cards exported from Anki
-  (i.e. gaggle.AnkiCards).
-
-  Attributes:
-    header: A dictionary mapping setting names to the setting value. The setting
-    value is an int if it references a column of parsed data.
-    cards: An iterable of gaggle.AnkiCards
+  Returns:
+    The matching Compression, or None if the bytes are not compressed.
   """
+  for compression, magic in _COMPRESSION_MAGIC_BYTES.items():
+    if magic_bytes.startswith(magic):
+      return compression
+  return None
 
-  def __init__(self, header: AnkiHeader, cards: Iterable[AnkiCard]):
-    self.header = header
-    self.cards = cards
-
-  @classmethod
-  def from_file(cls,
-                file: StrOrBytesPath,
-                field_names: Iterable[str] | None = None) -> Self:
-    """Factory method to create an AnkiDeck directly from a file.
 
-    Args:
-      file: A string representing the file path of the information used to
-      construct the deck.
-      field_names: Strings representing the name of each field in each card. See
-      documentation for _generate_unique_field_names() for details on usage and
-      structure.
+def open_export(
+    exported_file: StrOrBytesPath,
+    compression: Compression | None = None,
+) -> IO[str]:
+  """Opens a file exported from Anki for reading as text, decompressing it on
+  the fly if compression is given.
 
-    Returns:
-      A gaggle.AnkiDeck object. See AnkiDeck documentation for more information.
+  Args:
+    exported_file: A reference to a file exported by Anki
+    compression: The compression format of exported_file. See
+    detect_compression().
 
-    Raises:
-      FileNotFoundError: If file specified by file does not exist
-    """
-    header, cards = _parse_anki_export(file, field_names)
-    return cls(header, cards)
+  Returns:
+    A text stream of the exported file, opened as specified by READ_PARAMS.
 
-  def __iter__(self) -> Iterator[AnkiCard]:
-    return iter(self.cards)
+  Raises:
+    OSError: Uses Python builtin open(). See Python documentation for further
+    information.
+  """
+  if compression is None:
+    return open(exported_file, **READ_PARAMS)
+  opener = _COMPRESSION_OPENERS[compression]
+  return cast(
+      IO[str],
+      opener(
+          exported_file,
+          'rt',
+          encoding=_ANKI_EXPORT_ENCODING,
+          newline=READ_PARAMS['newline']))
+
+
+def _open_export_for_writing(
+    file_path: StrOrBytesPath,
+    compression: Compression | None = None,
+    compression_level: int | None = None,
+) -> IO[str]:
+  """Creates a new file for writing as text, compressing it on the fly if
+  compression is given. Uses the options of EXCLUSIVE_OPEN_PARAMS.
 
-  def get_header_setting(
-      self,
-      setting_name: str,
-      default: Any = None,
-  ) -> str | int:
-    """Return the value of a header setting, referenced by name
+  Args:
+    file_path: The path of the file to create.
+    compression: The compression format of the created file.
+    compression_level: Passed to the compressor of compression. Uses the
+    default level of the compressor if None. Ignored if compression is None.
 
-    Args:
-      setting_name: String representing the name of the setting, as named in
-      Gaggle representation. A conversion from Anki naming to Gaggle naming can
-      be referenced in _ANKI_EXPORT_HEADER_MAPPING.
-      default: The value to return if no header setting with the given name is
-      found.
+  Returns:
+    A writable text stream.
 
-    Returns:
-      The found setting as stored. Else, default if a setting by name
-      setting_name is not found.
-    """
-    return self.header.get(setting_name, default)
+  Raises:
+    FileExistsError: If a file already exists at file_path
+  """
+  if compression is None:
+    return open(file_path, **EXCLUSIVE_OPEN_PARAMS)
+  options: dict[str, Any] = {}
+  if compression_level is not None:
+    options[_COMPRESSION_LEVEL_KEYWORDS[compression]] = compression_level
+  opener = _COMPRESSION_OPENERS[compression]
+  return cast(
+      IO[str],
+      opener(
+          file_path,
+          f'{EXCLUSIVE_OPEN_PARAMS["mode"]}t',
+          encoding=_ANKI_EXPORT_ENCODING,
+          newline=EXCLUSIVE_OPEN_PARAMS['newline'],
+          **options))
+
+
+def _compression_from_extension(extension: str) -> Compression | None:
+  for compression, compression_extension in _COMPRESSION_EXTENSIONS.items():
+    if extension.endswith(compression_extension):
+      return compression
+  return None
+
+
+def _parse_cached_anki_export(
+    exported_file: StrOrBytesPath,
+    cache: DeckCache,
+    field_names: Iterable[str] | None = None,
+    storage: DeckStorage = DeckStorage.ROWS,
+    memory_map: bool = False,
+    workers: int | None = None,
+    where: RowFilter | None = None,
+    columns: Iterable[str | int] | None = None,
+) -> tuple[AnkiHeader, Iterable[AnkiCard]]:
+  """Counterpart of _parse_anki_export() which first looks up exported_file in
+  cache. On a cache hit, the stored header and columns are restored and the
+  file is not parsed. On a miss, the file is parsed once and a snapshot is
+  collected from the parsed rows while the cards are stored.
+
+  Snapshots always hold every row and column, so that where, which may be an
+  arbitrary callable, and columns are not part of the cache key; both are
+  applied to the stored rows.
+
+  See _parse_anki_export() for documentation of the remaining arguments and
+  return value.
+  """
+  if field_names is not None:
+    field_names = tuple(field_names)
+  key = cache.key(exported_file, [field_names])
+  snapshot = cache.load(key)
+  if snapshot is not None:
+    return _restore_snapshot(snapshot, field_names, storage, where, columns)
+  snapshot_builder = _SnapshotBuilder(field_names)
+  header, cards = _parse_anki_export(exported_file, field_names, storage,
+                                     memory_map, workers, where, columns,
+                                     snapshot_builder)
+  cache.store(key, snapshot_builder.snapshot())
+  return header, cards
 
-  def write_header(self, f: SupportsWrite[str]) -> None:
-    """Outputs header settings stored in self.header.
 
-    Setting a header value to None will prevent it from being output.
+class _SnapshotBuilder:
+  """Collects the header and rows of a parse into a DeckSnapshot as the rows
+  are stored, so that a cache miss reads the file only once. Values are
+  appended to a list per column, however the cards are stored.
+  """
 
+  def __init__(self, field_names: tuple[str, ...] | None = None):
+    """
     Args:
-      f: A stream implementing write(). See Gaggle.write_deck_to_file() for an
-      example using open().
-
-    Raises:
-      KeyError: If AnkiDeck.header contains a header name not supported by
-      reformat_header_settings()
+      field_names: The field names the rows are parsed with.
     """
-    header_symbol = _ANKI_EXPORT_HEADER_LINE_SYMBOL
-    header_seperator = _ANKI_EXPORT_HEADER_DELIMITER_SYMBOL
-    header_copy = _copy_and_reformat(
-        self.header, direction=ReformatDirection.GAGGLE_TO_ANKI)
-    for setting_name in _ANKI_ORDERED_HEADER:
-      setting_value = header_copy.get(setting_name)
-      if setting_value is not None:
-        header_line = (f'{header_symbol}{setting_name}'
-                       f'{header_seperator}{setting_value}\n')
-        f.write(header_line)
+    self.field_names = field_names
+    self.header: dict[str, Any] = {}
+    self._columns: list[list[str]] = []
+    self._row_widths: array.array[int] = array.array('I')
 
-  def write_as_tsv(self, f: SupportsWrite[str]) -> None:
-    """Outputs header settings associated with deck. Then outputs the data
-    fields of each AnkiCard stored in self.cards. One card per row.
+  @property
+  def num_rows(self) -> int:
+    return len(self._row_widths)
 
-    Requires only a stream to improve reusability as a public API. See
-    Gaggle.write_deck_to_file() for a simpler setup.
+  def record(
+      self,
+      header: AnkiHeader,
+      records: Iterable[Sequence[str]],
+  ) -> Iterator[Sequence[str]]:
+    """Yields records unchanged, adding each to the snapshot.
 
     Args:
-      f: A stream implementing write(). See Gaggle.write_deck_to_file() for an
-      example using open().
-
-    Raises:
-      io.UnsupportedOperation: If write permission is not given by f.
+      header: The header settings of records, in Gaggle format.
+      records: The values of each row, in read order.
     """
-    self.write_header(f)
-    w = csv.writer(f, dialect=_ANKI_EXPORT_CONTENT_DIALECT)
-    for card in self.cards:
-      card.write_as_tsv(w)
+    self.header = dict(header)
+    # Appends without a Python level loop over the fields of each row
+    consume = collections.deque[None](maxlen=0).extend
+    row_widths = self._row_widths
+    for record in records:
+      if len(record) == len(self._columns):
+        consume(map(list[str].append, self._columns, record))
+      else:
+        self._add_irregular_row(record)
+      row_widths.append(len(record))
+      yield record
+
+  def _add_irregular_row(self, record: Sequence[str]) -> None:
+    """Adds a row whose width differs from the widest row so far. Columns
+    missing from narrower rows are padded with empty values."""
+    while len(self._columns) < len(record):
+      self._columns.append([''] * self.num_rows)
+    padding = [''] * (len(self._columns) - len(record))
+    for column, value in zip(self._columns, [*record, *padding]):
+      column.append(value)
+
+  def snapshot(self) -> DeckSnapshot:
+    """Returns the snapshot of every row recorded so far."""
+    row_widths = self._row_widths
+    is_uniform = row_widths.count(len(self._columns)) == len(row_widths)
+    return {
+        'header': self.header,
+        'field_names': self.field_names,
+        'num_rows': self.num_rows,
+        'columns': self._columns,
+        'row_widths': None if is_uniform else row_widths,
+    }
 
 
-def create_cards_from_tsv(
-    f: Iterable[str],
+def _restore_snapshot(
+    snapshot: DeckSnapshot,
     field_names: Iterable[str] | None = None,
-    header: AnkiHeader | None = None,
-) -> list[AnkiCard]:
-  """Breaks each entry of f using Excel TSV style rules. Then constructs an
-  AnkiCard from the delimited strings.
+    storage: DeckStorage = DeckStorage.ROWS,
+    where: RowFilter | None = None,
+    columns: Iterable[str | int] | None = None,
+) -> tuple[AnkiHeader, Iterable[AnkiCard]]:
+  """Stores the rows of snapshot as if the snapshotted file had been parsed.
+  Unless where or columns is given, or the rows differ in width, the columns
+  are stored without creating a row for each card: ColumnarCards keeps them
+  as they are, and every AnkiCard shares one FieldLayout.
+
+  See _store_cards_with_header() for documentation of the remaining arguments
+  and return value.
+  """
+  header: AnkiHeader = snapshot['header']
+  values = snapshot['columns']
+  row_widths = snapshot['row_widths']
+  if values and row_widths is None and where is None and columns is None:
+    schema = FieldSchema.from_header(_field_settings(header), field_names)
+    if storage == DeckStorage.ROWS:
+      layout = schema.layout_for(len(values))
+      return header, [AnkiCard.from_layout(row, layout) for row in zip(*values)]
+    elif storage == DeckStorage.COLUMNAR:
+      return header, ColumnarCards.from_columns(values, schema)
+    return header, _store_cards(zip(*values), schema, storage)
+  rows: Iterable[Sequence[str]]
+  if not values:
+    rows = [()] * snapshot['num_rows']
+  elif row_widths is None:
+    rows = zip(*values)
+  else:
+    rows = (row[:width] for row, width in zip(zip(*values), row_widths))
+  return _store_cards_with_header(rows, header, field_names, storage, where,
+                                  columns)
+
+
+def _parse_anki_lines(
+    lines: Iterable[str],
+    field_names: Iterable[str] | None = None,
+    storage: DeckStorage = DeckStorage.ROWS,
+    where: RowFilter | None = None,
+    columns: Iterable[str | int] | None = None,
+    snapshot_builder: _SnapshotBuilder | None = None,
+) -> tuple[AnkiHeader, Iterable[AnkiCard]]:
+  """Parses the header and all cards of an Anki export from its lines. lines
+  is only iterated once and need not be seekable.
 
   Args:
-    f: Typically a stream from builtin open()
-    field_names: The names to be used for each field per entry in f. Used for
-    reference only. See documentation for _generate_unique_field_names() for
-    more information.
-    header: The settings with which to initialise each AnkiCard.
+    lines: The lines of a file exported by Anki. Typically a stream opened with
+    newline='' so that quoted newlines are preserved.
+    field_names: The names to be used for referencing AnkiCard fields.
+    storage: The in-memory layout of the parsed cards. See DeckStorage.
+    where: Skips rows before cards are created. See _compile_row_filter().
+    columns: Keeps only these field names or column indexes. See
+    _project_columns().
+    snapshot_builder: If given, receives the header and every row. See
+    _SnapshotBuilder.
 
   Returns:
-    A list of AnkiCards. Useful for constructing an AnkiDeck.
+    A Tuple(header, cards). See _parse_anki_export() for more information.
+  """
+  header, body = parse_header_settings(lines)
+  records: Iterable[list[str]] = ()
+  if header[_ANKI_EXPORT_HEADER_SETTING_SEPARATOR_NAME] == (
+      _ANKI_EXPORT_HEADER_SETTING_SEPARATOR_TSV_STRING):
+    records = csv.reader(body, dialect=_ANKI_EXPORT_CONTENT_DIALECT)
+  return _store_cards_with_header(records, header, field_names, storage, where,
+                                  columns, snapshot_builder)
+
+
+class _ReadOnlyRawStream(io.RawIOBase):
+  """Adapts an object with only a read() method to io.RawIOBase, so that it can
+  be buffered by io.BufferedReader. Closing the adapter does not close stream.
   """
-  if header is None:
-    header = {}
-  cards = csv.reader(f, dialect=_ANKI_EXPORT_CONTENT_DIALECT)
-  deck: list[AnkiCard] = []
-  for card in cards:
-    anki_card = AnkiCard(
-        card, field_names=field_names,
-        **header)  # pyright: ignore [reportGeneralTypeIssues]
-    deck.append(anki_card)
-  return deck
-
 
-# Stack depth when resolving lazy evaluation in _generate_field_dict()
-_stack_levels_to_anki_card_init_call = 4
+  def __init__(self, stream: SupportsRead[bytes]):
+    self._stream = stream
 
+  def readable(self) -> bool:
+    return True
 
-@propagate_warnings_from_generator(_stack_levels_to_anki_card_init_call)
-def _generate_unique_field_names(field_names: Iterator[str] | Iterable[str],
-                                 fields: Iterator[Any] | Iterable[Any],
-                                 indexes_reserved_names: Mapping[int, str],
-                                 seen_names: set[str]) -> Iterator[str]:
-  """Generator for field names; prevents duplicate names from being returned.
+  def readinto(self, buffer: WriteableBuffer) -> int:
+    with memoryview(buffer) as view, view.cast('B') as byte_view:
+      data = self._stream.read(len(byte_view))
+      byte_view[:len(data)] = data
+    return len(data)
 
-  When a field name is omitted, Generic name 'Field{idx}' is assigned. idx
-  begins at 0 and corresponds to read-in order of field values.
 
-  The length of field_names is not required to match the length of fields.
-  Missing names will be generated with a default and extra names will be
-  discarded.
+@contextlib.contextmanager
+def _open_text_stream(
+    stream: Iterable[str] | SupportsRead[bytes]
+) -> Generator[Iterable[str], None, None]:
+  """Context manager which reads a binary stream as text using the Anki export
+  encoding, decompressing it if its leading bytes match a Compression format.
+  Text streams are used unchanged. Wrappers are detached on exit so stream is
+  never closed.
 
   Args:
-    field_names: The names which should be set for each delimited field in the
-      parsed file. Used for reference, does not modify read contents. Use any
-      Falsy value to apply a default field name.
-    fields: The fields to be named. Used as a reference for length, not
-      modified. Iterator is exhausted.
-    indexes_reserved_names: An index representing the column to which assign
-      the corresponding reserved name.
-    seen_names: Names designated as unique and cannot be assigned through
-      field_names. Should always contain at least AnkiCard._reserved_names for
-      assumptions of class properties to hold. May contain extra values to be
-      protected (i.e. prevented from being assigned).
+    stream: A readable text or binary stream.
 
   Yields:
-    Unique values from field_names
+    A text stream reading from stream.
+  """
+  if isinstance(stream, io.TextIOBase) or not hasattr(stream, 'read'):
+    yield cast(Iterable[str], stream)
+    return
+  if isinstance(cast('SupportsRead[Any]', stream).read(0), str):
+    yield cast(Iterable[str], stream)
+    return
+  with contextlib.ExitStack() as wrappers:
+    binary_stream = cast(BinaryIO, stream)
+    if not hasattr(binary_stream, 'peek'):
+      buffered_stream = io.BufferedReader(_ReadOnlyRawStream(binary_stream))
+      wrappers.callback(buffered_stream.detach)
+      binary_stream = cast(BinaryIO, buffered_stream)
+    magic_bytes = cast(io.BufferedReader,
+                       binary_stream).peek(_COMPRESSION_MAGIC_BYTES_MAX_LENGTH)
+    compression = detect_compression(magic_bytes)
+    if compression is not None:
+      # Decompressors do not close a file object passed to them
+      binary_stream = cast(BinaryIO,
+                           _COMPRESSION_OPENERS[compression](binary_stream))
+    text_stream = io.TextIOWrapper(
+        binary_stream, encoding=_ANKI_EXPORT_ENCODING, newline='')
+    wrappers.callback(text_stream.detach)
+    yield text_stream
+
+
+def _store_cards_with_header(
+    records: Iterable[Sequence[str]],
+    header: AnkiHeader,
+    field_names: Iterable[str] | None = None,
+    storage: DeckStorage = DeckStorage.ROWS,
+    where: RowFilter | None = None,
+    columns: Iterable[str | int] | None = None,
+    snapshot_builder: _SnapshotBuilder | None = None,
+) -> tuple[AnkiHeader, Iterable[AnkiCard]]:
+  """Stores records using the column indexes specified by header. The
+  separator setting of header is ignored. If where is given, records it
+  rejects are skipped before any AnkiCard is created, see
+  _compile_row_filter(). If columns is given, only those columns are stored,
+  see _project_columns(). If snapshot_builder is given, it receives header and
+  every record before where and columns are applied.
+
+  See _store_cards() for more information.
+
+  Returns:
+    A Tuple(header, cards). header is the given header, or a copy indexing the
+    projected columns if columns is given.
+  """
+  schema = FieldSchema.from_header(_field_settings(header), field_names)
+  if snapshot_builder is not None:
+    records = snapshot_builder.record(header, records)
+  if where is not None:
+    records = filter(_compile_row_filter(where, header), records)
+  if columns is not None:
+    records, header, schema = _project_columns(records, header, schema, columns)
+  return header, _store_cards(records, schema, storage)
+
+
+def _field_settings(header: AnkiHeader) -> AnkiHeader:
+  """Returns a copy of header without the separator setting, as accepted by
+  FieldSchema.from_header()."""
+  return {
+      key: value
+      for key, value in header.items()
+      if key != _ANKI_EXPORT_HEADER_SETTING_SEPARATOR_NAME
+  }
+
+
+def _resolve_column_indexes(
+    columns: Iterable[str | int],
+    names: Sequence[str],
+) -> list[int]:
+  indexes: list[int] = []
+  for column in columns:
+    if isinstance(column, int):
+      if not 0 <= column < len(names):
+        raise ValueError(f'Expected a column index below {len(names)} but '
+                         f'instead got {column}')
+      indexes.append(column)
+    else:
+      try:
+        indexes.append(names.index(column))
+      except ValueError:
+        raise ValueError(f'Expected a field name, one of {list(names)}, but '
+                         f'instead got {column}') from None
+  return indexes
+
+
+def _project_columns(
+    records: Iterable[Sequence[str]],
+    header: AnkiHeader,
+    schema: FieldSchema,
+    columns: Iterable[str | int],
+) -> tuple[Iterator[Sequence[str]], dict[str, str | int], FieldSchema]:
+  """Selects columns of each record, in the order of columns.
+
+  Field names are resolved against the layout of the first record, so names
+  generated from the header (e.g. 'Tags', 'Field3') can be requested. Reserved
+  columns are kept only if requested. header is not modified; the returned
+  header moves the column index settings (e.g. tags_idx) to the projected
+  positions, and removes them for reserved columns which are dropped.
+
+  Args:
+    records: The values of each card, in read order.
+    header: The header settings of records, in Gaggle format.
+    schema: The field naming of the unprojected records.
+    columns: Field names or column indexes of the columns to keep.
+
+  Returns:
+    A Tuple(records, header, schema) of the projected records, their header
+    settings and their field naming.
 
   Raises:
-    ValueError: If an index-bound default name is reserved before a field would
-      have used that name. For example, naming Field0 "Field2" and then having
-      no field name specified for Field2.
-    DuplicateWarning: Raised in two situations. If field_names contains a name
-      specified by reserved_names. If field_names contains a duplicate value.
-    LeftoverArgumentWarning: If field_names contains more values than fields
-    HeaderFieldNameMismatchWarning: If field_names contains a non-empty string
-      which contradicts a value specified by indexes_reserved_names. Takes
-      precedence over DuplicateWarning when both apply.
+    ValueError: If a field name or column index does not exist
   """
-  field_names = iter(field_names)
-  fields = iter(fields)
-  for count in itertools.count():
-    name = next(field_names, None)
-    field_to_be_named = next(fields, None)
-    if field_to_be_named is None:
+  records = iter(records)
+  first_record = next(records, None)
+  if first_record is not None:
+    width = len(first_record)
+    records = itertools.chain([first_record], records)
+  else:
+    header_indexes = [
+        idx for key in _RESERVED_FIELD_HEADER_KEYS.values()
+        if isinstance(idx := header.get(key), int)
+    ]
+    width = max([len(schema.field_names), *(idx + 1 for idx in header_indexes)])
+  names = schema.names_for(width)
+  indexes = _resolve_column_indexes(columns, names)
+  projected_header: dict[str, str | int] = dict(header)
+  for header_key in _RESERVED_FIELD_HEADER_KEYS.values():
+    idx = header.get(header_key)
+    if isinstance(idx, int):
+      if idx in indexes:
+        projected_header[header_key] = indexes.index(idx)
+      else:
+        del projected_header[header_key]
+  projected_schema = FieldSchema.from_header(
+      _field_settings(projected_header), [names[idx] for idx in indexes])
+  select = _column_selector(indexes)
+  return map(select, records), projected_header, projected_schema
+
+
+def _column_selector(
+    indexes: Sequence[int]) -> Callable[[Sequence[str]], Sequence[str]]:
+  """Returns a function selecting indexes from a row. Rows too short to hold
+  an index are padded with empty values."""
+  if not indexes:
+    return lambda row: ()
+  getter = operator.itemgetter(*indexes)
+  single = len(indexes) == 1
+
+  def select(row: Sequence[str]) -> Sequence[str]:
+    try:
+      values = getter(row)
+    except IndexError:
+      return [row[idx] if idx < len(row) else '' for idx in indexes]
+    return (values,) if single else values
+
+  return select
+
+
+_RESERVED_FIELD_HEADER_KEYS = {
+    'GUID': 'guid_idx',
+    'Note Type': 'note_type_idx',
+    'Deck': 'deck_idx',
+    'Tags': 'tags_idx',
+}
+
+
+def _matches_hierarchy(value: str, wanted: str) -> bool:
+  return value == wanted or value.startswith(f'{wanted}::')
+
+
+def _compile_value_matcher(
+    field_name: str,
+    wanted: str | Callable[[str], bool]) -> Callable[[str], bool]:
+  if callable(wanted):
+    return wanted
+  if field_name == 'Deck':
+    return lambda value: _matches_hierarchy(value, wanted)
+  if field_name == 'Tags':
+    wanted_tag = wanted.casefold()
+    return lambda value: any(
+        _matches_hierarchy(tag, wanted_tag) for tag in value.casefold().split())
+  return wanted.__eq__
+
+
+def _compile_row_filter(
+    where: RowFilter,
+    header: Mapping[str, str | int]) -> Callable[[Sequence[str]], bool]:
+  """Turns where into a predicate over raw rows, so rows can be rejected
+  before any AnkiCard or field name is created.
+
+  where is either a predicate over the values of a row, in read order, or a
+  declarative filter mapping reserved field names to the wanted value. All
+  entries of a declarative filter must match:
+    'Deck': the deck or any of its subdecks, e.g. 'A' matches 'A::B'.
+    'Tags': a tag or any tag below it, e.g. 'lang' matches 'Lang::French'.
+    'Note Type', 'GUID': an exact match.
+  Tags are the only values compared case-insensitively, as Anki treats tags
+  differing only in case as the same tag (see index.TagIndex). Every other
+  value, including deck names, must match exactly. A value may also be a
+  predicate over the column value, for any other comparison.
+
+  Args:
+    where: The predicate or declarative filter.
+    header: The header settings of the rows, in Gaggle format.
+
+  Returns:
+    A predicate returning True for rows to keep.
+
+  Raises:
+    ValueError: If a key of where is not a reserved field name or its column is
+    not specified by header
+  """
+  if callable(where):
+    return where
+  matchers: list[tuple[int, Callable[[str], bool]]] = []
+  for field_name, wanted in where.items():
+    header_key = _RESERVED_FIELD_HEADER_KEYS.get(field_name)
+    if header_key is None:
+      raise ValueError(f'Expected a reserved field name in where, one of '
+                       f'{list(_RESERVED_FIELD_HEADER_KEYS)}, but instead got '
+                       f'{field_name}')
+    idx = header.get(header_key)
+    if not isinstance(idx, int):
+      raise ValueError(f'Expected a header specifying {header_key} to filter '
+                       f'on {field_name} but instead got {header}')
+    matchers.append((idx, _compile_value_matcher(field_name, wanted)))
+
+  def predicate(row: Sequence[str]) -> bool:
+    width = len(row)
+    return all(idx < width and matcher(row[idx]) for idx, matcher in matchers)
+
+  return predicate
+
+
+def _map_file(f: SupportsFileno) -> ByteBuffer:
+  """Maps the contents of an open binary file into memory as read only. Empty
+  files cannot be mapped and are returned as empty bytes instead."""
+  try:
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  except ValueError:
+    if os.fstat(f.fileno()).st_size == 0:
+      return b''
+    raise
+
+
+def read_header_settings_from_buffer(
+    buffer: ByteBuffer) -> tuple[AnkiHeader, int]:
+  """Reads in Anki Header from the start of a bytes-like object. Counterpart
+  of read_header_settings() which finds the header/body boundary with byte
+  searches instead of reading a stream.
+
+  Args:
+    buffer: The encoded contents of a file exported by Anki. See
+    read_header_settings() documentation for the expected format.
+
+  Returns:
+    A Tuple(header, body_start). header is a mapping of settings specified by
+    the Anki file header, as returned by read_header_settings(). body_start is
+    the offset of the first byte which is not part of the header.
+  """
+  header_symbol = _ANKI_EXPORT_HEADER_LINE_SYMBOL.encode(_ANKI_EXPORT_ENCODING)
+  header: AnkiHeader = {}
+  pos = 0
+  end = len(buffer)
+  while buffer[pos:pos + 1] == header_symbol:
+    line_end = _find_line_end(buffer, pos, end)
+    line = buffer[pos + 1:line_end].decode(_ANKI_EXPORT_ENCODING)
+    setting, value = _parse_header_line(line)
+    header[setting] = value
+    pos = min(line_end + 1, end)
+  return header, pos
+
+
+def _find_line_end(buffer: ByteBuffer, start: int, end: int) -> int:
+  """Returns the offset of the next newline byte in buffer, or end if there is
+  none."""
+  line_end = buffer.find(b'\n', start, end)
+  return end if line_end == -1 else line_end
+
+
+def iterate_buffer_records(
+    buffer: ByteBuffer,
+    start: int = 0,
+    end: int | None = None,
+    block_size: int = _MAPPED_BLOCK_SIZE,
+) -> Generator[list[str], None, None]:
+  """Splits the encoded rows of an Anki export body into decoded field values,
+  following the same rules as csv.reader() with the excel-tab dialect.
+
+  Rows are decoded in blocks of whole lines. Blocks without a quote character,
+  the common case, are decoded straight from buffer in one call and split on
+  newlines and tabs. A row containing a quote may hold quoted tabs or newlines;
+  it is extended until its quotes are balanced and then passed to csv.reader().
+
+  Args:
+    buffer: The encoded contents of a file exported by Anki.
+    start: The offset of the first byte of the first row.
+    end: The offset after the last byte of the last row. Defaults to the length
+    of buffer.
+    block_size: The approximate number of bytes decoded at once.
+
+  Yields:
+    The field values of each row, in read order.
+  """
+  if end is None:
+    end = len(buffer)
+  quote = b'"'
+  with memoryview(buffer) as view:
+    pos = start
+    while pos < end:
+      block_end = _find_line_end(buffer, min(pos + block_size, end - 1), end)
+      quote_pos = buffer.find(quote, pos, block_end)
+      if quote_pos != -1:
+        # Stop the block before the line containing the quote
+        block_end = buffer.rfind(b'\n', pos, quote_pos)
+      if block_end != -1:
+        yield from _split_unquoted_lines(view[pos:block_end])
+        pos = block_end + 1
+        continue
+      line_end = _find_line_end(buffer, pos, end)
+      while view[pos:line_end].tobytes().count(quote) % 2 and line_end < end:
+        line_end = _find_line_end(buffer, line_end + 1, end)
+      # Without a newline before end, the record ends at end
+      yield from _split_quoted_record(
+          str(view[pos:min(line_end + 1, end)], _ANKI_EXPORT_ENCODING))
+      pos = line_end + 1
+
+
+def _split_quoted_record(record: str) -> Iterator[list[str]]:
+  return csv.reader(
+      io.StringIO(record, newline=''), dialect=_ANKI_EXPORT_CONTENT_DIALECT)
+
+
+def _split_unquoted_lines(block: memoryview) -> Iterator[list[str]]:
+  """Decodes lines which contain no quote character and splits them into field
+  values. Empty lines produce an empty list, as with csv.reader()."""
+  text = str(block, _ANKI_EXPORT_ENCODING)
+  lines = text.split('\n')
+  if '\r' in text:
+    lines = [line.removesuffix('\r') for line in lines]
+  return map(_split_unquoted_line, lines)
+
+
+def _split_unquoted_line(line: str) -> list[str]:
+  return line.split('\t') if line else []
+
+
+def find_record_boundaries(
+    buffer: ByteBuffer,
+    start: int,
+    end: int,
+    parts: int,
+) -> list[int]:
+  """Divides the rows of an Anki export body into contiguous byte ranges of
+  roughly equal size. Ranges only begin after a newline which is outside of a
+  quoted field, so no row is split across two ranges.
+
+  A newline is outside of a quoted field when the number of quote characters
+  preceding it in the body is even; escaped quotes are doubled under the
+  excel-tab dialect and do not change the parity.
+
+  Args:
+    buffer: The encoded contents of a file exported by Anki.
+    start: The offset of the first byte of the first row.
+    end: The offset after the last byte of the last row.
+    parts: The desired number of ranges. Fewer ranges are returned if the body
+    contains too few rows.
+
+  Returns:
+    Increasing offsets, beginning with start and ending with end. Range i spans
+    from offsets[i] up to offsets[i + 1].
+  """
+  quote = b'"'
+  boundaries = [start]
+  part_size = (end - start) // max(parts, 1)
+  scanned = start
+  quote_parity = 0
+  with memoryview(buffer) as view:
+    for part in range(1, parts):
+      pos = max(start + part * part_size, boundaries[-1])
+      while (line_end := buffer.find(b'\n', pos, end)) != -1:
+        quote_parity += view[scanned:line_end].tobytes().count(quote)
+        quote_parity %= 2
+        scanned = line_end
+        pos = line_end + 1
+        if not quote_parity:
+          break
+      if line_end == -1 or pos >= end:
+        break
+      boundaries.append(pos)
+  boundaries.append(end)
+  return boundaries
+
+
+def _parse_file_range(
+    exported_file: StrOrBytesPath,
+    start: int,
+    end: int,
+) -> list[list[str]]:
+  """Worker function of _iterate_records_in_parallel(). Maps exported_file and
+  splits the rows found between start and end.
+
+  Returns:
+    The field values of each row in the range, in read order.
+  """
+  with open(exported_file, 'rb') as f:
+    buffer = _map_file(f)
+    try:
+      return list(iterate_buffer_records(buffer, start, end))
+    finally:
+      if isinstance(buffer, mmap.mmap):
+        buffer.close()
+
+
+def _iterate_records_in_parallel(
+    exported_file: StrOrBytesPath,
+    buffer: ByteBuffer,
+    start: int,
+    workers: int,
+) -> Generator[list[str], None, None]:
+  """Splits the rows of an Anki export body using a pool of worker processes.
+  The body is divided by find_record_boundaries() into one range per worker and
+  each range is parsed by _parse_file_range() in a separate process.
+
+  Args:
+    exported_file: A reference to the file mapped by buffer. Reopened by each
+    worker process.
+    buffer: The encoded contents of exported_file.
+    start: The offset of the first byte of the first row.
+    workers: The maximum number of worker processes.
+
+  Yields:
+    The field values of each row, in read order.
+  """
+  boundaries = find_record_boundaries(buffer, start, len(buffer), workers)
+  starts = boundaries[:-1]
+  ends = boundaries[1:]
+  with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+    for rows in executor.map(_parse_file_range, itertools.repeat(exported_file),
+                             starts, ends):
+      yield from rows
+
+
+def _parse_mapped_anki_export(
+    exported_file: StrOrBytesPath,
+    field_names: Iterable[str] | None = None,
+    storage: DeckStorage = DeckStorage.ROWS,
+    workers: int | None = None,
+    where: RowFilter | None = None,
+    columns: Iterable[str | int] | None = None,
+    snapshot_builder: _SnapshotBuilder | None = None,
+) -> tuple[AnkiHeader, Iterable[AnkiCard]]:
+  """Memory-mapped counterpart of _parse_anki_export(). The file is mapped
+  into memory and never read through a text stream; header and rows are
+  located with byte searches.
+
+  Cards stored as DeckStorage.ROWS, without where, columns, or a snapshot
+  builder, keep each unquoted row encoded until one of its values is used, see
+  EncodedAnkiCard. Rows containing a quote, and every row stored otherwise or
+  parsed by worker processes, are decoded to str while parsing, as the filters
+  and other storages read the values.
+
+  See _parse_anki_export() for documentation of arguments and return value.
+  """
+  with open(exported_file, 'rb') as f:
+    buffer = _map_file(f)
+    try:
+      header, body_start = read_header_settings_from_buffer(buffer)
+      reformat_header_settings(
+          header, direction=ReformatDirection.ANKI_TO_GAGGLE)
+      if header[_ANKI_EXPORT_HEADER_SETTING_SEPARATOR_NAME] != (
+          _ANKI_EXPORT_HEADER_SETTING_SEPARATOR_TSV_STRING):
+        records = iterate_buffer_records(b'')
+      elif workers is not None and workers > 1:
+        records = _iterate_records_in_parallel(exported_file, buffer,
+                                               body_start, workers)
+      elif (storage == DeckStorage.ROWS and where is None and
+            columns is None and snapshot_builder is None):
+        schema = FieldSchema.from_header(_field_settings(header), field_names)
+        return header, _store_encoded_cards(buffer, body_start, schema)
+      else:
+        records = iterate_buffer_records(buffer, body_start)
+      with contextlib.closing(records):
+        return _store_cards_with_header(records, header, field_names, storage,
+                                        where, columns, snapshot_builder)
+    finally:
+      if isinstance(buffer, mmap.mmap):
+        buffer.close()
+
+
+def _store_cards(
+    records: Iterable[Sequence[str]],
+    schema: FieldSchema,
+    storage: DeckStorage = DeckStorage.ROWS,
+) -> Iterable[AnkiCard]:
+  """Consumes records, storing each as specified by storage.
+
+  Args:
+    records: The delimited values of each card, in read order.
+    schema: The field naming shared by each card.
+    storage: The in-memory layout of the cards. See DeckStorage.
+
+  Returns:
+    A list of AnkiCards, ColumnarCards, or SqliteCards, depending on storage.
+
+  Raises:
+    ValueError: If storage is not a supported DeckStorage
+  """
+  if storage == DeckStorage.ROWS:
+    return [AnkiCard.from_schema(record, schema) for record in records]
+  elif storage == DeckStorage.COLUMNAR:
+    return ColumnarCards.from_records(records, schema)
+  elif storage == DeckStorage.SQLITE:
+    return SqliteCards.from_records(records, schema)
+  else:
+    raise ValueError(f'Expected a valid DeckStorage but instead got {storage}')
+
+
+def _store_encoded_cards(
+    buffer: ByteBuffer,
+    start: int,
+    schema: FieldSchema,
+    block_size: int = _MAPPED_BLOCK_SIZE,
+) -> list[AnkiCard]:
+  """Counterpart of _store_cards() for DeckStorage.ROWS which keeps the lines
+  of rows without a quote character encoded, see EncodedAnkiCard. A row
+  containing a quote may hold quoted tabs or newlines; it is extended until
+  its quotes are balanced and then decoded and passed to csv.reader().
+
+  Args:
+    buffer: The encoded contents of a file exported by Anki.
+    start: The offset of the first byte of the first row.
+    schema: The field naming shared by each card.
+    block_size: The approximate number of bytes copied from buffer at once.
+
+  Returns:
+    A list of AnkiCards, in read order.
+  """
+  cards: list[AnkiCard] = []
+  quote = b'"'
+  # The lines of a quoted row whose quotes are not yet balanced
+  pending: list[bytes] = []
+  pending_quotes = 0
+  end = len(buffer)
+  pos = start
+  while pos < end:
+    block_end = _find_line_end(buffer, min(pos + block_size, end - 1), end)
+    block = buffer[pos:block_end]
+    pos = block_end + 1
+    lines = block.split(b'\n')
+    if not pending and quote not in block:
+      if b'\r' in block:
+        lines = [line.removesuffix(b'\r') for line in lines]
+      cards.extend(
+          map(EncodedAnkiCard.from_encoded, lines, itertools.repeat(schema)))
+      continue
+    for line in lines:
+      if not pending and quote not in line:
+        cards.append(
+            EncodedAnkiCard.from_encoded(line.removesuffix(b'\r'), schema))
+        continue
+      pending.append(line)
+      pending_quotes += line.count(quote)
+      if pending_quotes % 2:
+        continue
+      cards.extend(_decode_quoted_lines(pending, schema))
+      pending = []
+      pending_quotes = 0
+  if pending:
+    cards.extend(_decode_quoted_lines(pending, schema))
+  return cards
+
+
+def _decode_quoted_lines(lines: list[bytes],
+                         schema: FieldSchema) -> Iterator[AnkiCard]:
+  """Decodes the lines of one quoted row and splits it with csv.reader()."""
+  record = str(b'\n'.join(lines), _ANKI_EXPORT_ENCODING)
+  return (AnkiCard.from_schema(values, schema)
+          for values in _split_quoted_record(record))
+
+
+class ValidationIssue(enum.StrEnum):
+  """The kinds of problem reported by AnkiDeck.validate()."""
+  DUPLICATE_FIELD_NAME = 'duplicate_field_name'
+  MISMATCHED_FIELD_NAME = 'mismatched_field_name'
+  LEFTOVER_FIELD_NAMES = 'leftover_field_names'
+  INCONSISTENT_ROW_WIDTH = 'inconsistent_row_width'
+  MISSING_RESERVED_COLUMN = 'missing_reserved_column'
+  EMPTY_GUID = 'empty_guid'
+  DUPLICATE_GUID = 'duplicate_guid'
+
+
+_FIELD_NAME_ISSUES: dict[type[Warning], ValidationIssue] = {
+    exceptions.DuplicateWarning:
+        ValidationIssue.DUPLICATE_FIELD_NAME,
+    exceptions.HeaderFieldNameMismatchWarning:
+        ValidationIssue.MISMATCHED_FIELD_NAME,
+    exceptions.LeftoverArgumentWarning:
+        ValidationIssue.LEFTOVER_FIELD_NAMES,
+}
+
+
+class ValidationReport:
+  """The problems found in a deck by AnkiDeck.validate(), aggregated by kind.
+  Each kind is counted once per affected row, and the first few affected rows
+  are kept as samples. Rows are numbered by card position, starting at 0.
+
+  Attributes:
+    num_rows: The number of rows validated.
+    counts: A mapping of each issue found to the number of affected rows.
+    sample_rows: A mapping of each issue found to the first affected rows, at
+    most sample_size per issue.
+    messages: A mapping of each issue found to its distinct messages, such as
+    the text of a field name warning.
+    sample_size: The maximum number of sample rows kept per issue.
+  """
+
+  def __init__(self, sample_size: int = _DEFAULT_VALIDATION_SAMPLE_SIZE):
+    """
+    Args:
+      sample_size: The maximum number of sample rows kept per issue.
+
+    Raises:
+      ValueError: If sample_size is negative
+    """
+    if sample_size < 0:
+      raise ValueError(f'Expected a non-negative sample_size but instead got '
+                       f'{sample_size}')
+    self.num_rows = 0
+    self.counts: collections.Counter[ValidationIssue] = collections.Counter()
+    self.sample_rows: dict[ValidationIssue, list[int]] = {}
+    self.messages: dict[ValidationIssue, list[str]] = {}
+    self.sample_size = sample_size
+
+  def add(self, issue: ValidationIssue, row: int, *messages: str) -> None:
+    """Record an issue affecting a row.
+
+    Args:
+      issue: The kind of problem.
+      row: The position of the affected row.
+      *messages: Descriptions of the problem. Each is kept once per distinct
+      value.
+    """
+    self.counts[issue] += 1
+    sample_rows = self.sample_rows.setdefault(issue, [])
+    if len(sample_rows) < self.sample_size:
+      sample_rows.append(row)
+    if messages:
+      kept_messages = self.messages.setdefault(issue, [])
+      kept_messages.extend(
+          message for message in dict.fromkeys(messages)
+          if message not in kept_messages)
+
+  def add_rows(self, issue: ValidationIssue, count: int, rows: Iterable[int],
+               *messages: str) -> None:
+    """Record an issue affecting many rows at once, for issues only known
+    after every row has been seen.
+
+    Args:
+      issue: The kind of problem.
+      count: The number of affected rows.
+      rows: The positions of the first affected rows, at least sample_size of
+      them if count allows. Only the lowest are kept as samples.
+      *messages: Descriptions of the problem. Each is kept once per distinct
+      value.
+    """
+    if not count:
+      return
+    self.counts[issue] += count
+    sample_rows = self.sample_rows.setdefault(issue, [])
+    sample_rows[:] = sorted([*sample_rows, *rows])[:self.sample_size]
+    if messages:
+      kept_messages = self.messages.setdefault(issue, [])
+      kept_messages.extend(
+          message for message in dict.fromkeys(messages)
+          if message not in kept_messages)
+
+  @property
+  def is_valid(self) -> bool:
+    """Whether no issue was found."""
+    return not self.counts
+
+  def __str__(self) -> str:
+    if self.is_valid:
+      return f'No issues found in {self.num_rows} rows.'
+    lines = [f'Found {len(self.counts)} issues in {self.num_rows} rows:']
+    for issue, count in self.counts.items():
+      line = f'{issue}: {count} rows'
+      if sample_rows := self.sample_rows[issue]:
+        line += f' (e.g. rows {", ".join(str(row) for row in sample_rows)})'
+      lines.append(line)
+      lines.extend(f'  {message}' for message in self.messages.get(issue, ()))
+    return '\n'.join(lines)
+
+
+class AnkiExportStream:
+  """A re-iterable view of the cards stored in a file exported from Anki.
+
+  Only the header is read on construction. Each call to iter() reopens the file
+  and parses one row at a time, so memory use does not depend on the size of
+  the file. Modifications made to yielded AnkiCards are not written back.
+
+  Attributes:
+    exported_file: A reference to a file exported by Anki
+    field_names: The names to be used for referencing AnkiCard fields. See
+    _resolve_unique_field_names() for implementation details.
+    header: A dictionary mapping setting names to setting values, as returned
+    by _parse_anki_export().
+  """
+
+  def __init__(
+      self,
+      exported_file: StrOrBytesPath,
+      field_names: Iterable[str] | None = None,
+  ):
+    """
+    Args:
+      exported_file: A reference to a file exported by Anki
+      field_names: The names to be used for referencing AnkiCard fields. Stored
+      as a tuple so that it can be reused by every iteration.
+
+    Raises:
+      OSError: Uses Python builtin open(). See Python documentation for further
+      information.
+      FileNotFoundError: If file specified by exported_file does not exist
+    """
+    self.exported_file = exported_file
+    self.field_names = tuple(field_names) if field_names is not None else None
+    self.compression = _read_compression(exported_file)
+    with open_export(exported_file, self.compression) as f:
+      self.header: AnkiHeader = parse_header_settings(f)[0]
+
+  def __iter__(self) -> Iterator[AnkiCard]:
+    seperator_setting_key = _ANKI_EXPORT_HEADER_SETTING_SEPARATOR_NAME
+    tsv = _ANKI_EXPORT_HEADER_SETTING_SEPARATOR_TSV_STRING
+    with open_export(self.exported_file, self.compression) as f:
+      header, body = parse_header_settings(f)
+      if header[seperator_setting_key] == tsv:
+        del header[seperator_setting_key]
+        yield from generate_cards_from_tsv(
+            body, field_names=self.field_names, header=header)
+
+
+class AnkiDeck:
+  """Represents a collection of Notes and Cards exported from Anki
+  (i.e. gaggle.AnkiCards).
+
+  Attributes:
+    header: A dictionary mapping setting names to the setting value. The setting
+    value is an int if it references a column of parsed data.
+    cards: An iterable of gaggle.AnkiCards
+  """
+
+  def __init__(self, header: AnkiHeader, cards: Iterable[AnkiCard]):
+    self.header = header
+    self.cards = cards
+    self._guid_index: dict[str, int] | None = None
+    self._tag_index: index.TagIndex | None = None
+    self._deck_trie: index.DeckTrie[int] | None = None
+    self._text_index: index.TextIndex | None = None
+    self._text_index_field_names: tuple[str, ...] | None = None
+    self._added_guids: set[str] = set()
+    self._modified_guids: set[str] = set()
+    self._removed_guids: set[str] = set()
+    # Set by reindex(), as cards may since have been added or removed directly
+    self._tracked_guids_stale = False
+    self._fingerprint: bytes | None = None
+    # What _fingerprint was computed from: the card fingerprints of a list of
+    # cards, or the ColumnarCards or SqliteCards and their version
+    self._fingerprint_leaves: list[bytes] = []
+    self._fingerprint_source: ColumnarCards | SqliteCards | None = None
+    self._fingerprint_version = 0
+
+  @classmethod
+  def from_file(cls,
+                file: StrOrBytesPath,
+                field_names: Iterable[str] | None = None,
+                storage: DeckStorage = DeckStorage.ROWS,
+                memory_map: bool = False,
+                workers: int | None = None,
+                cache: DeckCache | None = None,
+                where: RowFilter | None = None,
+                columns: Iterable[str | int] | None = None) -> Self:
+    """Factory method to create an AnkiDeck directly from a file.
+
+    Args:
+      file: A string representing the file path of the information used to
+      construct the deck.
+      field_names: Strings representing the name of each field in each card. See
+      documentation for _resolve_unique_field_names() for details on usage and
+      structure.
+      storage: The in-memory layout of the cards. See DeckStorage.
+      memory_map: If True, file is read through mmap. Reduces copying and system
+      calls when reading large files. See _parse_mapped_anki_export().
+      workers: The number of processes used to parse file. If greater than 1,
+      the rows of file are divided into ranges which are parsed concurrently
+      and returned in read order. Each worker process is started and sends its
+      rows back pickled, which only pays off for files of many MiB on a
+      machine with as many free CPUs. Implies memory_map.
+      cache: If given, the parsed contents of file are restored from cache
+      when file is unchanged since it was last parsed with the same field_names.
+      Otherwise, file is parsed and its contents are stored in cache. Files are
+      compared by size and modification time unless the cache verifies content.
+      See gaggle.cache.DeckCache for more information.
+      where: Skips rows before any AnkiCard is created. Either a predicate
+      over the raw values of a row, in read order, or a mapping of reserved
+      field name ('Deck', 'Tags', 'Note Type', 'GUID') to the wanted value.
+      See _compile_row_filter() for matching rules.
+      columns: Keeps only these columns, given as field names (e.g. 'Tags',
+      'Field3', or a name from field_names) or column indexes, in this order.
+      Reserved columns are kept only if requested. Header column settings such
+      as tags_idx are updated to the projected positions, or removed if their
+      column is dropped. Applied after where.
+
+    Returns:
+      A gaggle.AnkiDeck object. See AnkiDeck documentation for more information.
+
+    Raises:
+      FileNotFoundError: If file specified by file does not exist
+      ValueError: If storage is DeckStorage.COLUMNAR or DeckStorage.SQLITE and
+      the rows of file do not all have the same number of fields, or where
+      names a field which is not reserved or not specified by the header, or
+      columns names a field or index which does not exist
+    """
+    if cache is not None:
+      header, cards = _parse_cached_anki_export(file, cache, field_names,
+                                                storage, memory_map, workers,
+                                                where, columns)
+    else:
+      header, cards = _parse_anki_export(file, field_names, storage, memory_map,
+                                         workers, where, columns)
+    return cls(header, cards)
+
+  @classmethod
+  async def afrom_file(cls,
+                       file: StrOrBytesPath,
+                       field_names: Iterable[str] | None = None,
+                       storage: DeckStorage = DeckStorage.ROWS,
+                       memory_map: bool = False,
+                       workers: int | None = None,
+                       cache: DeckCache | None = None,
+                       where: RowFilter | None = None,
+                       columns: Iterable[str | int] | None = None) -> Self:
+    """Awaitable counterpart of from_file(). The file is read and parsed in a
+    separate thread so the event loop is not blocked.
+
+    See from_file() for documentation of arguments, return value, and
+    exceptions.
+    """
+    if field_names is not None:
+      field_names = tuple(field_names)
+    if columns is not None:
+      columns = tuple(columns)
+    return await asyncio.to_thread(cls.from_file, file, field_names, storage,
+                                   memory_map, workers, cache, where, columns)
+
+  @classmethod
+  def from_stream(cls,
+                  stream: Iterable[str] | SupportsRead[bytes],
+                  field_names: Iterable[str] | None = None,
+                  storage: DeckStorage = DeckStorage.ROWS,
+                  where: RowFilter | None = None,
+                  columns: Iterable[str | int] | None = None) -> Self:
+    """Factory method to create an AnkiDeck from any readable stream. The
+    stream is read once, from its current position, and is not required to be
+    seekable. For example, standard input:
+
+    >>> AnkiDeck.from_stream(sys.stdin.buffer)
+
+    Args:
+      stream: A text stream, or a binary stream of the Anki export encoding.
+      Text streams should be opened with newline='' so that newlines inside of
+      quoted fields are preserved. Binary streams may be compressed with any
+      Compression format and are not closed.
+      field_names: Strings representing the name of each field in each card. See
+      documentation for _resolve_unique_field_names() for details on usage and
+      structure.
+      storage: The in-memory layout of the cards. See DeckStorage.
+      where: Skips rows before any AnkiCard is created. See from_file().
+      columns: Keeps only these field names or column indexes. See
+      from_file().
+
+    Returns:
+      A gaggle.AnkiDeck object. See AnkiDeck documentation for more information.
+    """
+    with _open_text_stream(stream) as text_stream:
+      header, cards = _parse_anki_lines(text_stream, field_names, storage,
+                                        where, columns)
+    return cls(header, cards)
+
+  @classmethod
+  def open_stream(cls,
+                  file: StrOrBytesPath,
+                  field_names: Iterable[str] | None = None) -> Self:
+    """Factory method to create an AnkiDeck which parses cards from a file on
+    demand. Only the header is read in by this method; each iteration over the
+    deck reads the file again, one row at a time. Memory use is constant
+    regardless of the size of the file.
+
+    See documentation for AnkiExportStream for more information.
+
+    Args:
+      file: A string representing the file path of the information used to
+      construct the deck.
+      field_names: Strings representing the name of each field in each card. See
+      documentation for _resolve_unique_field_names() for details on usage and
+      structure.
+
+    Returns:
+      A gaggle.AnkiDeck object whose cards are an AnkiExportStream.
+
+    Raises:
+      FileNotFoundError: If file specified by file does not exist
+    """
+    cards = AnkiExportStream(file, field_names)
+    return cls(cards.header, cards)
+
+  @classmethod
+  def from_apkg(cls,
+                file: StrOrBytesPath,
+                field_names: Iterable[str] | None = None,
+                storage: DeckStorage = DeckStorage.ROWS,
+                where: RowFilter | None = None,
+                columns: Iterable[str | int] | None = None) -> Self:
+    """Factory method to create an AnkiDeck directly from an Anki package
+    (.apkg) or collection (.anki2), without exporting it as text first.
+
+    Every note of the collection becomes one card, laid out as in a "Notes in
+    Plain Text" export: GUID, Note Type, Deck, the fields of the note, and Tags.
+    See gaggle.apkg.AnkiPackage for supported collection formats.
+
+    Args:
+      file: The path of an .apkg package or .anki2 collection.
+      field_names: Strings representing the name of each field in each card. See
+      documentation for _resolve_unique_field_names() for details on usage and
+      structure.
+      storage: The in-memory layout of the cards. See DeckStorage.
+      where: Skips notes before any AnkiCard is created. See from_file().
+      columns: Keeps only these field names or column indexes. See
+      from_file().
+
+    Returns:
+      A gaggle.AnkiDeck object. See AnkiDeck documentation for more information.
+
+    Raises:
+      FileNotFoundError: If file specified by file does not exist
+      ValueError: If the package does not contain a supported collection
+      sqlite3.DatabaseError: If the collection is not a valid Anki collection
+    """
+    with apkg.AnkiPackage(file) as package:
+      header: AnkiHeader = package.header()
+      reformat_header_settings(
+          header, direction=ReformatDirection.ANKI_TO_GAGGLE)
+      header, cards = _store_cards_with_header(package.iterate_records(),
+                                               header, field_names, storage,
+                                               where, columns)
+    return cls(header, cards)
+
+  def __iter__(self) -> Iterator[AnkiCard]:
+    return iter(self.cards)
+
+  def close(self) -> None:
+    """Release the resources held by the cards of the deck. Closes the
+    database connection of SqliteCards, deleting a temporary database; cards
+    stored in memory need no closing. AnkiDeck is also a context manager which
+    calls close() on exit."""
+    if isinstance(self.cards, SqliteCards):
+      self.cards.close()
+
+  def __enter__(self) -> Self:
+    return self
+
+  def __exit__(self, exc_type: type[BaseException] | None,
+               exc_value: BaseException | None,
+               traceback: TracebackType | None) -> None:
+    self.close()
+
+  def __aiter__(self) -> AsyncIterator[AnkiCard]:
+    return self.aiter_cards()
+
+  async def aiter_cards(self,
+                        chunk_size: int = 1024) -> AsyncIterator[AnkiCard]:
+    """Asynchronous iteration over the cards of the deck. Cards are taken from
+    the deck in chunks by a separate thread, so decks opened with open_stream()
+    are parsed without blocking the event loop.
+
+    Args:
+      chunk_size: The number of cards taken from the deck by each thread call.
+
+    Yields:
+      Each AnkiCard of the deck, in order.
+    """
+    cards = iter(self.cards)
+    while chunk := await asyncio.to_thread(_take, cards, chunk_size):
+      for card in chunk:
+        yield card
+
+  def column(self, field_name: str) -> Sequence[str]:
+    """Return the value of one field for every card, in card order.
+
+    For ColumnarCards the stored column is returned without touching any
+    AnkiCard; modifying it modifies the deck. For SqliteCards a new list is
+    read from the database. Otherwise, a new list is built from each card.
+
+    Args:
+      field_name: The name of the field, as named by the FieldSchema of the
+      deck.
+
+    Returns:
+      A sequence holding the value of field_name for each card.
+
+    Raises:
+      KeyError: If no field with the name field_name exists
+    """
+    if isinstance(self.cards, ColumnarCards | SqliteCards):
+      return self.cards.column(field_name)
+    return [card.get_field(field_name) for card in self.cards]
+
+  def _mutable_cards(self) -> list[AnkiCard] | ColumnarCards:
+    if isinstance(self.cards, list | ColumnarCards):
+      return self.cards
+    raise TypeError(f'Expected cards stored as DeckStorage.ROWS or '
+                    f'DeckStorage.COLUMNAR but instead got '
+                    f'{type(self.cards).__name__}')
+
+  def _check_guid_column(self) -> None:
+    if self.header.get('guid_idx') is None:
+      raise ValueError('Expected a header specifying guid_idx but instead '
+                       f'got {self.header}')
+
+  def _guid_positions(self) -> dict[str, int]:
+    """Return the GUID index, building it on first use. Maps the GUID of each
+    card to its position in self.cards; if GUIDs repeat, the first card wins.
+
+    Raises:
+      ValueError: If the header does not specify a GUID column
+      TypeError: If the cards cannot be indexed by position
+    """
+    if self._guid_index is None:
+      self._check_guid_column()
+      self._mutable_cards()
+      guids = self.column(_GUID_FIELD_NAME)
+      guid_index: dict[str, int] = {}
+      for position, guid in enumerate(guids):
+        guid_index.setdefault(guid, position)
+      self._guid_index = guid_index
+    return self._guid_index
+
+  def reindex(self) -> None:
+    """Discard the GUID, tag, deck, and text indexes and the cached
+    fingerprint, so they are rebuilt on next use. Required after self.cards or
+    a field of a card is modified other than through upsert(),
+    remove_by_guid(), remove_by_guids(), or set_field().
+
+    The added, modified, and removed GUIDs are reconciled with the GUIDs of
+    the cards on next use: a removed GUID which is present again counts as
+    modified, and an added or modified GUID which is no longer present counts
+    as never added or as removed. Values changed directly, other than through
+    set_field(), are not detected; see changed_cards()."""
+    self._guid_index = None
+    self._tag_index = None
+    self._deck_trie = None
+    self._text_index = None
+    self._fingerprint = None
+    self._fingerprint_leaves = []
+    self._fingerprint_source = None
+    self._tracked_guids_stale = True
+
+  def _reconcile_tracked_guids(self) -> None:
+    """Updates the tracked GUIDs after reindex() to the GUIDs of the cards."""
+    if not self._tracked_guids_stale:
+      return
+    self._tracked_guids_stale = False
+    if self.header.get('guid_idx') is None or not (
+        self._added_guids or self._modified_guids or self._removed_guids):
+      return
+    guids = set(self.column(_GUID_FIELD_NAME))
+    returned_guids = self._removed_guids & guids
+    self._removed_guids -= returned_guids
+    self._modified_guids |= returned_guids
+    self._added_guids &= guids
+    missing_guids = self._modified_guids - guids
+    self._modified_guids -= missing_guids
+    self._removed_guids |= missing_guids
+
+  @property
+  def tag_index(self) -> index.TagIndex:
+    """The inverted tag index of the deck, built from the Tags column on first
+    use and discarded whenever the cards change through upsert() or
+    remove_by_guid(). See gaggle.index.TagIndex for more information.
+
+    Raises:
+      KeyError: If no field with the name 'Tags' exists
+    """
+    if self._tag_index is None:
+      self._tag_index = index.TagIndex.from_tags(self.column('Tags'))
+    return self._tag_index
+
+  def cards_with_tags(
+      self,
+      all_of: Iterable[str] = (),
+      any_of: Iterable[str] = (),
+      none_of: Iterable[str] = ()
+  ) -> list[AnkiCard]:
+    """Return the cards matching a tag query, in card order. Tags match
+    case-insensitively and include every tag below them in the '::'
+    hierarchy. See gaggle.index.TagIndex.query_bitset().
+
+    Args:
+      all_of: Tags every returned card carries.
+      any_of: Tags of which a returned card carries at least one. Ignored if
+      empty.
+      none_of: Tags no returned card carries.
+
+    Returns:
+      The matching cards. For SqliteCards, modifications of the cards are not
+      written back.
+
+    Raises:
+      KeyError: If no field with the name 'Tags' exists
+    """
+    return self._cards_at(self.tag_index.query(all_of, any_of, none_of))
+
+  @property
+  def deck_trie(self) -> index.DeckTrie[int]:
+    """The trie over the '::' hierarchy of the Deck column, keyed by card
+    position. Built on first use and discarded whenever the cards change
+    through upsert() or remove_by_guid(). See gaggle.index.DeckTrie for
+    subtree counts and child deck listing.
+
+    Raises:
+      KeyError: If no field with the name 'Deck' exists
+    """
+    if self._deck_trie is None:
+      self._deck_trie = index.DeckTrie.from_names(self.column('Deck'))
+    return self._deck_trie
+
+  def index_text(self, field_names: Iterable[str]) -> index.TextIndex:
+    """Build a full-text index over the values of selected fields, replacing
+    any previous text index. Values are stripped of HTML when the header
+    setting has_html is true. The index is then updated by upsert(), and is
+    rebuilt over the same fields on next use after remove_by_guid() or
+    reindex(). See gaggle.index.TextIndex for more information.
+
+    Args:
+      field_names: The fields to index. Search results are ranked in this
+      order.
+
+    Returns:
+      The built index.
+
+    Raises:
+      KeyError: If a card has no field with a name in field_names
+    """
+    self._text_index_field_names = tuple(field_names)
+    self._text_index = None
+    return self.text_index
+
+  @property
+  def text_index(self) -> index.TextIndex:
+    """The full-text index built by index_text(), rebuilt if it was discarded.
+
+    Raises:
+      ValueError: If index_text() has not been called
+      KeyError: If a card has no field with an indexed name
+    """
+    if self._text_index is None:
+      if self._text_index_field_names is None:
+        raise ValueError('Expected a text index but instead got none. Call '
+                         'AnkiDeck.index_text() first')
+      has_html = _parse_anki_header_bool(
+          str(self.header.get('has_html', HeaderBoolean.FALSE_)))
+      text_index = index.TextIndex(self._text_index_field_names, has_html)
+      for position, card in enumerate(self):
+        text_index.add(position, card.fields)
+      self._text_index = text_index
+    return self._text_index
+
+  def search_text(self,
+                  query: str,
+                  substring: bool = False,
+                  field_names: Iterable[str] | None = None) -> list[int]:
+    """Find cards whose indexed fields contain query. Requires index_text().
+
+    Args:
+      query: The text to find, matched case-insensitively.
+      substring: If False, match cards containing every word of query. If
+      True, match cards containing query as a substring.
+      field_names: Restricts the search to these indexed fields. Searches
+      every indexed field if None.
+
+    Returns:
+      The positions of matching cards, ranked by the first indexed field that
+      matches, then by position.
+
+    Raises:
+      ValueError: If index_text() has not been called, or a name in
+      field_names is not indexed
+    """
+    return self.text_index.search(query, substring, field_names)
+
+  def cards_in_deck(self, deck_name: str) -> list[AnkiCard]:
+    """Return the cards of a deck and all of its subdecks, in card order.
+
+    Args:
+      deck_name: The full name of the deck, with subdecks separated by '::'.
+
+    Returns:
+      The matching cards. For SqliteCards, modifications of the cards are not
+      written back.
+
+    Raises:
+      KeyError: If no field with the name 'Deck' exists
+    """
+    return self._cards_at(self.deck_trie.keys(deck_name))
+
+  def _cards_at(self, positions: list[int]) -> list[AnkiCard]:
+    """Return the cards at sorted positions, by index when cards support it
+    and otherwise in one pass."""
+    if isinstance(self.cards, list | ColumnarCards):
+      cards = self.cards
+      return [cards[position] for position in positions]
+    matching_positions = set(positions)
+    return [
+        card for position, card in enumerate(self.cards)
+        if position in matching_positions
+    ]
+
+  def get_by_guid(self, guid: str) -> AnkiCard | None:
+    """Return the card with a GUID, without scanning the deck. The GUID index
+    is built on first use, see _guid_positions(). For SqliteCards, the indexed
+    GUID column of the database is queried instead.
+
+    Args:
+      guid: The GUID of the card.
+
+    Returns:
+      The card with the GUID guid, or None if there is none. For SqliteCards,
+      modifications of the card are not written back; use upsert() instead.
+
+    Raises:
+      ValueError: If the header does not specify a GUID column
+      TypeError: If the cards are streamed, see open_stream()
+    """
+    if isinstance(self.cards, SqliteCards):
+      self._check_guid_column()
+      return self.cards.get_by_field(_GUID_FIELD_NAME, guid)
+    position = self._guid_positions().get(guid)
+    if position is None:
+      return None
+    return self._mutable_cards()[position]
+
+  def upsert(self, card: AnkiCard) -> None:
+    """Replace the card with the same GUID as card, or add card to the end of
+    the deck if there is none. Keeps the GUID index consistent and records the
+    card as modified or added, see changed_cards().
+
+    Args:
+      card: The card to store. Must have the same number of fields as the
+      cards of the deck if they are ColumnarCards or SqliteCards.
+
+    Raises:
+      ValueError: If the header does not specify a GUID column, or card does
+      not have the same number of fields as ColumnarCards or SqliteCards
+      TypeError: If the cards are streamed, see open_stream()
+      KeyError: If card has no GUID field
+    """
+    guid = card.guid
+    self._tag_index = None
+    self._deck_trie = None
+    self._fingerprint = None
+    if isinstance(self.cards, SqliteCards):
+      self._check_guid_column()
+      # Positions of replaced rows are not known without a scan
+      self._text_index = None
+      if self.cards.replace_by_field(_GUID_FIELD_NAME, guid,
+                                     card.as_str_list()):
+        self._track_modified(guid)
+      else:
+        self.cards.append(card.as_str_list())
+        self._track_added(guid)
+      return
+    guid_index = self._guid_positions()
+    cards = self._mutable_cards()
+    position = guid_index.get(guid)
+    if position is None:
+      position = guid_index[guid] = len(cards)
+      if isinstance(cards, ColumnarCards):
+        cards.append(card.as_str_list())
+      else:
+        cards.append(card)
+      self._track_added(guid)
+    else:
+      if isinstance(cards, ColumnarCards):
+        cards[position] = card.as_str_list()
+      else:
+        cards[position] = card
+      self._track_modified(guid)
+    if self._text_index is not None:
+      self._text_index.add(position, card.fields)
+
+  def remove_by_guid(self, guid: str) -> None:
+    """Remove the card with a GUID from the deck. Cards after it keep their
+    order. Keeps the GUID index consistent and records the GUID as removed,
+    see removed_guids. Use remove_by_guids() to remove many cards, which
+    updates the GUID index once rather than once per card.
+
+    Args:
+      guid: The GUID of the card.
+
+    Raises:
+      KeyError: If no card has the GUID guid
+      ValueError: If the header does not specify a GUID column
+      TypeError: If the cards are streamed, see open_stream()
+    """
+    self.remove_by_guids([guid])
+
+  def remove_by_guids(self, guids: Iterable[str]) -> None:
+    """Remove the cards with any of the GUIDs from the deck. Cards which remain
+    keep their order. Every GUID is checked before any card is removed, and
+    the GUID index is updated in one pass. Records the GUIDs as removed, see
+    removed_guids.
+
+    Args:
+      guids: The GUIDs of the cards. Repeated GUIDs are removed once.
+
+    Raises:
+      KeyError: If no card has one of the GUIDs
+      ValueError: If the header does not specify a GUID column
+      TypeError: If the cards are streamed, see open_stream()
+    """
+    guids = list(dict.fromkeys(guids))
+    self._tag_index = None
+    self._deck_trie = None
+    self._fingerprint = None
+    # Positions after the removed cards shift, so the index is rebuilt
+    self._text_index = None
+    if isinstance(self.cards, SqliteCards):
+      self._check_guid_column()
+      for guid in guids:
+        if self.cards.get_by_field(_GUID_FIELD_NAME, guid) is None:
+          raise KeyError(guid)
+      for guid in guids:
+        self.cards.delete_by_field(_GUID_FIELD_NAME, guid)
+        self._track_removed(guid)
+      return
+    guid_index = self._guid_positions()
+    removed_positions = sorted(guid_index[guid] for guid in guids)
+    cards = self._mutable_cards()
+    for guid in guids:
+      del guid_index[guid]
+    for position in reversed(removed_positions):
+      del cards[position]
+    for other_guid, other_position in guid_index.items():
+      guid_index[other_guid] = other_position - bisect.bisect_left(
+          removed_positions, other_position)
+    for guid in guids:
+      self._track_removed(guid)
+
+  def _track_added(self, guid: str) -> None:
+    self._reconcile_tracked_guids()
+    self._removed_guids.discard(guid)
+    self._added_guids.add(guid)
+
+  def _track_modified(self, guid: str) -> None:
+    self._reconcile_tracked_guids()
+    if guid not in self._added_guids:
+      self._modified_guids.add(guid)
+
+  def _track_removed(self, guid: str) -> None:
+    self._reconcile_tracked_guids()
+    self._modified_guids.discard(guid)
+    if guid in self._added_guids:
+      self._added_guids.discard(guid)
+    else:
+      self._removed_guids.add(guid)
+
+  @property
+  def removed_guids(self) -> frozenset[str]:
+    """The GUIDs of cards removed through remove_by_guid() or
+    remove_by_guids() since the deck was loaded or last checkpointed. Cards
+    both added and removed since then are not included."""
+    self._reconcile_tracked_guids()
+    return frozenset(self._removed_guids)
+
+  def changed_cards(self) -> list[AnkiCard]:
+    """Return the cards added or modified since the deck was loaded or last
+    checkpointed, in card order.
+
+    A card is changed if it was stored through upsert(), or if set_field() was
+    called on it in place. The latter only applies to cards stored as
+    DeckStorage.ROWS or DeckStorage.COLUMNAR, as SqliteCards yields copies.
+
+    Returns:
+      The changed cards.
+    """
+    self._reconcile_tracked_guids()
+    tracked_guids = self._added_guids | self._modified_guids
+    if not tracked_guids or self.header.get('guid_idx') is None:
+      return [card for card in self if card.is_modified]
+    return [
+        card for card in self if card.is_modified or card.guid in tracked_guids
+    ]
+
+  def checkpoint(self) -> None:
+    """Forget all changes made so far. changed_cards() and removed_guids
+    only report changes made after this call."""
+    self._added_guids.clear()
+    self._modified_guids.clear()
+    self._removed_guids.clear()
+    self._tracked_guids_stale = False
+    if isinstance(self.cards, list):
+      for card in self.cards:
+        card.mark_clean()
+    elif isinstance(self.cards, ColumnarCards):
+      self.cards.mark_clean()
+
+  def delta(self) -> Self:
+    """Return a deck with the same header holding only changed_cards(). Anki
+    updates existing notes by GUID, so importing the delta applies the changes
+    without rewriting unchanged cards. Removals cannot be expressed in a notes
+    file; see removed_guids.
+
+    Returns:
+      A new gaggle.AnkiDeck of the changed cards.
+    """
+    return type(self)(dict(self.header), self.changed_cards())
+
+  def fingerprint(self) -> bytes:
+    """Return the root of a Merkle tree over the fingerprints of the cards, in
+    card order. Two decks have the same fingerprint if and only if they hold
+    the same field values in the same order, barring hash collisions.
+
+    The root is cached on the deck. Card fingerprints are cached on each card
+    and reset by set_field(), so for cards stored as DeckStorage.ROWS the
+    cached root is reused if every card returns the same fingerprint object as
+    when the root was computed; after an edit only the edited card is rehashed.
+    ColumnarCards and SqliteCards count their modifications, and the root is
+    reused while the count is unchanged. upsert(), remove_by_guid(), and
+    transform() discard the cached root. Streamed cards are always rehashed.
+
+    Returns:
+      A digest of the cards. See gaggle.digest.merkle_root().
+    """
+    cards = self.cards
+    if isinstance(cards, (ColumnarCards, SqliteCards)):
+      if (self._fingerprint is None or self._fingerprint_source is not cards or
+          self._fingerprint_version != cards.version):
+        self._fingerprint = digest.merkle_root(
+            card.fingerprint for card in cards)
+        self._fingerprint_source = cards
+        self._fingerprint_version = cards.version
+        self._fingerprint_leaves = []
+      return self._fingerprint
+    if isinstance(cards, list):
+      leaves = [card.fingerprint for card in cards]
+      if (self._fingerprint is None or self._fingerprint_source is not None or
+          len(leaves) != len(self._fingerprint_leaves) or
+          not all(map(operator.is_, leaves, self._fingerprint_leaves))):
+        self._fingerprint = digest.merkle_root(leaves)
+        self._fingerprint_leaves = leaves
+        self._fingerprint_source = None
+      return self._fingerprint
+    return digest.merkle_root(card.fingerprint for card in self)
+
+  def card_fingerprints(self) -> dict[str, bytes]:
+    """Return the fingerprint of each card keyed by GUID. Store the result to
+    later find the cards changed since, see cards_changed_from().
+
+    Returns:
+      A dictionary mapping each GUID to the fingerprint of its card.
+
+    Raises:
+      ValueError: If the header does not specify a GUID column
+    """
+    self._check_guid_column()
+    return {card.guid: card.fingerprint for card in self}
+
+  def cards_changed_from(self, fingerprints: Mapping[str,
+                                                     bytes]) -> list[AnkiCard]:
+    """Return the cards which are new or whose fields changed, compared with
+    fingerprints previously returned by card_fingerprints(). Compares digests
+    rather than field values.
+
+    Args:
+      fingerprints: A mapping of GUID to card fingerprint.
+
+    Returns:
+      The cards whose GUID is missing from fingerprints, or whose fingerprint
+      differs, in card order.
+
+    Raises:
+      ValueError: If the header does not specify a GUID column
+    """
+    self._check_guid_column()
+    return [
+        card for card in self if fingerprints.get(card.guid) != card.fingerprint
+    ]
+
+  def transform(
+      self,
+      transforms: Mapping[str, FieldTransform],
+      workers: int | None = None,
+      executor: ExecutorType | str = ExecutorType.PROCESS,
+      chunk_size: int = _DEFAULT_TRANSFORM_CHUNK_SIZE,
+  ) -> None:
+    """Replace the value of fields by applying a function to each value. The
+    cards are divided into chunks of chunk_size cards, and only the values of
+    the transformed fields are passed to each chunk. Results are written back
+    in card order. Cards whose values change are recorded as modified, see
+    changed_cards().
+
+    A chunk which raises keeps its original values; the remaining chunks are
+    still transformed.
+
+    Args:
+      transforms: A mapping of field name to the function applied to each value
+      of that field. Each function receives the current value and returns the
+      new value.
+      workers: The maximum number of chunks transformed at once. If None or 1,
+      chunks are transformed sequentially in this thread.
+      executor: 'process' transforms chunks in separate processes, 'thread' in
+      separate threads of this process. See ExecutorType. Falls back to
+      sequential transformation if executor is 'process' and transforms cannot
+      be pickled, such as lambdas or locally defined functions.
+      chunk_size: The number of cards transformed by each task.
+
+    Raises:
+      CardsNotTransformedException: If any chunk raised, after all other chunks
+      have been written back. Maps the positions of each failed chunk to the
+      raised exception.
+      KeyError: If a card has no field named in transforms
+      TypeError: If the cards are streamed or stored as DeckStorage.SQLITE
+      ValueError: If executor is not a supported ExecutorType, or chunk_size is
+      not positive
+    """
+    if chunk_size < 1:
+      raise ValueError(f'Expected a positive chunk_size but instead got '
+                       f'{chunk_size}')
+    executor = ExecutorType(executor)
+    self._fingerprint = None
+    cards = self._mutable_cards()
+    transforms = dict(transforms)
+    chunks = [
+        range(start, min(start + chunk_size, len(cards)))
+        for start in range(0, len(cards), chunk_size)
+    ]
+    chunk_columns = (
+        self._chunk_columns(cards, chunk, transforms) for chunk in chunks)
+    failures: dict[range, Exception] = {}
+    is_sequential = workers is None or workers <= 1 or (
+        executor is ExecutorType.PROCESS and not _is_picklable(transforms))
+    if is_sequential:
+      for chunk, columns in zip(chunks, chunk_columns):
+        try:
+          results = _transform_columns(transforms, columns)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+          failures[chunk] = e
+        else:
+          self._write_back_columns(cards, chunk, results)
+    else:
+      with _new_executor(executor, workers) as pool:
+        futures = [
+            pool.submit(_transform_columns, transforms, columns)
+            for columns in chunk_columns
+        ]
+        for chunk, future in zip(chunks, futures):
+          try:
+            results = future.result()
+          except Exception as e:  # pylint: disable=broad-exception-caught
+            failures[chunk] = e
+          else:
+            self._write_back_columns(cards, chunk, results)
+    self.reindex()
+    if failures:
+      raise exceptions.CardsNotTransformedException(failures)
+
+  @staticmethod
+  def _chunk_columns(cards: list[AnkiCard] | ColumnarCards, chunk: range,
+                     field_names: Iterable[str]) -> dict[str, list[str]]:
+    if isinstance(cards, ColumnarCards):
+      return {
+          field_name: cards.column(field_name)[chunk.start:chunk.stop]
+          for field_name in field_names
+      }
+    return {
+        field_name: [
+            cards[position].get_field(field_name) for position in chunk
+        ] for field_name in field_names
+    }
+
+  def _write_back_columns(self, cards: list[AnkiCard] | ColumnarCards,
+                          chunk: range,
+                          results: Mapping[str, Sequence[str]]) -> None:
+    for offset, position in enumerate(chunk):
+      card = cards[position]
+      is_changed = False
+      for field_name, values in results.items():
+        if card.get_field(field_name) != values[offset]:
+          card.set_field(field_name, values[offset])
+          is_changed = True
+      if is_changed and self.header.get('guid_idx') is not None:
+        self._track_modified(card.guid)
+
+  def validate(
+      self,
+      sample_size: int = _DEFAULT_VALIDATION_SAMPLE_SIZE) -> ValidationReport:
+    """Check every card of the deck in one pass and aggregate the problems
+    found.
+
+    Reports the field name diagnostics collected while resolving the
+    FieldLayout of the cards (see _resolve_unique_field_names()) against every
+    card using that layout, rows whose number of fields differs from the most
+    common number, reserved columns named by the header but missing from a row,
+    and empty or duplicate GUIDs.
+
+    Cards are streamed rather than collected, so streamed decks are validated
+    in constant memory apart from the set of GUIDs seen. As the most common
+    number of fields is only known at the end, the number of rows and the
+    first sample_size rows of each width are kept until then.
+
+    Args:
+      sample_size: The maximum number of sample rows kept per issue.
+
+    Returns:
+      A gaggle.ValidationReport of the deck.
+
+    Raises:
+      ValueError: If sample_size is negative
+    """
+    report = ValidationReport(sample_size)
+    width_counts: collections.Counter[int] = collections.Counter()
+    width_sample_rows: dict[int, list[int]] = {}
+    reserved_names = [
+        name for name, key in _RESERVED_FIELD_HEADER_KEYS.items()
+        if self.header.get(key) is not None
+    ]
+    # Field name issues are shared by every card of a layout
+    layout_issues: dict[int, dict[ValidationIssue, list[str]]] = {}
+    seen_guids: set[str] = set()
+    for row, card in enumerate(self):
+      report.num_rows += 1
+      layout = card.layout
+      issues = layout_issues.get(id(layout))
+      if issues is None:
+        issues = layout_issues[id(layout)] = {}
+        for diagnostic in layout.diagnostics:
+          issues.setdefault(_FIELD_NAME_ISSUES[type(diagnostic)],
+                            []).append(str(diagnostic))
+      for issue, messages in issues.items():
+        report.add(issue, row, *messages)
+      width = len(layout.names)
+      width_counts[width] += 1
+      sample_rows = width_sample_rows.setdefault(width, [])
+      if len(sample_rows) < sample_size:
+        sample_rows.append(row)
+      for name in reserved_names:
+        if name not in layout.index:
+          report.add(ValidationIssue.MISSING_RESERVED_COLUMN, row,
+                     f'Missing {name} column')
+      if _GUID_FIELD_NAME in layout.index:
+        guid = card.guid
+        if not guid:
+          report.add(ValidationIssue.EMPTY_GUID, row)
+        elif guid in seen_guids:
+          report.add(ValidationIssue.DUPLICATE_GUID, row)
+        else:
+          seen_guids.add(guid)
+    if width_counts:
+      common_width = width_counts.most_common(1)[0][0]
+      other_widths = [width for width in width_counts if width != common_width]
+      report.add_rows(
+          ValidationIssue.INCONSISTENT_ROW_WIDTH,
+          sum(width_counts[width] for width in other_widths),
+          itertools.chain.from_iterable(
+              width_sample_rows[width] for width in other_widths),
+          *(f'Expected {common_width} fields but instead got {width}'
+            for width in other_widths))
+    return report
+
+  def get_header_setting(
+      self,
+      setting_name: str,
+      default: Any = None,
+  ) -> str | int:
+    """Return the value of a header setting, referenced by name
+
+    Args:
+      setting_name: String representing the name of the setting, as named in
+      Gaggle representation. A conversion from Anki naming to Gaggle naming can
+      be referenced in _ANKI_EXPORT_HEADER_MAPPING.
+      default: The value to return if no header setting with the given name is
+      found.
+
+    Returns:
+      The found setting as stored. Else, default if a setting by name
+      setting_name is not found.
+    """
+    return self.header.get(setting_name, default)
+
+  def write_header(self, f: SupportsWrite[str]) -> None:
+    """Outputs header settings stored in self.header.
+
+    Setting a header value to None will prevent it from being output.
+
+    Args:
+      f: A stream implementing write(). See Gaggle.write_deck_to_file() for an
+      example using open().
+
+    Raises:
+      KeyError: If AnkiDeck.header contains a header name not supported by
+      reformat_header_settings()
+    """
+    header_symbol = _ANKI_EXPORT_HEADER_LINE_SYMBOL
+    header_seperator = _ANKI_EXPORT_HEADER_DELIMITER_SYMBOL
+    header_copy = _copy_and_reformat(
+        self.header, direction=ReformatDirection.GAGGLE_TO_ANKI)
+    for setting_name in _ANKI_ORDERED_HEADER:
+      setting_value = header_copy.get(setting_name)
+      if setting_value is not None:
+        header_line = (f'{header_symbol}{setting_name}'
+                       f'{header_seperator}{setting_value}\n')
+        f.write(header_line)
+
+  def write_as_tsv(self, f: SupportsWrite[str]) -> None:
+    """Outputs header settings associated with deck. Then outputs the data
+    fields of each AnkiCard stored in self.cards. One card per row.
+
+    Requires only a stream to improve reusability as a public API. See
+    Gaggle.write_deck_to_file() for a simpler setup.
+
+    Args:
+      f: A stream implementing write(). See Gaggle.write_deck_to_file() for an
+      example using open().
+
+    Raises:
+      io.UnsupportedOperation: If write permission is not given by f.
+    """
+    self.write_header(f)
+    w = csv.writer(f, dialect=_ANKI_EXPORT_CONTENT_DIALECT)
+    if isinstance(self.cards, SqliteCards):
+      w.writerows(self.cards.iter_rows())
+      return
+    for card in self.cards:
+      card.write_as_tsv(w)
+
+  def write_as_apkg(self, f: StrOrBytesPath | IO[bytes]) -> None:
+    """Outputs the deck as an Anki package (.apkg), which Anki imports without
+    parsing text. Each card becomes one note, using the GUID, Note Type, Deck,
+    and Tags columns given by self.header. The remaining columns are the fields
+    of every note type. See gaggle.apkg.write_package() for more information.
+
+    Args:
+      f: The path or binary stream the package is written to.
+    """
+    field_names: tuple[str, ...] = ()
+    records: Iterable[Sequence[str]] = ()
+    if isinstance(self.cards, SqliteCards):
+      field_names = self.cards.field_names
+      records = self.cards.iter_rows()
+    elif isinstance(self.cards, ColumnarCards):
+      field_names = self.cards.field_names
+      records = (card.as_str_list() for card in self.cards)
+    else:
+      cards = iter(self)
+      first_card = next(cards, None)
+      if first_card is not None:
+        field_names = first_card.layout.names
+        records = (
+            card.as_str_list() for card in itertools.chain([first_card], cards))
+    apkg.write_package(
+        f,
+        field_names,
+        records,
+        guid_idx=self._header_index('guid_idx'),
+        note_type_idx=self._header_index('note_type_idx'),
+        deck_idx=self._header_index('deck_idx'),
+        tags_idx=self._header_index('tags_idx'),
+    )
+
+  def _header_index(self, setting_name: str) -> int | None:
+    idx = self.header.get(setting_name)
+    return idx if isinstance(idx, int) else None
+
+
+class ColumnarCards:
+  """Cards of a deck stored as one contiguous column per field.
+
+  Column scans, such as reading every GUID, do not create any AnkiCard.
+  Indexing and iteration create a ColumnarCardView for each row, which writes
+  set_field() back into the columns. Every row must have the same number of
+  fields.
+
+  Values of the Note Type, Deck, and Tags columns are interned, as these are
+  typically repeated across many cards.
+  """
+  _interned_names = frozenset(['Note Type', 'Deck', 'Tags'])
+
+  def __init__(self, schema: FieldSchema):
+    """
+    Args:
+      schema: The field naming shared by each card.
+    """
+    self.schema = schema
+    self._layout: FieldLayout | None = None
+    self._columns: list[list[str]] = []
+    self._is_interned: list[bool] = []
+    self._modified_rows: set[int] = set()
+    self._version = 0
+
+  @classmethod
+  def from_records(
+      cls,
+      records: Iterable[Sequence[str]],
+      schema: FieldSchema,
+  ) -> Self:
+    """Factory method to create ColumnarCards from delimited rows.
+
+    Args:
+      records: The values of each card, in read order.
+      schema: The field naming shared by each card.
+
+    Returns:
+      A gaggle.ColumnarCards holding every record.
+
+    Raises:
+      ValueError: If the records do not all have the same number of fields
+    """
+    columnar_cards = cls(schema)
+    for record in records:
+      columnar_cards.append(record)
+    return columnar_cards
+
+  @classmethod
+  def from_columns(
+      cls,
+      columns: Sequence[list[str]],
+      schema: FieldSchema,
+  ) -> Self:
+    """Factory method to create ColumnarCards from the values of each column.
+    The lists are stored without copying, except for interned columns.
+
+    Args:
+      columns: The values of each field, in read order. Must not be used
+      after this call.
+      schema: The field naming shared by each card.
+
+    Returns:
+      A gaggle.ColumnarCards holding every row of columns.
+
+    Raises:
+      ValueError: If the columns do not all have the same number of values
+    """
+    columnar_cards = cls(schema)
+    if not columns:
+      return columnar_cards
+    num_rows = len(columns[0])
+    if any(len(column) != num_rows for column in columns):
+      raise ValueError(f'Expected {num_rows} values in every column but '
+                       f'instead got {[len(column) for column in columns]}')
+    columnar_cards._initialise_columns(len(columns))
+    columnar_cards._columns = [
+        list(map(sys.intern, column)) if is_interned else column
+        for column, is_interned in zip(columns, columnar_cards._is_interned)
+    ]
+    columnar_cards._version += 1
+    return columnar_cards
+
+  def _initialise_columns(self, width: int) -> FieldLayout:
+    layout = self.schema.layout_for(width)
+    self._layout = layout
+    self._columns = [[] for _ in layout.names]
+    self._is_interned = [name in self._interned_names for name in layout.names]
+    return layout
+
+  def append(self, values: Sequence[str]) -> None:
+    """Add a row to the end of the columns.
+
+    Args:
+      values: The values of one card, in read order.
+
+    Raises:
+      ValueError: If values does not have the same number of fields as the
+      existing rows
+    """
+    layout = self._layout
+    if layout is None:
+      layout = self._initialise_columns(len(values))
+    if len(values) != len(layout.names):
+      raise ValueError(f'Expected {len(layout.names)} fields but instead got '
+                       f'{len(values)}')
+    for column, is_interned, value in zip(self._columns, self._is_interned,
+                                          values):
+      column.append(sys.intern(value) if is_interned else value)
+    self._version += 1
+
+  @property
+  def field_names(self) -> tuple[str, ...]:
+    if self._layout is None:
+      return ()
+    return self._layout.names
+
+  @property
+  def version(self) -> int:
+    """Incremented each time a row is added, replaced, modified, or deleted.
+    Changes made directly to a list returned by column() are not counted."""
+    return self._version
+
+  def column(self, field_name: str) -> list[str]:
+    """Return the stored column of a field.
+
+    Args:
+      field_name: The name of the field.
+
+    Returns:
+      The value of field_name for each row, in read order.
+
+    Raises:
+      KeyError: If no field with the name field_name exists
+    """
+    if self._layout is None:
+      raise KeyError(field_name)
+    return self._columns[self._layout.index[field_name]]
+
+  def __len__(self) -> int:
+    if not self._columns:
+      return 0
+    return len(self._columns[0])
+
+  def __getitem__(self, idx: int) -> ColumnarCardView:
+    if self._layout is None:
+      raise IndexError('ColumnarCards index out of range')
+    position = range(len(self))[idx]
+    values = tuple(column[position] for column in self._columns)
+    return ColumnarCardView.from_row(values, self._layout, self, position)
+
+  def set_value(self, idx: int, field_name: str, value: str) -> None:
+    """Replace one value of a row and mark the row as modified, see
+    ColumnarCardView.
+
+    Raises:
+      IndexError: If idx is out of range
+      KeyError: If no field with the name field_name exists
+    """
+    if self._layout is None:
+      raise IndexError('ColumnarCards index out of range')
+    column_idx = self._layout.index[field_name]
+    position = range(len(self))[idx]
+    self._columns[column_idx][position] = (
+        sys.intern(value) if self._is_interned[column_idx] else value)
+    self._modified_rows.add(position)
+    self._version += 1
+
+  def is_modified(self, idx: int) -> bool:
+    """Whether a value of the row was replaced through set_value() since the
+    row was added or the rows were last marked clean."""
+    return idx in self._modified_rows
+
+  def mark_clean(self, idx: int | None = None) -> None:
+    """Forget modifications of a row, or of every row if idx is None."""
+    if idx is None:
+      self._modified_rows.clear()
+    else:
+      self._modified_rows.discard(idx)
+
+  def __setitem__(self, idx: int, values: Sequence[str]) -> None:
+    """Replace the values of a row.
+
+    Raises:
+      IndexError: If idx is out of range
+      ValueError: If values does not have the same number of fields as the
+      existing rows
+    """
+    if self._layout is None:
+      raise IndexError('ColumnarCards index out of range')
+    if len(values) != len(self._layout.names):
+      raise ValueError(f'Expected {len(self._layout.names)} fields but instead '
+                       f'got {len(values)}')
+    for column, is_interned, value in zip(self._columns, self._is_interned,
+                                          values):
+      column[idx] = sys.intern(value) if is_interned else value
+    self._version += 1
+
+  def __delitem__(self, idx: int) -> None:
+    if self._layout is None:
+      raise IndexError('ColumnarCards index out of range')
+    position = range(len(self))[idx]
+    for column in self._columns:
+      del column[position]
+    self._version += 1
+    self._modified_rows = {
+        row if row < position else row - 1
+        for row in self._modified_rows
+        if row != position
+    }
+
+  def __iter__(self) -> Iterator[ColumnarCardView]:
+    layout = self._layout
+    if layout is None:
+      return
+    for position, values in enumerate(zip(*self._columns)):
+      yield ColumnarCardView.from_row(values, layout, self, position)
+
+
+class SqliteCards:
+  """Cards of a deck stored as rows of a SQLite database, for decks which do
+  not fit in memory.
+
+  Each field is stored in its own column and the columns holding reserved
+  fields (GUID, Note Type, Deck, and Tags) are indexed. Rows are inserted in
+  batched transactions and read back through a cursor, so iteration holds at
+  most one batch of rows in memory. Iteration creates an AnkiCard for each row;
+  modifications made to these cards are not written back to the database. Every
+  row must have the same number of fields.
+
+  By default the database is temporary: SQLite keeps it in a private file which
+  is deleted when the connection is closed. Close the connection with close(),
+  by using SqliteCards as a context manager, or through AnkiDeck.close();
+  otherwise it stays open until the SqliteCards is garbage collected.
+
+  Attributes:
+    schema: The field naming shared by each card.
+    batch_size: The number of rows inserted per transaction and fetched per
+    cursor read.
+  """
+  _table_name = 'cards'
+  _indexed_names = frozenset(['GUID', 'Note Type', 'Deck', 'Tags'])
+
+  def __init__(self,
+               schema: FieldSchema,
+               database: StrOrBytesPath = '',
+               batch_size: int = 10_000):
+    """
+    Args:
+      schema: The field naming shared by each card.
+      database: The path of the database file. The default, an empty string,
+      creates a temporary database.
+      batch_size: The number of rows inserted per transaction and fetched per
+      cursor read.
+    """
+    self.schema = schema
+    self.batch_size = batch_size
+    self._layout: FieldLayout | None = None
+    self._version = 0
+    self._num_rows = 0
+    # Rowids of the rows in read order, once a deletion leaves gaps in them.
+    # Until then, the row at position idx has rowid idx + 1
+    self._rowids: array.array[int] | None = None
+    self._rowids_version = 0
+    self._has_deleted_rows = False
+    # Cards may be read from a different thread, see AnkiDeck.aiter_cards()
+    self._connection = sqlite3.connect(database, check_same_thread=False)
+
+  @classmethod
+  def from_records(
+      cls,
+      records: Iterable[Sequence[str]],
+      schema: FieldSchema,
+  ) -> Self:
+    """Factory method to create SqliteCards from delimited rows. Records are
+    consumed one batch at a time.
+
+    Args:
+      records: The values of each card, in read order.
+      schema: The field naming shared by each card.
+
+    Returns:
+      A gaggle.SqliteCards holding every record.
+
+    Raises:
+      ValueError: If the records do not all have the same number of fields
+    """
+    sqlite_cards = cls(schema)
+    sqlite_cards.extend(records)
+    return sqlite_cards
+
+  @staticmethod
+  def _column_name(idx: int) -> str:
+    return f'field{idx}'
+
+  def _initialise_table(self, width: int) -> FieldLayout:
+    if not width:
+      raise ValueError('Expected at least one field but instead got an empty '
+                       'row. SqliteCards cannot store rows without fields.')
+    layout = self.schema.layout_for(width)
+    columns = ', '.join(
+        f'{self._column_name(idx)} TEXT NOT NULL' for idx in range(width))
+    with self._connection:
+      self._connection.execute(f'CREATE TABLE {self._table_name} '
+                               f'(rowid INTEGER PRIMARY KEY, {columns})')
+    self._layout = layout
+    return layout
+
+  def _create_indexes(self, layout: FieldLayout) -> None:
+    with self._connection:
+      for idx, name in enumerate(layout.names):
+        if name in self._indexed_names:
+          column_name = self._column_name(idx)
+          self._connection.execute(
+              f'CREATE INDEX IF NOT EXISTS {self._table_name}_{column_name} '
+              f'ON {self._table_name} ({column_name})')
+
+  def extend(self, records: Iterable[Sequence[str]]) -> None:
+    """Add rows to the end of the table, one transaction per batch. Indexes are
+    created once all rows are inserted, as building them afterwards is faster
+    than maintaining them during a bulk insert.
+
+    Args:
+      records: The values of each card, in read order.
+
+    Raises:
+      ValueError: If a record does not have the same number of fields as the
+      existing rows, or the first record has no fields
+    """
+    records = iter(records)
+    layout = self._layout
+    while batch := _take(records, self.batch_size):
+      if layout is None:
+        layout = self._initialise_table(len(batch[0]))
+      width = len(layout.names)
+      for record in batch:
+        if len(record) != width:
+          raise ValueError(f'Expected {width} fields but instead got '
+                           f'{len(record)}')
+      placeholders = ', '.join('?' * width)
+      with self._connection:
+        self._connection.executemany(
+            f'INSERT INTO {self._table_name} VALUES (NULL, {placeholders})',
+            batch)
+      self._num_rows += len(batch)
+      self._version += 1
+    if layout is not None:
+      self._create_indexes(layout)
+
+  def append(self, values: Sequence[str]) -> None:
+    """Add a row to the end of the table.
+
+    Args:
+      values: The values of one card, in read order.
+
+    Raises:
+      ValueError: If values does not have the same number of fields as the
+      existing rows
+    """
+    self.extend([values])
+
+  @property
+  def field_names(self) -> tuple[str, ...]:
+    if self._layout is None:
+      return ()
+    return self._layout.names
+
+  @property
+  def version(self) -> int:
+    """Incremented each time rows are added, replaced, or deleted."""
+    return self._version
+
+  def column(self, field_name: str) -> list[str]:
+    """Read the values of a field from the database.
+
+    Args:
+      field_name: The name of the field.
+
+    Returns:
+      The value of field_name for each row, in read order.
+
+    Raises:
+      KeyError: If no field with the name field_name exists
+    """
+    if self._layout is None:
+      raise KeyError(field_name)
+    column_name = self._column_name(self._layout.index[field_name])
+    cursor = self._connection.execute(
+        f'SELECT {column_name} FROM {self._table_name} ORDER BY rowid')
+    return [value for value, in cursor]
+
+  def iter_rows(self) -> Iterator[tuple[str, ...]]:
+    """Stream the values of each row from a cursor, without creating any
+    AnkiCard.
+
+    Yields:
+      The values of each row, in read order.
+    """
+    if self._layout is None:
+      return
+    cursor = self._connection.execute(
+        f'SELECT {self._columns(self._layout)} FROM {self._table_name} '
+        f'ORDER BY rowid')
+    try:
+      while rows := cursor.fetchmany(self.batch_size):
+        yield from rows
+    finally:
+      cursor.close()
+
+  def close(self) -> None:
+    """Close the database connection. A temporary database is deleted."""
+    self._connection.close()
+
+  def __enter__(self) -> Self:
+    return self
+
+  def __exit__(self, exc_type: type[BaseException] | None,
+               exc_value: BaseException | None,
+               traceback: TracebackType | None) -> None:
+    self.close()
+
+  def __len__(self) -> int:
+    return self._num_rows
+
+  def _columns(self, layout: FieldLayout) -> str:
+    return ', '.join(self._column_name(idx) for idx in range(len(layout.names)))
+
+  def __getitem__(self, idx: int) -> AnkiCard:
+    length = len(self)
+    if idx < 0:
+      idx += length
+    if self._layout is None or not 0 <= idx < length:
+      raise IndexError('SqliteCards index out of range')
+    values = self._connection.execute(
+        f'SELECT {self._columns(self._layout)} FROM {self._table_name} '
+        f'WHERE rowid = ?', (self._rowid(idx),)).fetchone()
+    return AnkiCard.from_layout(values, self._layout)
+
+  def _rowid(self, idx: int) -> int:
+    """Returns the rowid of the row at position idx. Deleting rows leaves gaps
+    in the rowids, so after a deletion the rowids are read once and reused
+    until the rows next change."""
+    if not self._has_deleted_rows:
+      return idx + 1
+    if self._rowids is None or self._rowids_version != self._version:
+      cursor = self._connection.execute(
+          f'SELECT rowid FROM {self._table_name} ORDER BY rowid')
+      self._rowids = array.array('q', (rowid for rowid, in cursor))
+      self._rowids_version = self._version
+    return self._rowids[idx]
+
+  def get_by_field(self, field_name: str, value: str) -> AnkiCard | None:
+    """Return the first row whose field has a value. Uses the index of the
+    column if field_name is a reserved field.
+
+    Args:
+      field_name: The name of the field.
+      value: The value to match.
+
+    Returns:
+      An AnkiCard holding a copy of the row, or None if no row matches.
+
+    Raises:
+      KeyError: If no field with the name field_name exists
+    """
+    if self._layout is None:
+      return None
+    column_name = self._column_name(self._layout.index[field_name])
+    values = self._connection.execute(
+        f'SELECT {self._columns(self._layout)} FROM {self._table_name} '
+        f'WHERE {column_name} = ? ORDER BY rowid LIMIT 1', (value,)).fetchone()
+    if values is None:
+      return None
+    return AnkiCard.from_layout(values, self._layout)
+
+  def replace_by_field(self, field_name: str, value: str,
+                       values: Sequence[str]) -> bool:
+    """Replace every row whose field has a value.
+
+    Args:
+      field_name: The name of the field.
+      value: The value to match.
+      values: The new values of the matching rows.
+
+    Returns:
+      Whether any row was replaced.
+
+    Raises:
+      KeyError: If no field with the name field_name exists
+      ValueError: If values does not have the same number of fields as the
+      existing rows
+    """
+    if self._layout is None:
+      return False
+    width = len(self._layout.names)
+    if len(values) != width:
+      raise ValueError(f'Expected {width} fields but instead got '
+                       f'{len(values)}')
+    column_name = self._column_name(self._layout.index[field_name])
+    assignments = ', '.join(
+        f'{self._column_name(idx)} = ?' for idx in range(width))
+    with self._connection:
+      cursor = self._connection.execute(
+          f'UPDATE {self._table_name} SET {assignments} '
+          f'WHERE {column_name} = ?', (*values, value))
+    self._version += 1
+    return cursor.rowcount > 0
+
+  def delete_by_field(self, field_name: str, value: str) -> int:
+    """Delete every row whose field has a value.
+
+    Args:
+      field_name: The name of the field.
+      value: The value to match.
+
+    Returns:
+      The number of rows deleted.
+
+    Raises:
+      KeyError: If no field with the name field_name exists
+    """
+    if self._layout is None:
+      return 0
+    column_name = self._column_name(self._layout.index[field_name])
+    with self._connection:
+      cursor = self._connection.execute(
+          f'DELETE FROM {self._table_name} WHERE {column_name} = ?', (value,))
+    self._version += 1
+    if cursor.rowcount:
+      self._num_rows -= cursor.rowcount
+      self._has_deleted_rows = True
+    return cursor.rowcount
+
+  def __iter__(self) -> Iterator[AnkiCard]:
+    layout = self._layout
+    if layout is None:
+      return
+    for values in self.iter_rows():
+      yield AnkiCard.from_layout(values, layout)
+
+
+def _transform_columns(
+    transforms: Mapping[str, FieldTransform],
+    columns: Mapping[str, Sequence[str]]) -> dict[str, list[str]]:
+  """Worker function of AnkiDeck.transform(). Applies each function to every
+  value of its column.
+
+  Returns:
+    The transformed values of each column, in the order of columns.
+  """
+  return {
+      field_name: [transforms[field_name](value) for value in values]
+      for field_name, values in columns.items()
+  }
+
+
+def _is_picklable(obj: Any) -> bool:
+  try:
+    pickle.dumps(obj)
+  except (pickle.PicklingError, AttributeError, TypeError):
+    return False
+  return True
+
+
+def _reconcile_cards(cards: Iterable[AnkiCard]) -> AnkiDeck:
+  """Builds a deck of cards with differing FieldLayouts, using the union of
+  their field names. Layouts are shared by the cards of a deck, so each
+  distinct layout is only resolved once."""
+  cards = list(cards)
+  layouts: dict[int, FieldLayout] = {}
+  for card in cards:
+    layouts.setdefault(id(card.layout), card.layout)
+  union_names: dict[str, None] = {}
+  for layout in layouts.values():
+    union_names.update(dict.fromkeys(layout.names))
+  has_html = any(layout.has_html for layout in layouts.values())
+  union_layout = FieldLayout(tuple(union_names), has_html)
+  selections = {
+      layout_id: [layout.index.get(name) for name in union_layout.names]
+      for layout_id, layout in layouts.items()
+  }
+  reconciled_cards: list[AnkiCard] = []
+  for card in cards:
+    if card.layout.names == union_layout.names:
+      values = card.values
+    else:
+      values = tuple('' if idx is None else card.values[idx]
+                     for idx in selections[id(card.layout)])
+    reconciled_cards.append(AnkiCard.from_layout(values, union_layout))
+  header: AnkiHeader = {
+      _ANKI_EXPORT_HEADER_SETTING_SEPARATOR_NAME:
+          _ANKI_EXPORT_HEADER_SETTING_SEPARATOR_TSV_STRING,
+      'has_html':
+          HeaderBoolean.TRUE_ if has_html else HeaderBoolean.FALSE_,
+  }
+  for field_name, header_key in _RESERVED_FIELD_HEADER_KEYS.items():
+    idx = union_layout.index.get(field_name)
+    if idx is not None:
+      header[header_key] = idx
+  return AnkiDeck(header, reconciled_cards)
+
+
+def _take(iterator: Iterator[_T], n: int) -> list[_T]:
+  """Returns the next n values of iterator, or fewer if it is exhausted."""
+  return list(itertools.islice(iterator, n))
+
+
+def create_cards_from_tsv(
+    f: Iterable[str],
+    field_names: Iterable[str] | None = None,
+    header: AnkiHeader | None = None,
+) -> list[AnkiCard]:
+  """Breaks each entry of f using Excel TSV style rules. Then constructs an
+  AnkiCard from the delimited strings.
+
+  Args:
+    f: Typically a stream from builtin open()
+    field_names: The names to be used for each field per entry in f. Used for
+    reference only. See documentation for _resolve_unique_field_names() for
+    more information.
+    header: The settings with which to initialise each AnkiCard.
+
+  Returns:
+    A list of AnkiCards. Useful for constructing an AnkiDeck.
+  """
+  return list(
+      generate_cards_from_tsv(f, field_names=field_names, header=header))
+
+
+def generate_cards_from_tsv(
+    f: Iterable[str],
+    field_names: Iterable[str] | None = None,
+    header: AnkiHeader | None = None,
+) -> Iterator[AnkiCard]:
+  """Lazy counterpart of create_cards_from_tsv(). Each entry of f is only read
+  once the previous AnkiCard has been consumed.
+
+  Args:
+    f: Typically a stream from builtin open()
+    field_names: The names to be used for each field per entry in f. Resolved
+    once into a FieldSchema shared by every AnkiCard. See documentation for
+    _resolve_unique_field_names() for more information.
+    header: The settings with which to initialise each AnkiCard.
+
+  Yields:
+    An AnkiCard for each entry of f, in read order.
+  """
+  if header is None:
+    header = {}
+  schema = FieldSchema.from_header(header, field_names)
+  cards = csv.reader(f, dialect=_ANKI_EXPORT_CONTENT_DIALECT)
+  for card in cards:
+    yield AnkiCard.from_schema(card, schema)
+
+
+def _resolve_unique_field_names(
+    field_names: Iterator[str] | Iterable[str],
+    fields: Iterator[Any] | Iterable[Any],
+    indexes_reserved_names: Mapping[int, str],
+    seen_names: set[str],
+    diagnostics: list[Warning],
+) -> Iterator[str]:
+  """Generator for field names; prevents duplicate names from being returned.
+  Problems with field_names are appended to diagnostics rather than warned,
+  see FieldLayout.diagnostics.
+
+  When a field name is omitted, Generic name 'Field{idx}' is assigned. idx
+  begins at 0 and corresponds to read-in order of field values.
+
+  The length of field_names is not required to match the length of fields.
+  Missing names will be generated with a default and extra names will be
+  discarded.
+
+  Args:
+    field_names: The names which should be set for each delimited field in the
+      parsed file. Used for reference, does not modify read contents. Use any
+      Falsy value to apply a default field name.
+    fields: The fields to be named. Used as a reference for length, not
+      modified. Iterator is exhausted.
+    indexes_reserved_names: An index representing the column to which assign
+      the corresponding reserved name.
+    seen_names: Names designated as unique and cannot be assigned through
+      field_names. Should always contain at least RESERVED_FIELD_NAMES for
+      assumptions of class properties to hold. May contain extra values to be
+      protected (i.e. prevented from being assigned).
+    diagnostics: Receives a warning for each problem with field_names:
+      DuplicateWarning: If field_names contains a name specified by
+        reserved_names, or a duplicate value.
+      LeftoverArgumentWarning: If field_names contains more values than fields
+      HeaderFieldNameMismatchWarning: If field_names contains a non-empty
+        string which contradicts a value specified by indexes_reserved_names.
+        Takes precedence over DuplicateWarning when both apply.
+
+  Yields:
+    Unique values from field_names
+
+  Raises:
+    ValueError: If an index-bound default name is reserved before a field would
+      have used that name. For example, naming Field0 "Field2" and then having
+      no field name specified for Field2.
+  """
+  field_names = iter(field_names)
+  fields = iter(fields)
+  for count in itertools.count():
+    name = next(field_names, None)
+    field_to_be_named = next(fields, None)
+    if field_to_be_named is None:
       if name is not None:
-        warnings.warn(
+        diagnostics.append(
             exceptions.LeftoverArgumentWarning.from_values(
                 [name],
                 field_names,
@@ -863,7 +3832,7 @@ def _generate_unique_field_names(field_names: Iterator[str] | Iterable[str],
       return
     if (reserved_name := indexes_reserved_names.get(count)) is not None:
       if name and name != reserved_name:
-        warnings.warn(
+        diagnostics.append(
             exceptions.HeaderFieldNameMismatchWarning(
                 overwritten_value=name,
                 replacement_value=reserved_name,
@@ -871,7 +3840,7 @@ def _generate_unique_field_names(field_names: Iterator[str] | Iterable[str],
       yield reserved_name
     else:
       if name in seen_names:
-        warnings.warn(
+        diagnostics.append(
             exceptions.DuplicateWarning('field name', f'{name}',
                                         f'Field{count}'))
         name = None
@@ -884,7 +3853,36 @@ def _generate_unique_field_names(field_names: Iterator[str] | Iterable[str],
       seen_names.add(name)
 
 
-def _generate_field_dict(
+# Stack depth when resolving lazy evaluation in _generate_field_dict()
+_stack_levels_to_anki_card_init_call = 4
+
+
+@propagate_warnings_from_generator(_stack_levels_to_anki_card_init_call)
+def _generate_unique_field_names(field_names: Iterator[str] | Iterable[str],
+                                 fields: Iterator[Any] | Iterable[Any],
+                                 indexes_reserved_names: Mapping[int, str],
+                                 seen_names: set[str]) -> Iterator[str]:
+  """Counterpart of _resolve_unique_field_names() which warns of each problem
+  with field_names once all names are generated, instead of collecting them.
+
+  Raises:
+    ValueError: See documentation for _resolve_unique_field_names()
+    DuplicateWarning: Raised in two situations. If field_names contains a name
+      specified by reserved_names. If field_names contains a duplicate value.
+    LeftoverArgumentWarning: If field_names contains more values than fields
+    HeaderFieldNameMismatchWarning: If field_names contains a non-empty string
+      which contradicts a value specified by indexes_reserved_names. Takes
+      precedence over DuplicateWarning when both apply.
+  """
+  diagnostics: list[Warning] = []
+  yield from _resolve_unique_field_names(field_names, fields,
+                                         indexes_reserved_names, seen_names,
+                                         diagnostics)
+  for diagnostic in diagnostics:
+    warnings.warn(diagnostic)
+
+
+def _generate_field_dict(  # pyright: ignore [reportUnusedFunction]
     field_names: Iterator[str] | Iterable[str],
     fields: Iterator[_S] | Iterable[_S],
     indexes_reserved_names: Mapping[int, str],
@@ -901,15 +3899,12 @@ def _generate_field_dict(
     Named values whose iteration order is the same as read from file.
 
   Raises:
-    ValueError: If an index-bound default name is reserved before a field would
-      have used that name. For example, naming Field0 "Field2" and then having
-      no field name specified for Field2.
-    DuplicateWarning: Raised in two situations. If field_names contains a name
-      specified by reserved_names. If field_names contains a duplicate value.
-    LeftoverArgumentWarning: If field_names contains more values than fields
-    HeaderFieldNameMismatchWarning: If field_names contains a non-empty string
-      which contradicts a value specified by indexes_reserved_names. Takes
-      precedence over DuplicateWarning when both apply.
+    ValueError: See documentation for _resolve_unique_field_names()
+    DuplicateWarning: See documentation for _generate_unique_field_names()
+    LeftoverArgumentWarning: See documentation for
+      _generate_unique_field_names()
+    HeaderFieldNameMismatchWarning: See documentation for
+      _generate_unique_field_names()
   """
   field_names = _generate_unique_field_names(field_names, fields,
                                              indexes_reserved_names, seen_names)
@@ -943,6 +3938,167 @@ def _parse_anki_header_bool(bool_as_str: str) -> bool:
                      f'{bool_as_str}')
 
 
+class FieldSchema:
+  """The field names shared by every AnkiCard of a deck.
+
+  Reserved names are assigned by the header settings and the remaining names
+  are taken from field_names or generated as 'Field{idx}'. Names are resolved
+  once per row length and cached as a FieldLayout. Problems found during
+  resolution are not warned; they are kept by the layout and reported once per
+  card by AnkiDeck.validate().
+
+  Attributes:
+    field_names: The user supplied names. See documentation for
+    _resolve_unique_field_names() for details on usage and structure.
+    has_html: Whether the field values of the deck contain HTML.
+    reserved_names: A mapping of column index to the reserved name assigned to
+    it by the header.
+  """
+
+  def __init__(self,
+               field_names: Iterable[str] | None = None,
+               has_html: str = HeaderBoolean.FALSE_,
+               tags_idx: int | None = None,
+               note_type_idx: int | None = None,
+               deck_idx: int | None = None,
+               guid_idx: int | None = None):
+    """
+    Args:
+      field_names: Strings representing the name of each field in each card.
+      has_html: Anki header boolean. See _parse_anki_header_bool().
+      tags_idx: The column index of the Tags field
+      note_type_idx: The column index of the Note Type field
+      deck_idx: The column index of the Deck field
+      guid_idx: The column index of the GUID field
+
+    Raises:
+      ValueError: If has_html is not a boolean as represented by Anki
+    """
+    self.field_names: tuple[str, ...] = (
+        tuple(field_names) if field_names is not None else ())
+    self.has_html: bool = _parse_anki_header_bool(has_html)
+    property_indexes = [tags_idx, deck_idx, note_type_idx, guid_idx]
+    self.reserved_names: dict[int, str] = {
+        idx: name
+        for idx, name in zip(
+            property_indexes, RESERVED_FIELD_NAMES, strict=True)
+        if idx is not None
+    }
+    self._layouts: dict[int, FieldLayout] = {}
+
+  @classmethod
+  def from_header(
+      cls,
+      header: AnkiHeader,
+      field_names: Iterable[str] | None = None,
+  ) -> Self:
+    """Factory method to create a FieldSchema from header settings in Gaggle
+    format. The separator setting must not be present.
+
+    Args:
+      header: A mapping of setting names to setting values. See
+      parse_header_settings() for more information.
+      field_names: Strings representing the name of each field in each card.
+
+    Returns:
+      A gaggle.FieldSchema using the column indexes specified by header.
+    """
+    return cls(field_names,
+               **header)  # pyright: ignore [reportGeneralTypeIssues]
+
+  def layout_for(self, width: int) -> FieldLayout:
+    """Return the FieldLayout of a row containing width values. The layout is
+    only generated the first time a width is requested and is shared by every
+    AnkiCard of that width. Problems with field_names are not warned, they are
+    kept in FieldLayout.diagnostics and reported by AnkiDeck.validate().
+
+    Args:
+      width: The number of values in a row.
+
+    Returns:
+      The field names of the row and their index.
+
+    Raises:
+      ValueError: See documentation for _resolve_unique_field_names()
+    """
+    layout = self._layouts.get(width)
+    if layout is None:
+      diagnostics: list[Warning] = []
+      names = tuple(
+          _resolve_unique_field_names(self.field_names,
+                                      itertools.repeat('', width),
+                                      self.reserved_names,
+                                      set(RESERVED_FIELD_NAMES), diagnostics))
+      layout = FieldLayout(names, self.has_html, tuple(diagnostics))
+      self._layouts[width] = layout
+    return layout
+
+  def names_for(self, width: int) -> tuple[str, ...]:
+    """Return the field names of a row containing width values.
+
+    Args:
+      width: The number of values in a row.
+
+    Returns:
+      The unique name of each value of the row, in read order.
+
+    Raises:
+      ValueError: See documentation for _resolve_unique_field_names()
+    """
+    return self.layout_for(width).names
+
+
+class FieldLayout:
+  """The resolved field names of a row and a mapping of each name to its
+  position. Shared by AnkiCards so that each card stores only its values.
+
+  Attributes:
+    names: The unique name of each value of a row, in read order.
+    index: A mapping of field name to its position in names.
+    has_html: Whether the field values contain HTML.
+    diagnostics: The warnings raised while resolving names. See
+    _resolve_unique_field_names() for the possible warnings.
+  """
+  __slots__ = ('names', 'index', 'has_html', 'diagnostics')
+
+  def __init__(self,
+               names: tuple[str, ...],
+               has_html: bool = False,
+               diagnostics: tuple[Warning, ...] = ()):
+    self.names = names
+    self.index: dict[str, int] = {name: idx for idx, name in enumerate(names)}
+    self.has_html = has_html
+    self.diagnostics = diagnostics
+
+
+class CardFields(Mapping[str, str]):
+  """A view of the named values of an AnkiCard. Preserves read-in order.
+
+  Assigning to an existing field name updates the underlying AnkiCard. Field
+  names are fixed by the FieldLayout of the card and cannot be added or
+  removed.
+  """
+  __slots__ = ('_card',)
+
+  def __init__(self, card: AnkiCard):
+    self._card = card
+
+  def __getitem__(self, field_name: str) -> str:
+    return self._card.get_field(field_name)
+
+  def __setitem__(self, field_name: str, value: str) -> None:
+    self._card.set_field(field_name, value)
+
+  def __iter__(self) -> Iterator[str]:
+    return iter(self._card.layout.names)
+
+  def __len__(self) -> int:
+    return len(self._card.layout.names)
+
+  def __repr__(self) -> str:
+    return repr(self._card)
+
+
 class AnkiCard:
   """
   Anki Card fields as denoted by Anki documentation
@@ -951,7 +4107,9 @@ class AnkiCard:
   Permanent Reference [09 May 2023]:
   https://github.com/ankitects/anki-manual/blob/0aa372146d10e299631e361769f41533a6d4a417/src/importing.md?plain=1#L196-L220
   """
-  _reserved_names = ['Tags', 'Deck', 'Note Type', 'GUID']
+  __slots__ = ('_layout', '_values', '_is_modified', '_fingerprint')
+  # Kept for code reading the names from the class, see RESERVED_FIELD_NAMES
+  _reserved_names = RESERVED_FIELD_NAMES
 
   def __init__(self,
                fields: Iterable[str],
@@ -961,19 +4119,65 @@ class AnkiCard:
                note_type_idx: int | None = None,
                deck_idx: int | None = None,
                guid_idx: int | None = None):
-    if field_names is None:
-      field_names = ()
-    self.has_html: bool = _parse_anki_header_bool(has_html)
-    property_indexes = [tags_idx, deck_idx, note_type_idx, guid_idx]
-    reserved_names = {
-        index: name
-        for index, name in zip(
-            property_indexes, AnkiCard._reserved_names, strict=True)
-        if index is not None
-    }
-    reserved_name_set = set(AnkiCard._reserved_names)
-    self.fields: collections.OrderedDict[str, str] = _generate_field_dict(
-        field_names, fields, reserved_names, reserved_name_set)
+    schema = FieldSchema(field_names, has_html, tags_idx, note_type_idx,
+                         deck_idx, guid_idx)
+    values = tuple(fields)
+    self._layout: FieldLayout = schema.layout_for(len(values))
+    self._values: tuple[str, ...] = values
+    self._is_modified = False
+    self._fingerprint: bytes | None = None
+
+  @classmethod
+  def from_schema(cls, fields: Iterable[str], schema: FieldSchema) -> Self:
+    """Factory method to create an AnkiCard whose field names are resolved by an
+    existing FieldSchema. Skips the per-card name generation performed by
+    AnkiCard.__init__(); see create_cards_from_tsv() for usage.
+
+    Args:
+      fields: The values to be stored in the AnkiCard, in read order.
+      schema: The field naming shared by each card of a deck.
+
+    Returns:
+      A gaggle.AnkiCard holding fields.
+
+    Raises:
+      ValueError: See documentation for FieldSchema.names_for()
+    """
+    values = tuple(fields)
+    return cls.from_layout(values, schema.layout_for(len(values)))
+
+  @classmethod
+  def from_layout(cls, values: tuple[str, ...], layout: FieldLayout) -> Self:
+    """Factory method to create an AnkiCard from already resolved field names.
+
+    Args:
+      values: The values to be stored in the AnkiCard, in read order.
+      layout: The field names of values. Must have the same length as values.
+
+    Returns:
+      A gaggle.AnkiCard holding values.
+    """
+    card = cls.__new__(cls)
+    card._layout = layout
+    card._values = values
+    card._is_modified = False
+    card._fingerprint = None
+    return card
+
+  @property
+  def layout(self) -> FieldLayout:
+    """The field names of the AnkiCard, shared with other cards of its deck."""
+    return self._layout
+
+  @property
+  def has_html(self) -> bool:
+    return self._layout.has_html
+
+  @property
+  def fields(self) -> CardFields:
+    """A mapping of field name to field value. See CardFields documentation for
+    more information."""
+    return CardFields(self)
 
   @property
   def tags(self) -> str:
@@ -1035,10 +4239,53 @@ class AnkiCard:
     return self.get_field('GUID')
 
   def __repr__(self) -> str:
-    return str(self.fields)
+    return str(collections.OrderedDict(zip(self._layout.names, self._values)))
 
   def get_field(self, field_name: str) -> str:
-    return self.fields[field_name]
+    return self._values[self._layout.index[field_name]]
+
+  def set_field(self, field_name: str, value: str) -> None:
+    """Replace the value of an existing field. Marks the card as modified.
+
+    Args:
+      field_name: The name of the field to be replaced.
+      value: The new value of the field.
+
+    Raises:
+      KeyError: If no field with the name field_name exists
+    """
+    idx = self._layout.index[field_name]
+    values = list(self._values)
+    values[idx] = value
+    self._values = tuple(values)
+    self._is_modified = True
+    self._fingerprint = None
+
+  @property
+  def is_modified(self) -> bool:
+    """Whether set_field() was called since the card was created or last
+    marked clean. See AnkiDeck.checkpoint()."""
+    return self._is_modified
+
+  def mark_clean(self) -> None:
+    """Forget modifications made so far; is_modified becomes False."""
+    self._is_modified = False
+
+  @property
+  def fingerprint(self) -> bytes:
+    """A blake2b digest of the field values, stable across processes. Equal
+    values give equal fingerprints regardless of field names. Computed on first
+    access and cached until set_field() is called; see
+    gaggle.digest.fingerprint_values()."""
+    if self._fingerprint is None:
+      self._fingerprint = digest.fingerprint_values(self._values)
+    return self._fingerprint
+
+  @property
+  def values(self) -> tuple[str, ...]:
+    """The data fields of AnkiCard in read-in order. Unlike as_str_list(), the
+    values are not copied."""
+    return self._values
 
   def as_str_list(self) -> list[str]:
     """Return data fields of AnkiCard. Preserves read-in order.
@@ -1053,10 +4300,7 @@ class AnkiCard:
       [column0, column1, column2]
 
     """
-    str_list: list[str] = []
-    for field_value in self.fields.values():
-      str_list.append(field_value)
-    return str_list
+    return list(self._values)
 
   def write_as_tsv(self, w: SupportsWriteRow) -> None:
     """Output data fields of AnkiCard in TSV format.
@@ -1073,3 +4317,89 @@ class AnkiCard:
     """
     content = self.as_str_list()
     w.writerow(content)
+
+
+class ColumnarCardView(AnkiCard):
+  """An AnkiCard for one row of ColumnarCards. set_field() writes the new value
+  back into the columns, so cards stored as DeckStorage.COLUMNAR can be edited
+  in place like cards stored as DeckStorage.ROWS.
+
+  The view refers to its row by position. Once a row before it is deleted, the
+  view refers to a different row and must not be modified.
+  """
+  __slots__ = ('_rows', '_position')
+
+  @classmethod
+  def from_row(cls, values: tuple[str, ...], layout: FieldLayout,
+               rows: ColumnarCards, position: int) -> Self:
+    """Factory method to create a view of a row of rows.
+
+    Args:
+      values: The values of the row.
+      layout: The field names of the row.
+      rows: The columns holding the row.
+      position: The position of the row within rows.
+
+    Returns:
+      A gaggle.ColumnarCardView of the row.
+    """
+    card = cls.from_layout(values, layout)
+    card._rows = rows
+    card._position = position
+    card._is_modified = rows.is_modified(position)
+    return card
+
+  def set_field(self, field_name: str, value: str) -> None:
+    """Replace the value of an existing field, in the card and in its row.
+    Marks the card and its row as modified.
+
+    Raises:
+      KeyError: If no field with the name field_name exists
+    """
+    super().set_field(field_name, value)
+    self._rows.set_value(self._position, field_name, value)
+
+  def mark_clean(self) -> None:
+    super().mark_clean()
+    self._rows.mark_clean(self._position)
+
+
+class EncodedAnkiCard(AnkiCard):
+  """An AnkiCard which holds the encoded line of an unquoted row until a value
+  is first needed. The line is then decoded and split on tabs in one call, and
+  the encoded line is released. Until then the card holds one bytes object
+  instead of a str per field. See _parse_mapped_anki_export().
+  """
+  __slots__ = ('_encoded',)
+
+  @classmethod
+  def from_encoded(cls, encoded: bytes, schema: FieldSchema) -> Self:
+    """Factory method to create an AnkiCard from the line of an unquoted row.
+
+    Args:
+      encoded: The row, encoded as _ANKI_EXPORT_ENCODING, without its line
+      ending. Must not contain a quote character.
+      schema: The field naming shared by each card of a deck.
+
+    Returns:
+      A gaggle.EncodedAnkiCard whose values are decoded on first use.
+    """
+    # Tabs are single bytes in UTF-8, so fields can be counted undecoded
+    width = encoded.count(b'\t') + 1 if encoded else 0
+    card = cls.__new__(cls)
+    card._layout = schema.layout_for(width)
+    card._encoded = encoded
+    card._is_modified = False
+    card._fingerprint = None
+    return card
+
+  def __getattr__(self, name: str) -> Any:
+    # Only called while the _values slot is unset
+    if name != '_values':
+      raise AttributeError(
+          f'{type(self).__name__!r} object has no attribute {name!r}')
+    encoded = self._encoded
+    values = tuple(_split_unquoted_line(str(encoded, _ANKI_EXPORT_ENCODING)))
+    self._values = values
+    self._encoded = b''
+    return values
@@ -0,0 +1,487 @@
+# Copyright 2023 The Gaggle Authors. All Rights Reserved.
+#
+# This file is part of Gaggle.
+#
+# Gaggle is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Gaggle is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Gaggle. If not, see <https://www.gnu.org/licenses/>.
+"""Inverted indexes over the cards of a deck, answering queries without
+scanning every card."""
+from __future__ import annotations
+
+import html
+import re
+from typing import Generic, TypeVar, TYPE_CHECKING
+from collections.abc import Iterable, Iterator, Mapping
+
+if TYPE_CHECKING:
+  from _typeshed import SupportsRichComparison
+
+_K = TypeVar('_K', bound='SupportsRichComparison')
+_TAG_HIERARCHY_SEPARATOR = '::'
+_DECK_HIERARCHY_SEPARATOR = '::'
+_HTML_TAG_PATTERN = re.compile(r'<[^>]*>')
+_TOKEN_PATTERN = re.compile(r'\w+')
+_DEFAULT_NGRAM_LENGTH = 3
+
+
+def bitset_from_positions(positions: Iterable[int]) -> int:
+  """Builds a bitset with the bit of each position set. Positions are written
+  into a bytearray first, so the cost is linear in the largest position rather
+  than quadratic as with repeated int operations."""
+  bits = bytearray()
+  for position in positions:
+    byte_idx = position >> 3
+    if byte_idx >= len(bits):
+      bits.extend(bytes(byte_idx - len(bits) + 1))
+    bits[byte_idx] |= 1 << (position & 7)
+  return int.from_bytes(bits, 'little')
+
+
+def positions_from_bitset(bitset: int) -> Iterator[int]:
+  """Yields the position of each set bit of bitset, in increasing order."""
+  bits = bitset.to_bytes((bitset.bit_length() + 7) // 8, 'little')
+  for byte_idx, byte in enumerate(bits):
+    while byte:
+      lowest_bit = byte & -byte
+      yield (byte_idx << 3) + lowest_bit.bit_length() - 1
+      byte ^= lowest_bit
+
+
+class TagIndex:
+  """An inverted index of the tags of a deck, mapping each tag to the bitset
+  of card positions carrying it. Each distinct tag is assigned an integer id
+  once, and its positions are stored as a single int, so AND, OR, and NOT
+  queries are bitwise operations rather than scans of the Tags field.
+
+  Tags are matched case-insensitively, as in Anki. Hierarchical tags are
+  separated by '::'; querying a tag also matches every tag below it, so
+  'Language' matches 'Language::French'.
+
+  Attributes:
+    tag_names: The name of each tag, indexed by tag id, as first seen.
+    num_cards: The number of cards indexed.
+  """
+
+  def __init__(self):
+    self.tag_names: list[str] = []
+    self.num_cards = 0
+    self._tag_ids: dict[str, int] = {}
+    self._bitsets: list[int] = []
+    self._descendant_ids: dict[str, list[int]] = {}
+    self._prefix_bitsets: dict[str, int] = {}
+
+  @classmethod
+  def from_tags(cls, tags: Iterable[str]) -> TagIndex:
+    """Factory method to create a TagIndex in one pass over the Tags field of
+    each card.
+
+    Args:
+      tags: The space separated tags of each card, in card order.
+
+    Returns:
+      A gaggle.index.TagIndex of every card.
+    """
+    tag_index = cls()
+    postings: list[list[int]] = []
+    for position, card_tags in enumerate(tags):
+      for tag in card_tags.split():
+        tag_id = tag_index._intern(tag)
+        if tag_id == len(postings):
+          postings.append([])
+        postings[tag_id].append(position)
+      tag_index.num_cards = position + 1
+    tag_index._bitsets = [
+        bitset_from_positions(positions) for positions in postings
+    ]
+    return tag_index
+
+  def _intern(self, tag: str) -> int:
+    key = tag.casefold()
+    tag_id = self._tag_ids.get(key)
+    if tag_id is None:
+      tag_id = self._tag_ids[key] = len(self.tag_names)
+      self.tag_names.append(tag)
+      parts = key.split(_TAG_HIERARCHY_SEPARATOR)
+      for depth in range(1, len(parts)):
+        ancestor = _TAG_HIERARCHY_SEPARATOR.join(parts[:depth])
+        self._descendant_ids.setdefault(ancestor, []).append(tag_id)
+    return tag_id
+
+  def tag_id(self, tag: str) -> int | None:
+    """Returns the id of a tag, or None if no card carries it."""
+    return self._tag_ids.get(tag.casefold())
+
+  def bitset(self, tag: str) -> int:
+    """Returns the positions of the cards carrying a tag or any tag below it in
+    the hierarchy, as a bitset. Hierarchical results are cached.
+
+    Args:
+      tag: The tag to match, case-insensitively.
+
+    Returns:
+      An int with bit i set if card i matches. 0 if no card matches.
+    """
+    key = tag.casefold()
+    bitset = self._prefix_bitsets.get(key)
+    if bitset is None:
+      tag_id = self._tag_ids.get(key)
+      bitset = self._bitsets[tag_id] if tag_id is not None else 0
+      for descendant_id in self._descendant_ids.get(key, ()):
+        bitset |= self._bitsets[descendant_id]
+      self._prefix_bitsets[key] = bitset
+    return bitset
+
+  def query_bitset(
+      self,
+      all_of: Iterable[str] = (),
+      any_of: Iterable[str] = (),
+      none_of: Iterable[str] = ()
+  ) -> int:
+    """Returns the bitset of cards matching a tag query.
+
+    Args:
+      all_of: Tags every matching card carries.
+      any_of: Tags of which a matching card carries at least one. Ignored if
+      empty.
+      none_of: Tags no matching card carries.
+
+    Returns:
+      An int with bit i set if card i matches.
+    """
+    result = (1 << self.num_cards) - 1
+    for tag in all_of:
+      result &= self.bitset(tag)
+    any_of = list(any_of)
+    if any_of:
+      matches_any = 0
+      for tag in any_of:
+        matches_any |= self.bitset(tag)
+      result &= matches_any
+    for tag in none_of:
+      result &= ~self.bitset(tag)
+    return result
+
+  def query(
+      self,
+      all_of: Iterable[str] = (),
+      any_of: Iterable[str] = (),
+      none_of: Iterable[str] = ()
+  ) -> list[int]:
+    """Returns the positions of cards matching a tag query, in card order.
+    See query_bitset() for documentation of arguments."""
+    return list(
+        positions_from_bitset(self.query_bitset(all_of, any_of, none_of)))
+
+
+class _DeckTrieNode(Generic[_K]):
+  __slots__ = ('children', 'keys', 'count', 'subtree_keys')
+
+  def __init__(self):
+    self.children: dict[str, _DeckTrieNode[_K]] = {}
+    self.keys: list[_K] = []
+    self.count = 0
+    self.subtree_keys: list[_K] | None = None
+
+
+class DeckTrie(Generic[_K]):
+  """A trie over the '::' separated components of deck names, such as
+  'A::B::C'. Each card is stored under the node of its deck, and every node
+  keeps the number of cards in its subtree, so subtree selection, counting,
+  and listing child decks do not rescan the cards.
+
+  Cards are identified by a sortable key: their position for a single deck, or
+  a (deck index, position) pair for a gaggle.Gaggle.
+
+  The empty deck name refers to the root, which holds every card.
+  """
+
+  def __init__(self):
+    self._root: _DeckTrieNode[_K] = _DeckTrieNode()
+
+  @classmethod
+  def from_names(cls, deck_names: Iterable[str]) -> DeckTrie[int]:
+    """Factory method to create a DeckTrie in one pass over the Deck field of
+    each card.
+
+    Args:
+      deck_names: The deck name of each card, in card order.
+
+    Returns:
+      A gaggle.index.DeckTrie keyed by card position.
+    """
+    deck_trie: DeckTrie[int] = DeckTrie()
+    for position, deck_name in enumerate(deck_names):
+      deck_trie.add(deck_name, position)
+    return deck_trie
+
+  @staticmethod
+  def _split(deck_name: str) -> list[str]:
+    if not deck_name:
+      return []
+    return deck_name.split(_DECK_HIERARCHY_SEPARATOR)
+
+  def _find(self, deck_name: str) -> _DeckTrieNode[_K] | None:
+    node = self._root
+    for component in self._split(deck_name):
+      child = node.children.get(component)
+      if child is None:
+        return None
+      node = child
+    return node
+
+  def add(self, deck_name: str, key: _K) -> None:
+    """Store a card under a deck, creating any missing decks of its path.
+
+    Args:
+      deck_name: The full name of the deck of the card.
+      key: The key identifying the card.
+    """
+    node = self._root
+    node.count += 1
+    node.subtree_keys = None
+    for component in self._split(deck_name):
+      child = node.children.get(component)
+      if child is None:
+        child = node.children[component] = _DeckTrieNode()
+      node = child
+      node.count += 1
+      node.subtree_keys = None
+    node.keys.append(key)
+
+  def __contains__(self, deck_name: str) -> bool:
+    return self._find(deck_name) is not None
+
+  def count(self, deck_name: str = '') -> int:
+    """Returns the number of cards in a deck and all of its subdecks, or 0 if
+    the deck does not exist."""
+    node = self._find(deck_name)
+    return node.count if node is not None else 0
+
+  def keys(self, deck_name: str = '') -> list[_K]:
+    """Returns the keys of the cards in a deck and all of its subdecks, in
+    sorted order. The result is cached until a card is added to the subtree.
+
+    Args:
+      deck_name: The full name of the deck.
+
+    Returns:
+      The sorted keys, or an empty list if the deck does not exist.
+    """
+    node = self._find(deck_name)
+    if node is None:
+      return []
+    if node.subtree_keys is None:
+      subtree_keys: list[_K] = []
+      stack = [node]
+      while stack:
+        current = stack.pop()
+        subtree_keys.extend(current.keys)
+        stack.extend(current.children.values())
+      subtree_keys.sort()
+      node.subtree_keys = subtree_keys
+    return list(node.subtree_keys)
+
+  def children(self, deck_name: str = '') -> list[str]:
+    """Returns the full names of the direct subdecks of a deck, in the order
+    they were first seen, or an empty list if the deck does not exist."""
+    node = self._find(deck_name)
+    if node is None:
+      return []
+    prefix = f'{deck_name}{_DECK_HIERARCHY_SEPARATOR}' if deck_name else ''
+    return [f'{prefix}{component}' for component in node.children]
+
+  def counts(self, deck_name: str = '') -> dict[str, int]:
+    """Returns the number of cards in the subtree of each direct subdeck of a
+    deck, keyed by the full name of the subdeck."""
+    node = self._find(deck_name)
+    if node is None:
+      return {}
+    prefix = f'{deck_name}{_DECK_HIERARCHY_SEPARATOR}' if deck_name else ''
+    return {
+        f'{prefix}{component}': child.count
+        for component, child in node.children.items()
+    }
+
+
+def normalise_text(text: str, has_html: bool = False) -> str:
+  """Prepares a field value for searching: removes HTML tags and entities when
+  has_html is True, then folds case."""
+  if has_html:
+    text = html.unescape(_HTML_TAG_PATTERN.sub(' ', text))
+  return text.casefold()
+
+
+def tokenize(text: str) -> list[str]:
+  """Splits normalised text into word tokens."""
+  return _TOKEN_PATTERN.findall(text)
+
+
+def ngrams(text: str, length: int = _DEFAULT_NGRAM_LENGTH) -> set[str]:
+  """Returns the distinct substrings of text with the given length."""
+  return {text[idx:idx + length] for idx in range(len(text) - length + 1)}
+
+
+class TextIndex:
+  """An inverted index over the values of selected fields, for token and
+  substring search.
+
+  For each field, every card position is posted under the tokens and n-grams of
+  its normalised value. Token queries intersect the postings of each token.
+  Substring queries intersect the postings of each n-gram of the query and
+  then confirm the candidates against the stored value, so they only scan
+  values which can match. Queries shorter than the n-gram length scan the
+  stored values directly.
+
+  Cards can be added and removed one at a time, so the index is kept up to
+  date without being rebuilt.
+
+  Attributes:
+    field_names: The indexed fields, in ranking order.
+    has_html: Whether values are stripped of HTML before indexing.
+    ngram_length: The length of the n-grams used for substring queries.
+  """
+
+  def __init__(self,
+               field_names: Iterable[str],
+               has_html: bool = False,
+               ngram_length: int = _DEFAULT_NGRAM_LENGTH):
+    """
+    Args:
+      field_names: The indexed fields. Results matching an earlier field rank
+      before results matching only a later field.
+      has_html: Whether values are stripped of HTML before indexing.
+      ngram_length: The length of the n-grams used for substring queries.
+
+    Raises:
+      ValueError: If ngram_length is less than 1
+    """
+    if ngram_length < 1:
+      raise ValueError(f'Expected a positive ngram_length but instead got '
+                       f'{ngram_length}')
+    self.field_names = tuple(field_names)
+    self.has_html = has_html
+    self.ngram_length = ngram_length
+    self._texts: list[dict[int, str]] = [{} for _ in self.field_names]
+    self._tokens: list[dict[str, set[int]]] = [{} for _ in self.field_names]
+    self._ngrams: list[dict[str, set[int]]] = [{} for _ in self.field_names]
+
+  def __len__(self) -> int:
+    if not self._texts:
+      return 0
+    return len(self._texts[0])
+
+  def __contains__(self, position: int) -> bool:
+    return bool(self._texts) and position in self._texts[0]
+
+  def add(self, position: int, fields: Mapping[str, str]) -> None:
+    """Index the fields of a card. A card already indexed at position is
+    replaced.
+
+    Args:
+      position: The position of the card.
+      fields: The values of the card, keyed by field name, such as
+      AnkiCard.fields.
+
+    Raises:
+      KeyError: If fields is missing an indexed field
+    """
+    if position in self:
+      self.remove(position)
+    for texts, tokens, field_ngrams, field_name in zip(self._texts,
+                                                       self._tokens,
+                                                       self._ngrams,
+                                                       self.field_names):
+      text = normalise_text(fields[field_name], self.has_html)
+      texts[position] = text
+      for token in tokenize(text):
+        tokens.setdefault(token, set()).add(position)
+      for ngram in ngrams(text, self.ngram_length):
+        field_ngrams.setdefault(ngram, set()).add(position)
+
+  def remove(self, position: int) -> None:
+    """Remove the card at position from the index.
+
+    Raises:
+      KeyError: If no card is indexed at position
+    """
+    for texts, tokens, field_ngrams in zip(self._texts, self._tokens,
+                                           self._ngrams):
+      text = texts.pop(position)
+      for token in tokenize(text):
+        postings = tokens.get(token)
+        if postings is not None:
+          postings.discard(position)
+          if not postings:
+            del tokens[token]
+      for ngram in ngrams(text, self.ngram_length):
+        postings = field_ngrams[ngram]
+        postings.discard(position)
+        if not postings:
+          del field_ngrams[ngram]
+
+  def _match_tokens(self, field_idx: int, query: str) -> set[int]:
+    query_tokens = tokenize(query)
+    if not query_tokens:
+      return set()
+    tokens = self._tokens[field_idx]
+    postings = sorted((tokens.get(token, set()) for token in query_tokens),
+                      key=len)
+    return set(postings[0]).intersection(*postings[1:])
+
+  def _match_substring(self, field_idx: int, query: str) -> set[int]:
+    if not query:
+      return set()
+    texts = self._texts[field_idx]
+    if len(query) < self.ngram_length:
+      return {position for position, text in texts.items() if query in text}
+    field_ngrams = self._ngrams[field_idx]
+    postings = sorted((field_ngrams.get(ngram, set())
+                       for ngram in ngrams(query, self.ngram_length)),
+                      key=len)
+    candidates = set(postings[0]).intersection(*postings[1:])
+    return {position for position in candidates if query in texts[position]}
+
+  def search(self,
+             query: str,
+             substring: bool = False,
+             field_names: Iterable[str] | None = None) -> list[int]:
+    """Find the cards whose indexed fields match a query.
+
+    Args:
+      query: The text to find. Folded to match case-insensitively.
+      substring: If False, a field matches when it contains every word token
+      of query. If True, a field matches when it contains query as a
+      substring.
+      field_names: Restricts the search to these indexed fields. Searches
+      every indexed field if None.
+
+    Returns:
+      The positions of matching cards, ranked by the first field in
+      field_names order that matches, then by position.
+
+    Raises:
+      ValueError: If a name in field_names is not an indexed field
+    """
+    query = query.casefold()
+    if field_names is None:
+      field_idxs = range(len(self.field_names))
+    else:
+      field_idxs = sorted(
+          self.field_names.index(field_name) for field_name in field_names)
+    match = self._match_substring if substring else self._match_tokens
+    ranked: list[int] = []
+    seen: set[int] = set()
+    for field_idx in field_idxs:
+      matches = match(field_idx, query) - seen
+      ranked.extend(sorted(matches))
+      seen |= matches
+    return ranked
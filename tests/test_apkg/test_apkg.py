@@ -0,0 +1,292 @@
+# Copyright 2023 The Gaggle Authors. All Rights Reserved.
+#
+# This file is part of Gaggle.
+#
+# Gaggle is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Gaggle is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Gaggle. If not, see <https://www.gnu.org/licenses/>.
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=redefined-outer-name
+import json
+import os.path
+import sqlite3
+import zipfile
+
+import pytest
+
+from gaggle import apkg
+from gaggle import gaggle
+
+BASIC_MODEL_ID = 1001
+CLOZE_MODEL_ID = 1002
+DEFAULT_DECK_ID = 1
+SUB_DECK_ID = 2
+NOTES = [
+    # id, guid, mid, flds, tags, deck id of first card
+    (1, 'guid0', BASIC_MODEL_ID, 'front0\x1fback0', ' tag0 tag1 ', SUB_DECK_ID),
+    (2, 'guid1', CLOZE_MODEL_ID, '{{c1::cloze}}', '', DEFAULT_DECK_ID),
+]
+
+
+def make_legacy_collection(path, notes=NOTES):
+  """Creates the tables of a schema 11 collection read by AnkiPackage."""
+  models = {
+      str(BASIC_MODEL_ID): {
+          'name': 'Basic',
+          'flds': [{
+              'name': 'Front'
+          }, {
+              'name': 'Back'
+          }]
+      },
+      str(CLOZE_MODEL_ID): {
+          'name': 'Cloze',
+          'flds': [{
+              'name': 'Text'
+          }]
+      },
+  }
+  decks = {
+      str(DEFAULT_DECK_ID): {
+          'name': 'Default'
+      },
+      str(SUB_DECK_ID): {
+          'name': 'Parent::Child'
+      },
+  }
+  connection = sqlite3.connect(path)
+  with connection:
+    connection.execute('CREATE TABLE col (models TEXT, decks TEXT)')
+    connection.execute('INSERT INTO col VALUES (?, ?)',
+                       (json.dumps(models), json.dumps(decks)))
+    connection.execute('CREATE TABLE notes (id INTEGER PRIMARY KEY, guid TEXT, '
+                       'mid INTEGER, flds TEXT, tags TEXT)')
+    connection.execute('CREATE TABLE cards (id INTEGER PRIMARY KEY, '
+                       'nid INTEGER, did INTEGER, ord INTEGER)')
+    for note_id, guid, model_id, fields, tags, deck_id in notes:
+      connection.execute('INSERT INTO notes VALUES (?, ?, ?, ?, ?)',
+                         (note_id, guid, model_id, fields, tags))
+      connection.execute('INSERT INTO cards VALUES (NULL, ?, ?, 0)',
+                         (note_id, deck_id))
+  connection.close()
+  return path
+
+
+@pytest.fixture
+def collection_file(tmp_path):
+  return make_legacy_collection(tmp_path / 'collection.anki2')
+
+
+@pytest.fixture
+def package_file(tmp_path, collection_file):
+  package_path = tmp_path / 'deck.apkg'
+  with zipfile.ZipFile(package_path, 'w') as package:
+    package.write(collection_file, 'collection.anki2')
+    package.writestr('media', '{}')
+  return package_path
+
+
+EXPECTED_ROWS = [
+    ['guid0', 'Basic', 'Parent::Child', 'front0', 'back0', 'tag0 tag1'],
+    ['guid1', 'Cloze', 'Default', '{{c1::cloze}}', '', ''],
+]
+
+
+class TestAnkiPackage:
+
+  def test_iterate_records_collection(self, collection_file):
+    with apkg.AnkiPackage(collection_file) as package:
+      assert list(package.iterate_records()) == EXPECTED_ROWS
+
+  def test_iterate_records_package(self, package_file):
+    with apkg.AnkiPackage(package_file) as package:
+      assert list(package.iterate_records(batch_size=1)) == EXPECTED_ROWS
+
+  def test_header_tags_column_follows_widest_note_type(self, collection_file):
+    with apkg.AnkiPackage(collection_file) as package:
+      assert package.header()['tags column'] == 6
+
+  def test_close_removes_extracted_collection(self, package_file):
+    package = apkg.AnkiPackage(package_file)
+    temporary_directory = package._temporary_directory
+    assert temporary_directory is not None
+    package.close()
+    assert not os.path.exists(temporary_directory)
+
+  def test_compressed_collection_only_raises_value_error(self, tmp_path):
+    package_path = tmp_path / 'deck.apkg'
+    with zipfile.ZipFile(package_path, 'w') as package:
+      package.writestr('collection.anki21b', b'')
+    with pytest.raises(ValueError):
+      apkg.AnkiPackage(package_path)
+
+  def test_compressed_collection_with_placeholder_raises_value_error(
+      self, tmp_path):
+    placeholder_file = make_legacy_collection(
+        tmp_path / 'placeholder.anki2',
+        notes=[(1, 'placeholder', BASIC_MODEL_ID, 'Please update\x1f', '',
+                DEFAULT_DECK_ID)])
+    package_path = tmp_path / 'deck.apkg'
+    with zipfile.ZipFile(package_path, 'w') as package:
+      package.write(placeholder_file, 'collection.anki2')
+      package.writestr('collection.anki21b', b'')
+      package.writestr('media', '{}')
+    with pytest.raises(ValueError, match='collection.anki21b'):
+      apkg.AnkiPackage(package_path)
+
+  def test_missing_file_raises_file_not_found_error(self, tmp_path):
+    with pytest.raises(FileNotFoundError):
+      apkg.AnkiPackage(tmp_path / 'missing.apkg')
+
+
+class TestFromApkg:
+
+  def test_from_apkg_rows(self, package_file):
+    deck = gaggle.AnkiDeck.from_apkg(package_file)
+    assert [card.as_str_list() for card in deck] == EXPECTED_ROWS
+
+  def test_from_apkg_reserved_fields(self, package_file):
+    card = next(iter(gaggle.AnkiDeck.from_apkg(package_file)))
+    assert card.guid == 'guid0'
+    assert card.note_type == 'Basic'
+    assert card.deck_name == 'Parent::Child'
+    assert card.tags == 'tag0 tag1'
+
+  def test_from_apkg_header(self, package_file):
+    deck = gaggle.AnkiDeck.from_apkg(package_file)
+    assert deck.header == {
+        'separator': 'tab',
+        'has_html': 'true',
+        'guid_idx': 0,
+        'note_type_idx': 1,
+        'deck_idx': 2,
+        'tags_idx': 5,
+    }
+
+  def test_from_apkg_columnar(self, package_file):
+    deck = gaggle.AnkiDeck.from_apkg(
+        package_file, storage=gaggle.DeckStorage.COLUMNAR)
+    assert deck.column('Note Type') == ['Basic', 'Cloze']
+
+
+class TestWritePackage:
+
+  @pytest.fixture
+  def written_package(self, tmp_path, package_file):
+    deck = gaggle.AnkiDeck.from_apkg(package_file)
+    written_path = tmp_path / 'written.apkg'
+    deck.write_as_apkg(written_path)
+    return written_path
+
+  def test_round_trip(self, written_package):
+    deck = gaggle.AnkiDeck.from_apkg(written_package)
+    assert [card.as_str_list() for card in deck] == EXPECTED_ROWS
+
+  def test_package_members(self, written_package):
+    with zipfile.ZipFile(written_package) as package:
+      assert sorted(package.namelist()) == ['collection.anki2', 'media']
+
+  def test_collection_is_valid_legacy_collection(self, tmp_path,
+                                                 written_package):
+    with zipfile.ZipFile(written_package) as package:
+      package.extract('collection.anki2', tmp_path)
+    connection = sqlite3.connect(tmp_path / 'collection.anki2')
+    try:
+      assert connection.execute('PRAGMA integrity_check').fetchone() == ('ok',)
+      (version,) = connection.execute('SELECT ver FROM col').fetchone()
+      (decks,) = connection.execute('SELECT decks FROM col').fetchone()
+      sort_fields = connection.execute(
+          'SELECT sfld FROM notes ORDER BY id').fetchall()
+    finally:
+      connection.close()
+    assert version == 11
+    deck_names = {deck['name'] for deck in json.loads(decks).values()}
+    assert deck_names == {'Default', 'Parent', 'Parent::Child'}
+    assert sort_fields == [('front0',), ('{{c1::cloze}}',)]
+
+  def test_write_tsv_deck_as_apkg(self, tmp_path):
+    exported_file = tmp_path / 'deck.txt'
+    exported_file.write_text(
+        '#separator:tab\n#html:true\n#guid column:1\n#notetype column:2\n'
+        '#deck column:3\n#tags column:6\n'
+        'g0\tBasic\tDefault\tf0\tb0\ttag0\n'
+        'g1\tBasic\tOther\tf1\tb1\t\n',
+        encoding='utf-8')
+    deck = gaggle.AnkiDeck.from_file(exported_file)
+    written_path = tmp_path / 'written.apkg'
+    deck.write_as_apkg(written_path)
+    written_deck = gaggle.AnkiDeck.from_apkg(written_path)
+    assert written_deck.column('GUID') == deck.column('GUID')
+    assert written_deck.column('Tags') == deck.column('Tags')
+
+  def test_reopened_collection_invariants(self, tmp_path):
+    exported_file = tmp_path / 'deck.txt'
+    exported_file.write_text(
+        '#separator:tab\n#html:true\n#guid column:1\n#notetype column:2\n'
+        '#deck column:3\n#tags column:6\n'
+        'g0\tBasic\tA::B\tf0\tb0\ttag0\n'
+        'g1\tCloze\tA\tf1\tb1\t\n'
+        'g2\tBasic\tC\tf2\tb2\ttag1 tag2\n',
+        encoding='utf-8')
+    written_path = tmp_path / 'written.apkg'
+    gaggle.AnkiDeck.from_file(exported_file).write_as_apkg(written_path)
+    with zipfile.ZipFile(written_path) as package:
+      package.extract('collection.anki2', tmp_path)
+    connection = sqlite3.connect(tmp_path / 'collection.anki2')
+    try:
+      models, decks = connection.execute(
+          'SELECT models, decks FROM col').fetchone()
+      notes = connection.execute(
+          'SELECT id, guid, mid, flds FROM notes').fetchall()
+      cards = connection.execute(
+          'SELECT id, nid, did, ord FROM cards').fetchall()
+    finally:
+      connection.close()
+    models = json.loads(models)
+    decks = json.loads(decks)
+    assert all(int(key) == model['id'] for key, model in models.items())
+    assert all(int(key) == deck['id'] for key, deck in decks.items())
+    note_ids = {note_id for note_id, *_ in notes}
+    assert len(note_ids) == len(notes) == 3
+    assert len({guid for _, guid, *_ in notes}) == len(notes)
+    assert {int(key) for key in models}.isdisjoint(note_ids)
+    assert {int(key) for key in decks}.isdisjoint(note_ids)
+    assert {int(key) for key in models}.isdisjoint(int(key) for key in decks)
+    for _, _, model_id, fields in notes:
+      assert len(fields.split('\x1f')) == len(models[str(model_id)]['flds'])
+    assert len({card_id for card_id, *_ in cards}) == len(cards)
+    assert sorted(note_id for _, note_id, _, _ in cards) == sorted(note_ids)
+    assert all(str(deck_id) in decks for _, _, deck_id, _ in cards)
+    assert {deck['name'] for deck in decks.values()
+           } == {'Default', 'A', 'A::B', 'C'}
+
+  def test_write_empty_deck(self, tmp_path):
+    deck = gaggle.AnkiDeck({}, [])
+    written_path = tmp_path / 'written.apkg'
+    deck.write_as_apkg(written_path)
+    assert not list(gaggle.AnkiDeck.from_apkg(written_path))
+
+  def test_gaggle_write_deck_to_file_apkg(self, tmp_path, package_file):
+    test_gaggle = gaggle.Gaggle()
+    test_gaggle.add_deck(gaggle.AnkiDeck.from_apkg(package_file))
+    test_gaggle.write_deck_to_file(
+        0, 'deck', file_type='.apkg', destination=str(tmp_path))
+    deck = gaggle.AnkiDeck.from_apkg(tmp_path / 'deck.apkg')
+    assert [card.as_str_list() for card in deck] == EXPECTED_ROWS
+
+  def test_gaggle_write_deck_to_file_apkg_compression_raises_value_error(
+      self, tmp_path, package_file):
+    test_gaggle = gaggle.Gaggle()
+    test_gaggle.add_deck(gaggle.AnkiDeck.from_apkg(package_file))
+    with pytest.raises(ValueError):
+      test_gaggle.write_deck_to_file(
+          0, file_type='.apkg', compression='gzip', destination=str(tmp_path))
@@ -0,0 +1,257 @@
+# Copyright 2023 The Gaggle Authors. All Rights Reserved.
+#
+# This file is part of Gaggle.
+#
+# Gaggle is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Gaggle is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Gaggle. If not, see <https://www.gnu.org/licenses/>.
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=redefined-outer-name
+import os
+
+import pytest
+
+from gaggle import cache
+from gaggle import gaggle
+
+
+@pytest.fixture
+def deck_file(tmp_path):
+  file = tmp_path / 'deck.txt'
+  file.write_text('#separator:tab\n#guid column:1\na\tb\tc\n', encoding='utf-8')
+  return file
+
+
+@pytest.fixture
+def many_rows_file(tmp_path):
+  file = tmp_path / 'many_rows.txt'
+  rows = [
+      f'guid{idx}\tBasic\tDefault\tfront{idx}\t"back\n{idx}"\ttag{idx % 3}'
+      for idx in range(50)
+  ]
+  file.write_text(
+      '#separator:tab\n#guid column:1\n#notetype column:2\n#deck column:3\n'
+      '#tags column:6\n' + '\n'.join(rows) + '\n',
+      encoding='utf-8')
+  return file
+
+
+@pytest.fixture
+def snapshot():
+  return cache.DeckSnapshot(
+      header={'guid_idx': 0},
+      field_names=None,
+      num_rows=1,
+      columns=[['a'], ['b'], ['c']],
+      row_widths=None)
+
+
+def as_str_lists(deck):
+  return [card.as_str_list() for card in deck]
+
+
+@pytest.fixture
+def deck_cache(tmp_path):
+  return cache.DeckCache(tmp_path / 'cache')
+
+
+class TestDeckCache:
+
+  def test_init_negative_max_bytes(self, tmp_path):
+    with pytest.raises(ValueError):
+      cache.DeckCache(tmp_path, max_bytes=-1)
+
+  @pytest.mark.skipif(not hasattr(os, 'getuid'), reason='POSIX only')
+  def test_init_writable_by_others(self, tmp_path):
+    directory = tmp_path / 'shared'
+    directory.mkdir()
+    directory.chmod(0o777)
+    with pytest.raises(PermissionError):
+      cache.DeckCache(directory)
+
+  @pytest.mark.skipif(not hasattr(os, 'getuid'), reason='POSIX only')
+  def test_init_creates_private_directory(self, deck_cache):
+    assert os.stat(deck_cache.directory).st_mode & 0o077 == 0
+
+  def test_load_missing_key(self, deck_cache, deck_file):
+    assert deck_cache.load(deck_cache.key(deck_file)) is None
+
+  def test_store_then_load(self, deck_cache, deck_file, snapshot):
+    key = deck_cache.key(deck_file)
+    deck_cache.store(key, snapshot)
+    assert deck_cache.load(key) == snapshot
+
+  def test_key_changes_with_content(self, deck_cache, deck_file):
+    key = deck_cache.key(deck_file)
+    deck_file.write_text('#separator:tab\nd\te\tf\n', encoding='utf-8')
+    assert deck_cache.key(deck_file) != key
+
+  def test_key_does_not_hash_whole_settled_file(self, deck_cache, deck_file,
+                                                mocker):
+    os.utime(deck_file, (0, 0))
+    hash_file_content = mocker.spy(cache, 'hash_file_content')
+    deck_cache.key(deck_file)
+    assert hash_file_content.call_count == 0
+
+  @pytest.mark.parametrize('position', [0, -1])
+  def test_key_hashes_ends_of_settled_file(self, deck_cache, tmp_path,
+                                           position):
+    file = tmp_path / 'large.txt'
+    content = bytearray(b'x' * (4 * cache._PARTIAL_HASH_BYTES))
+    file.write_bytes(content)
+    os.utime(file, ns=(0, 0))
+    key = deck_cache.key(file)
+    content[position] = ord('y')
+    file.write_bytes(content)
+    os.utime(file, ns=(0, 0))
+    assert deck_cache.key(file) != key
+
+  @pytest.mark.parametrize('size', [0, 10, 2**16 + 10, 2**17 + 10])
+  def test_hash_file_ends_matches_content_hash_of_ends(self, tmp_path, size):
+    file = tmp_path / 'file.bin'
+    content = bytes(idx % 251 for idx in range(size))
+    file.write_bytes(content)
+    num_bytes = 2**16
+    tail = content[max(num_bytes, size - num_bytes):]
+    ends_file = tmp_path / 'ends.bin'
+    ends_file.write_bytes(content[:num_bytes] + tail)
+    assert cache.hash_file_ends(file,
+                                num_bytes) == cache.hash_file_content(ends_file)
+
+  def test_key_verify_content(self, tmp_path, deck_file):
+    deck_cache = cache.DeckCache(tmp_path / 'cache', verify_content=True)
+    os.utime(deck_file, ns=(0, 0))
+    key = deck_cache.key(deck_file)
+    deck_file.write_text(
+        '#separator:tab\n#guid column:1\nd\te\tf\n', encoding='utf-8')
+    os.utime(deck_file, ns=(0, 0))
+    assert deck_cache.key(deck_file) != key
+
+  def test_key_hashes_recently_modified_file(self, deck_cache, deck_file):
+    stat = os.stat(deck_file)
+    key = deck_cache.key(deck_file)
+    deck_file.write_text(
+        '#separator:tab\n#guid column:1\nd\te\tf\n', encoding='utf-8')
+    os.utime(deck_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert deck_cache.key(deck_file) != key
+
+  def test_key_changes_with_options(self, deck_cache, deck_file):
+    assert deck_cache.key(deck_file,
+                          [None]) != deck_cache.key(deck_file,
+                                                    [('A', 'B', 'C')])
+
+  def test_load_corrupt_snapshot(self, deck_cache, deck_file):
+    key = deck_cache.key(deck_file)
+    with open(os.path.join(deck_cache.directory, f'{key}.gaggle'), 'wb') as f:
+      f.write(b'not a snapshot')
+    assert deck_cache.load(key) is None
+    assert not os.listdir(deck_cache.directory)
+
+  def test_evict_least_recently_used(self, tmp_path, deck_file, snapshot):
+    deck_cache = cache.DeckCache(tmp_path / 'cache')
+    deck_cache.store('old', snapshot)
+    deck_cache.store('new', snapshot)
+    os.utime(os.path.join(deck_cache.directory, 'old.gaggle'), (0, 0))
+    entry_size = os.path.getsize(
+        os.path.join(deck_cache.directory, 'new.gaggle'))
+    deck_cache.max_bytes = entry_size
+    deck_cache.evict()
+    assert deck_cache.load('old') is None
+    assert deck_cache.load('new') == snapshot
+
+  def test_invalidate(self, deck_cache, deck_file, snapshot):
+    deck_cache.store(deck_cache.key(deck_file, [None]), snapshot)
+    deck_cache.store(deck_cache.key(deck_file, [('A',)]), snapshot)
+    deck_cache.store('unrelated', snapshot)
+    assert deck_cache.invalidate(deck_file) == 2
+    assert deck_cache.load('unrelated') == snapshot
+
+  def test_clear(self, deck_cache, deck_file, snapshot):
+    deck_cache.store(deck_cache.key(deck_file), snapshot)
+    deck_cache.clear()
+    assert not os.listdir(deck_cache.directory)
+
+
+class TestFromFileWithCache:
+
+  def test_cache_hit_matches_parsed_deck(self, deck_cache, deck_file):
+    parsed_deck = gaggle.AnkiDeck.from_file(deck_file, cache=deck_cache)
+    cached_deck = gaggle.AnkiDeck.from_file(deck_file, cache=deck_cache)
+    assert cached_deck.header == parsed_deck.header
+    assert ([card.as_str_list() for card in cached_deck
+            ] == [card.as_str_list() for card in parsed_deck])
+
+  def test_cache_hit_does_not_parse(self, deck_cache, deck_file, mocker):
+    gaggle.AnkiDeck.from_file(deck_file, cache=deck_cache)
+    parse = mocker.patch.object(gaggle, '_parse_anki_export')
+    gaggle.AnkiDeck.from_file(deck_file, cache=deck_cache)
+    parse.assert_not_called()
+
+  def test_changed_file_is_reparsed(self, deck_cache, deck_file):
+    gaggle.AnkiDeck.from_file(deck_file, cache=deck_cache)
+    deck_file.write_text(
+        '#separator:tab\n#guid column:1\nd\te\tf\n', encoding='utf-8')
+    deck = gaggle.AnkiDeck.from_file(deck_file, cache=deck_cache)
+    assert [card.as_str_list() for card in deck] == [['d', 'e', 'f']]
+
+  def test_field_names_are_part_of_key(self, deck_cache, deck_file):
+    gaggle.AnkiDeck.from_file(deck_file, cache=deck_cache)
+    deck = gaggle.AnkiDeck.from_file(
+        deck_file, ['', 'Y', 'Z'], cache=deck_cache)
+    assert next(iter(deck)).get_field('Z') == 'c'
+
+  def test_separator_survives_cache_hit(self, deck_cache, deck_file):
+    gaggle.AnkiDeck.from_file(deck_file, cache=deck_cache)
+    deck = gaggle.AnkiDeck.from_file(deck_file, cache=deck_cache)
+    assert deck.header['separator'] == 'tab'
+
+  @pytest.mark.parametrize('storage', list(gaggle.DeckStorage))
+  def test_cache_hit_matches_parsed_storage(self, deck_cache, many_rows_file,
+                                            storage):
+    parsed_deck = gaggle.AnkiDeck.from_file(many_rows_file)
+    gaggle.AnkiDeck.from_file(many_rows_file, cache=deck_cache, storage=storage)
+    cached_deck = gaggle.AnkiDeck.from_file(
+        many_rows_file, cache=deck_cache, storage=storage)
+    assert cached_deck.header == parsed_deck.header
+    assert as_str_lists(cached_deck) == as_str_lists(parsed_deck)
+
+  def test_cache_miss_parses_once(self, deck_cache, deck_file, mocker):
+    store_cards = mocker.spy(gaggle, '_store_cards')
+    deck = gaggle.AnkiDeck.from_file(
+        deck_file, cache=deck_cache, where=lambda row: True, columns=['Field2'])
+    assert store_cards.call_count == 1
+    assert as_str_lists(deck) == [['c']]
+
+  def test_cache_hit_with_columns(self, deck_cache, deck_file):
+    gaggle.AnkiDeck.from_file(deck_file, cache=deck_cache)
+    deck = gaggle.AnkiDeck.from_file(
+        deck_file, cache=deck_cache, columns=['Field2', 'GUID'])
+    assert as_str_lists(deck) == [['c', 'a']]
+    assert deck.header['guid_idx'] == 1
+
+  @pytest.mark.parametrize('rows', [
+      [['a', 'b', 'c'], ['d'], [], ['e', 'f', 'g', 'h']],
+      [[], []],
+      [['a\x1fb', '\x1e'], ['\x1d\x1c', '\x00']],
+  ])
+  def test_snapshot_round_trip(self, rows):
+    builder = gaggle._SnapshotBuilder()
+    assert list(builder.record({}, rows)) == rows
+    restored_rows = gaggle._restore_snapshot(builder.snapshot(), where={})[1]
+    assert as_str_lists(restored_rows) == rows
+
+  def test_where_applied_to_cached_rows(self, deck_cache, deck_file):
+    deck = gaggle.AnkiDeck.from_file(
+        deck_file, cache=deck_cache, where=lambda row: False)
+    assert not list(deck)
+    deck = gaggle.AnkiDeck.from_file(deck_file, cache=deck_cache)
+    assert [card.as_str_list() for card in deck] == [['a', 'b', 'c']]
@@ -0,0 +1,68 @@
+# Copyright 2023 The Gaggle Authors. All Rights Reserved.
+#
+# This file is part of Gaggle.
+#
+# Gaggle is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Gaggle is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Gaggle. If not, see <https://www.gnu.org/licenses/>.
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=redefined-outer-name
+import pytest
+
+from gaggle import digest
+
+
+class TestFingerprintValues:
+
+  def test_fingerprint_size(self):
+    assert len(digest.fingerprint_values(['a', 'b'])) == digest.FINGERPRINT_SIZE
+
+  def test_equal_values_equal_fingerprint(self):
+    assert digest.fingerprint_values(['a', 'b']) == digest.fingerprint_values(
+        ('a', 'b'))
+
+  def test_length_prefix_separates_values(self):
+    assert digest.fingerprint_values(['ab', 'c']) != digest.fingerprint_values(
+        ['a', 'bc'])
+
+  def test_order_changes_fingerprint(self):
+    assert digest.fingerprint_values(['a', 'b'
+                                     ]) != digest.fingerprint_values(['b', 'a'])
+
+  def test_stable_fingerprint(self):
+    assert digest.fingerprint_values(
+        ['a', 'b']).hex() == 'a6bcbedb8fa928d858986a5df0acb979'
+
+
+class TestMerkleRoot:
+
+  @pytest.fixture
+  def leaves(self):
+    return [digest.fingerprint_values([str(idx)]) for idx in range(5)]
+
+  def test_empty_root(self):
+    assert digest.merkle_root([]) == digest.fingerprint_values([])
+
+  def test_single_leaf_is_root(self, leaves):
+    assert digest.merkle_root(leaves[:1]) == leaves[0]
+
+  @pytest.mark.parametrize('num_leaves', [2, 3, 4, 5])
+  def test_root_differs_from_leaves(self, leaves, num_leaves):
+    assert digest.merkle_root(leaves[:num_leaves]) not in leaves
+
+  def test_changed_leaf_changes_root(self, leaves):
+    changed = list(leaves)
+    changed[4] = digest.fingerprint_values(['changed'])
+    assert digest.merkle_root(leaves) != digest.merkle_root(changed)
+
+  def test_leaf_order_changes_root(self, leaves):
+    assert digest.merkle_root(leaves) != digest.merkle_root(leaves[::-1])
@@ -52,3 +52,35 @@ class TestDecksNotWrittenException:
       self, decks_not_written_exception_string_representation):
     assert (str(self.test_exception) ==
             decks_not_written_exception_string_representation)
+
+
+class TestCardsNotTransformedException:
+
+  @pytest.fixture(autouse=True)
+  def cards_not_transformed_exception(self):
+    self.failures = {range(0, 10): ValueError(), range(20, 25): KeyError()}
+    self.test_exception = exceptions.CardsNotTransformedException(self.failures)
+
+  def test_cards_not_transformed_exception_failures_property(self):
+    assert self.test_exception.failures == self.failures
+
+  def test_cards_not_transformed_exception_str(self):
+    assert str(self.test_exception) == (
+        'Failed to transform 2 chunks of cards. Cards which failed to '
+        'transform: 0-9, 20-24')
+
+
+class TestDecksNotLoadedException:
+
+  @pytest.fixture(autouse=True)
+  def decks_not_loaded_exception(self):
+    self.failures = {'file.txt': FileNotFoundError()}
+    self.test_exception = exceptions.DecksNotLoadedException(self.failures)
+
+  def test_decks_not_loaded_exception_failures_property(self):
+    assert self.test_exception.failures == self.failures
+
+  def test_decks_not_loaded_exception_str(self):
+    assert str(self.test_exception) == (
+        'Failed to load 1 Decks from file. Files which failed to load: '
+        'file.txt')
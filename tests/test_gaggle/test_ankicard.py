@@ -104,6 +104,35 @@ def generate_unique_field_names_constructor(anki_card_components_constructor,):
   return generate_unique_field_names_helper
 
 
+@pytest_cases.fixture
+@pytest_cases.parametrize_with_cases(
+    'anki_card_components_constructor',
+    cases=_CASES,
+    has_tag=['AnkiCardComponentsConstructor'])
+def resolve_unique_field_names_constructor(anki_card_components_constructor,):
+
+  def resolve_unique_field_names_helper(field_names=None):
+    anki_card_components = anki_card_components_constructor(
+        field_names=field_names)
+    diagnostics = []
+    resolved_field_names = list(
+        gaggle._resolve_unique_field_names(
+            anki_card_components.field_names, anki_card_components.fields,
+            anki_card_components.reserved_names,
+            set(anki_card_components.reserved_names.values()), diagnostics))
+    return (resolved_field_names, anki_card_components.expected_field_names,
+            diagnostics)
+
+  return resolve_unique_field_names_helper
+
+
+def diagnostics_of_type(diagnostics, category):
+  return [
+      diagnostic for diagnostic in diagnostics
+      if isinstance(diagnostic, category)
+  ]
+
+
 class TestAnkiCardInit:
 
   @pytest.mark.filterwarnings('ignore')
@@ -230,6 +259,16 @@ def test_as_str_list_order_matches(anki_card_components):
   assert anki_card.as_str_list() == expected_fields
 
 
+@pytest.mark.filterwarnings('ignore')
+@pytest_cases.parametrize_with_cases(
+    'anki_card_components',
+    cases=_CASES,
+    has_tag=['WellFormed', 'AnkiCardComponents'])
+def test_values_matches_as_str_list(anki_card_components):
+  anki_card = anki_card_components.new_anki_card()
+  assert list(anki_card.values) == anki_card.as_str_list()
+
+
 def format_as_tsv(fields):
   """Formatting expected of a TSV line.
 
@@ -379,19 +418,6 @@ def get_code_line(filename, lineno):
 
 class TestGenerateUniqueFieldNames:
 
-  @pytest.mark.slow
-  @pytest.mark.io
-  @pytest_cases.parametrize_with_cases(
-      'anki_card_components',
-      cases=_CASES,
-      has_tag=['ModifiedFullySpecified', 'AnkiCardComponents'])
-  def test_generate_unique_field_names_warning_points_to_anki_card_initialisation(
-      self, anki_card_components):
-    with warnings.catch_warnings(record=True) as records:
-      anki_card_components.new_anki_card()
-    for record in records:
-      assert 'AnkiCard(' in get_code_line(record.filename, record.lineno)
-
   @pytest.mark.filterwarnings('ignore')
   @pytest_cases.parametrize_with_cases(
       'field_names',
@@ -595,6 +621,224 @@ class TestGenerateUniqueFieldNames:
       generate_unique_field_names_constructor(field_names=field_names)
 
 
+class TestResolveUniqueFieldNames:
+
+  @pytest.mark.slow
+  @pytest.mark.io
+  @pytest_cases.parametrize_with_cases(
+      'anki_card_components',
+      cases=_CASES,
+      has_tag=['ModifiedFullySpecified', 'AnkiCardComponents'])
+  def test_anki_card_warning_points_to_anki_card_initialisation(
+      self, anki_card_components):
+    with warnings.catch_warnings(record=True) as records:
+      anki_card_components.new_anki_card()
+    for record in records:
+      assert 'AnkiCard(' in get_code_line(record.filename, record.lineno)
+
+  @pytest_cases.parametrize_with_cases(
+      'field_names',
+      cases=_CASES,
+      filter=~pytest_cases.filters.has_tag('UsageBeforeAssignment'),
+      prefix='field_names')
+  def test_resolve_unique_field_names_length_matches_fields_length(
+      self,
+      field_names,
+      resolve_unique_field_names_constructor,
+  ):
+    """This test also guarantees that generated field_names are unique."""
+    test_field_names, expected_field_names, _ = resolve_unique_field_names_constructor(
+        field_names)
+    assert len(test_field_names) == len(expected_field_names)
+
+  @pytest_cases.parametrize_with_cases(
+      'field_names',
+      cases=_CASES,
+      filter=~pytest_cases.filters.has_tag('UsageBeforeAssignment'),
+      prefix='field_names',
+  )
+  def test_resolve_unique_field_names_replaces_field_names(
+      self,
+      field_names,
+      resolve_unique_field_names_constructor,
+  ):
+    test_field_names, expected_field_names, _ = resolve_unique_field_names_constructor(
+        field_names)
+    assert test_field_names == expected_field_names
+
+  @pytest_cases.parametrize_with_cases(
+      'field_names',
+      cases=_CASES,
+      has_tag=['Well-Formed'],
+      prefix='field_names')
+  def test_resolve_unique_field_names_well_formed_no_diagnostics(
+      self,
+      field_names,
+      resolve_unique_field_names_constructor,
+  ):
+    _, _, diagnostics = resolve_unique_field_names_constructor(field_names)
+    assert not diagnostics
+
+  @pytest_cases.parametrize_with_cases(
+      'field_names', cases=_CASES, has_tag=['Surplus'], prefix='field_names')
+  def test_resolve_unique_field_names_longer_field_names_reports_leftover_argument_warning(
+      self,
+      field_names,
+      resolve_unique_field_names_constructor,
+  ):
+    _, _, diagnostics = resolve_unique_field_names_constructor(
+        field_names=field_names)
+    assert diagnostics_of_type(diagnostics, exceptions.LeftoverArgumentWarning)
+
+  @pytest_cases.parametrize_with_cases(
+      'field_names', cases=_CASES, has_tag=['Surplus'], prefix='field_names')
+  def test_resolve_unique_field_names_longer_field_names_multiple_extra_reports_one_warning(
+      self,
+      field_names,
+      resolve_unique_field_names_constructor,
+  ):
+    _, _, diagnostics = resolve_unique_field_names_constructor(
+        field_names=field_names)
+    assert len(
+        diagnostics_of_type(diagnostics,
+                            exceptions.LeftoverArgumentWarning)) == 1
+
+  @pytest_cases.parametrize_with_cases(
+      'field_names', cases=_CASES, has_tag=['Surplus'], prefix='field_names')
+  def test_resolve_unique_field_names_longer_field_names_multiple_extra_returns_all_extra(
+      self,
+      field_names,
+      resolve_unique_field_names_constructor,
+  ):
+    _, expected_field_names, diagnostics = resolve_unique_field_names_constructor(
+        field_names)
+    surplus_starting_index = len(expected_field_names)
+    warning = diagnostics_of_type(diagnostics,
+                                  exceptions.LeftoverArgumentWarning)[0]
+    actual_extra_field_names = warning.leftovers
+    expected_extra_field_names = ' '.join(field_names[surplus_starting_index:])
+    assert actual_extra_field_names == expected_extra_field_names
+
+  @pytest_cases.parametrize_with_cases(
+      'field_names',
+      cases=_CASES,
+      has_tag=['HeaderNameMismatch'],
+      prefix='field_names')
+  def test_resolve_unique_field_names_mismatched_reserved_name_reports_header_field_name_mismatch_warning(
+      self,
+      field_names,
+      resolve_unique_field_names_constructor,
+  ):
+    _, _, diagnostics = resolve_unique_field_names_constructor(
+        field_names=field_names)
+    assert diagnostics_of_type(diagnostics,
+                               exceptions.HeaderFieldNameMismatchWarning)
+
+  @pytest_cases.parametrize_with_cases(
+      'field_names',
+      cases=_CASES,
+      has_tag=['HeaderNameMismatch'],
+      prefix='field_names')
+  def test_resolve_unique_field_names_multiple_mismatched_reserved_name_reports_multiple_header_field_name_mismatch_warning(
+      self,
+      field_names,
+      resolve_unique_field_names_constructor,
+  ):
+    _, expected_field_names, diagnostics = resolve_unique_field_names_constructor(
+        field_names)
+    record = diagnostics_of_type(diagnostics,
+                                 exceptions.HeaderFieldNameMismatchWarning)
+    # Right hand side is the number of field_names which were altered
+    number_mismatches = len(set(expected_field_names) - set(field_names))
+    assert len(record) == number_mismatches
+
+  @pytest_cases.parametrize_with_cases(
+      'field_names',
+      cases=_CASES,
+      has_tag=['DuplicateReservedFieldNames'],
+      prefix='field_names')
+  def test_resolve_unique_field_names_duplicate_reserved_name_reports_duplicate_warning(
+      self,
+      field_names,
+      resolve_unique_field_names_constructor,
+  ):
+    _, _, diagnostics = resolve_unique_field_names_constructor(
+        field_names=field_names)
+    assert diagnostics_of_type(diagnostics, exceptions.DuplicateWarning)
+
+  @pytest_cases.parametrize_with_cases(
+      'field_names',
+      cases=_CASES,
+      has_tag=['DuplicateReservedFieldNames'],
+      prefix='field_names')
+  def test_resolve_unique_field_names_multiple_duplicate_reserved_name_reports_multiple_duplicate_warning(
+      self,
+      field_names,
+      resolve_unique_field_names_constructor,
+  ):
+    _, expected_field_names, diagnostics = resolve_unique_field_names_constructor(
+        field_names)
+    record = diagnostics_of_type(diagnostics, exceptions.DuplicateWarning)
+    number_duplicate = len(expected_field_names) - len(set(field_names))
+    assert len(record) == number_duplicate
+
+  @pytest_cases.parametrize_with_cases(
+      'field_names',
+      cases=_CASES,
+      has_tag=['UsageAfterAssignment'],
+      prefix='field_names')
+  def test_resolve_unique_field_names_duplicate_default_name_after_assignment_reports_duplicate_warning(
+      self,
+      field_names,
+      resolve_unique_field_names_constructor,
+  ):
+    _, _, diagnostics = resolve_unique_field_names_constructor(
+        field_names=field_names)
+    assert diagnostics_of_type(diagnostics, exceptions.DuplicateWarning)
+
+  @pytest_cases.parametrize_with_cases(
+      'field_names',
+      cases=_CASES,
+      has_tag=['UsageAfterAssignment'],
+      prefix='field_names')
+  def test_resolve_unique_field_names_multiple_duplicate_default_name_after_assignment_reports_multiple_duplicate_warning(
+      self,
+      field_names,
+      resolve_unique_field_names_constructor,
+  ):
+    _, expected_field_names, diagnostics = resolve_unique_field_names_constructor(
+        field_names)
+    record = diagnostics_of_type(diagnostics, exceptions.DuplicateWarning)
+    number_duplicate = len(expected_field_names) - len(set(field_names))
+    assert len(record) == number_duplicate
+
+  @pytest_cases.parametrize_with_cases(
+      'field_names',
+      cases=_CASES,
+      has_tag=['UsageBeforeAssignment'],
+      prefix='field_names')
+  def test_resolve_unique_field_names_duplicate_default_name_before_assignment_raises_value_error(
+      self,
+      field_names,
+      resolve_unique_field_names_constructor,
+  ):
+    with pytest.raises(ValueError):
+      resolve_unique_field_names_constructor(field_names=field_names)
+
+  @pytest_cases.parametrize_with_cases(
+      'field_names',
+      cases=_CASES,
+      has_tag=['UsageBeforeAssignment'],
+      prefix='field_names')
+  def test_resolve_unique_field_names_multiple_duplicate_default_name_before_assignment_raises_single_value_error(
+      self,
+      field_names,
+      resolve_unique_field_names_constructor,
+  ):
+    with pytest.raises(ValueError):
+      resolve_unique_field_names_constructor(field_names=field_names)
+
+
 @pytest.mark.slow
 @pytest.mark.io
 @pytest_cases.parametrize('field_names',
@@ -609,3 +853,84 @@ def test_create_cards_from_tsv_well_formed_arguments(
     deck = gaggle.create_cards_from_tsv(
         f, field_names=field_names, header=header)
   assert deck
+
+
+class TestFieldSchema:
+
+  def test_names_for_matches_anki_card_field_names(self,
+                                                   new_header_gaggle_format):
+    fields = [f'value{idx}' for idx in range(7)]
+    schema = gaggle.FieldSchema.from_header(new_header_gaggle_format)
+    card = gaggle.AnkiCard(fields, **new_header_gaggle_format)
+    assert list(schema.names_for(len(fields))) == list(card.fields.keys())
+
+  def test_names_for_is_cached_per_width(self, new_header_gaggle_format):
+    schema = gaggle.FieldSchema.from_header(new_header_gaggle_format)
+    assert schema.names_for(7) is schema.names_for(7)
+
+  def test_from_schema_matches_init(self, new_header_gaggle_format,
+                                    new_field_names_remove_reserved):
+    fields = [f'value{idx}' for idx in range(7)]
+    schema = gaggle.FieldSchema.from_header(new_header_gaggle_format,
+                                            new_field_names_remove_reserved)
+    expected_card = gaggle.AnkiCard(fields, new_field_names_remove_reserved,
+                                    **new_header_gaggle_format)
+    card = gaggle.AnkiCard.from_schema(fields, schema)
+    assert card.fields == expected_card.fields
+    assert card.has_html == expected_card.has_html
+
+  @pytest.mark.slow
+  @pytest.mark.io
+  def test_create_cards_from_tsv_reports_once_per_deck_without_warning(
+      self, case_anki_export_file_no_header_well_formed_content,
+      new_header_gaggle_format):
+    field_names = ['This is not a field name assigned by the header']
+    with open(case_anki_export_file_no_header_well_formed_content,
+              **READ_PARAMS) as f:
+      with warnings.catch_warnings(record=True) as records:
+        warnings.simplefilter('always')
+        cards = gaggle.create_cards_from_tsv(
+            f, field_names=field_names, header=new_header_gaggle_format)
+    assert len(cards) > 1
+    assert not records
+    assert all(card.layout is cards[0].layout for card in cards)
+    diagnostic, = cards[0].layout.diagnostics
+    assert isinstance(diagnostic, exceptions.HeaderFieldNameMismatchWarning)
+
+
+class TestSlottedAnkiCard:
+
+  @pytest.fixture
+  def anki_card(self, new_header_gaggle_format):
+    fields = [f'value{idx}' for idx in range(7)]
+    return gaggle.AnkiCard(fields, **new_header_gaggle_format)
+
+  def test_anki_card_has_no_instance_dict(self, anki_card):
+    assert not hasattr(anki_card, '__dict__')
+
+  def test_reserved_names_alias_module_constant(self, anki_card):
+    assert anki_card._reserved_names is gaggle.RESERVED_FIELD_NAMES
+
+  def test_anki_cards_share_layout(self, new_header_gaggle_format):
+    schema = gaggle.FieldSchema.from_header(new_header_gaggle_format)
+    card_one = gaggle.AnkiCard.from_schema(['a'] * 7, schema)
+    card_two = gaggle.AnkiCard.from_schema(['b'] * 7, schema)
+    assert card_one.layout is card_two.layout
+
+  def test_repr_matches_ordered_dict(self, anki_card):
+    expected = collections.OrderedDict(
+        zip(anki_card.fields.keys(), anki_card.as_str_list()))
+    assert repr(anki_card) == str(expected)
+
+  def test_set_field_updates_value(self, anki_card):
+    anki_card.set_field('Deck', 'New Deck')
+    assert anki_card.deck_name == 'New Deck'
+    assert anki_card.as_str_list()[2] == 'New Deck'
+
+  def test_fields_assignment_updates_card(self, anki_card):
+    anki_card.fields['Field3'] = 'New value'
+    assert anki_card.get_field('Field3') == 'New value'
+
+  def test_set_field_non_existing_field_raises_key_error(self, anki_card):
+    with pytest.raises(KeyError):
+      anki_card.set_field('This field name does not exist', 'value')
@@ -16,3 +16,1084 @@
 # pylint: disable=missing-module-docstring
 # pylint: disable=missing-class-docstring
 # pylint: disable=redefined-outer-name
+# pylint: disable=protected-access
+import asyncio
+import csv
+import gzip
+import io
+import pickle
+import sqlite3
+import sys
+import warnings
+from collections.abc import Sequence
+from typing import cast
+
+import pytest
+
+from gaggle import exceptions
+from gaggle import gaggle
+
+
+@pytest.fixture
+def well_formed_file(
+    case_anki_export_file_well_formed_header_well_formed_content):
+  return case_anki_export_file_well_formed_header_well_formed_content
+
+
+def cards_of(deck: gaggle.AnkiDeck) -> Sequence[gaggle.AnkiCard]:
+  """Narrows the cards of a deck read with from_file(), which are indexable
+  for every DeckStorage."""
+  return cast(Sequence[gaggle.AnkiCard], deck.cards)
+
+
+def as_str_lists(deck):
+  return [card.as_str_list() for card in deck]
+
+
+class TestOpenStream:
+
+  def test_open_stream_header_matches_from_file(self, well_formed_file):
+    expected_deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    stream_deck = gaggle.AnkiDeck.open_stream(well_formed_file)
+    assert stream_deck.header == expected_deck.header
+
+  def test_open_stream_cards_match_from_file(self, well_formed_file):
+    expected_deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    stream_deck = gaggle.AnkiDeck.open_stream(well_formed_file)
+    assert as_str_lists(stream_deck) == as_str_lists(expected_deck)
+
+  def test_open_stream_is_reiterable(self, well_formed_file):
+    stream_deck = gaggle.AnkiDeck.open_stream(well_formed_file)
+    assert as_str_lists(stream_deck) == as_str_lists(stream_deck)
+
+  def test_open_stream_does_not_materialise_cards(self, well_formed_file):
+    stream_deck = gaggle.AnkiDeck.open_stream(well_formed_file)
+    assert isinstance(stream_deck.cards, gaggle.AnkiExportStream)
+    assert next(iter(stream_deck)).get_field('GUID') == 'card0_field0'
+
+  def test_open_stream_no_content_yields_nothing(
+      self, case_anki_export_file_well_formed_header_no_content):
+    stream_deck = gaggle.AnkiDeck.open_stream(
+        case_anki_export_file_well_formed_header_no_content)
+    assert not list(stream_deck)
+
+  def test_open_stream_field_names_iterator_reused(self, well_formed_file):
+    field_names = iter(['', '', '', '', 'Front', 'Back'])
+    stream_deck = gaggle.AnkiDeck.open_stream(well_formed_file, field_names)
+    for card in stream_deck:
+      assert card.get_field('Back')
+
+  def test_open_stream_nonexistent_file_raises_file_not_found_error(self):
+    with pytest.raises(FileNotFoundError):
+      gaggle.AnkiDeck.open_stream('This file does not exist.txt')
+
+
+class TestColumnarStorage:
+
+  @pytest.fixture
+  def columnar_deck(self, well_formed_file):
+    return gaggle.AnkiDeck.from_file(
+        well_formed_file, storage=gaggle.DeckStorage.COLUMNAR)
+
+  def test_columnar_cards_match_rows(self, well_formed_file, columnar_deck):
+    expected_deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    assert isinstance(columnar_deck.cards, gaggle.ColumnarCards)
+    assert as_str_lists(columnar_deck) == as_str_lists(expected_deck)
+
+  def test_column_matches_rows(self, well_formed_file, columnar_deck):
+    expected_deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    assert list(columnar_deck.column('GUID')) == list(
+        expected_deck.column('GUID'))
+
+  def test_column_is_stored_column(self, columnar_deck):
+    columnar_deck.column('Field4')[0] = 'New value'
+    assert columnar_deck.cards[0].get_field('Field4') == 'New value'
+
+  def test_set_field_writes_back_by_index(self, columnar_deck):
+    columnar_deck.cards[-1].set_field('Field4', 'New value')
+    assert columnar_deck.column('Field4')[19] == 'New value'
+
+  def test_set_field_writes_back_during_iteration(self, columnar_deck):
+    for card in columnar_deck:
+      card.set_field('Field4', card.get_field('Field4').upper())
+    assert columnar_deck.column('Field4') == [
+        f'CARD{idx}_FIELD4' for idx in range(20)
+    ]
+
+  def test_set_field_marks_row_modified(self, columnar_deck):
+    columnar_deck.cards[3].set_field('Field4', 'New value')
+    del columnar_deck.cards[0]
+    assert [card.guid for card in columnar_deck.changed_cards()
+           ] == ['card3_field0']
+    columnar_deck.checkpoint()
+    assert columnar_deck.changed_cards() == []
+
+  def test_column_non_existing_field_raises_key_error(self, columnar_deck):
+    with pytest.raises(KeyError):
+      columnar_deck.column('This field name does not exist')
+
+  def test_column_values_interned(self, columnar_deck):
+    deck_names = columnar_deck.column('Deck')
+    assert all(name is sys.intern(name) for name in deck_names)
+
+  def test_append_different_width_raises_value_error(self):
+    columnar_cards = gaggle.ColumnarCards(gaggle.FieldSchema())
+    columnar_cards.append(['a', 'b'])
+    with pytest.raises(ValueError):
+      columnar_cards.append(['a', 'b', 'c'])
+
+  def test_empty_columnar_cards(self):
+    columnar_cards = gaggle.ColumnarCards(gaggle.FieldSchema())
+    assert not list(columnar_cards)
+    assert len(columnar_cards) == 0
+
+
+class TestSqliteStorage:
+
+  @pytest.fixture
+  def sqlite_deck(self, well_formed_file):
+    with gaggle.AnkiDeck.from_file(
+        well_formed_file, storage=gaggle.DeckStorage.SQLITE) as deck:
+      yield deck
+
+  def test_sqlite_cards_match_rows(self, well_formed_file, sqlite_deck):
+    expected_deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    assert isinstance(sqlite_deck.cards, gaggle.SqliteCards)
+    assert as_str_lists(sqlite_deck) == as_str_lists(expected_deck)
+
+  def test_column_matches_rows(self, well_formed_file, sqlite_deck):
+    expected_deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    assert sqlite_deck.column('Tags') == expected_deck.column('Tags')
+
+  def test_column_non_existing_field_raises_key_error(self, sqlite_deck):
+    with pytest.raises(KeyError):
+      sqlite_deck.column('This field name does not exist')
+
+  def test_getitem(self, well_formed_file, sqlite_deck):
+    expected_deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    assert len(sqlite_deck.cards) == 20
+    assert (sqlite_deck.cards[-1].as_str_list() == cards_of(expected_deck)
+            [-1].as_str_list())
+    with pytest.raises(IndexError):
+      sqlite_deck.cards[20]  # pylint: disable=pointless-statement
+
+  def test_reserved_columns_indexed(self, sqlite_deck):
+    indexes = sqlite_deck.cards._connection.execute(
+        "SELECT count(*) FROM sqlite_master WHERE type = 'index'").fetchone()
+    assert indexes == (4,)
+
+  def test_write_as_tsv_matches_rows(self, well_formed_file, sqlite_deck):
+    expected_deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    expected, written = io.StringIO(), io.StringIO()
+    expected_deck.write_as_tsv(expected)
+    sqlite_deck.write_as_tsv(written)
+    assert written.getvalue() == expected.getvalue()
+
+  def test_batched_insert(self):
+    sqlite_cards = gaggle.SqliteCards(gaggle.FieldSchema(), batch_size=3)
+    rows = [[f'a{idx}', f'b{idx}'] for idx in range(10)]
+    sqlite_cards.extend(rows)
+    assert [list(row) for row in sqlite_cards.iter_rows()] == rows
+
+  def test_append_different_width_raises_value_error(self):
+    sqlite_cards = gaggle.SqliteCards(gaggle.FieldSchema())
+    sqlite_cards.append(['a', 'b'])
+    with pytest.raises(ValueError):
+      sqlite_cards.append(['a', 'b', 'c'])
+
+  def test_empty_sqlite_cards(self):
+    sqlite_cards = gaggle.SqliteCards(gaggle.FieldSchema())
+    assert not list(sqlite_cards)
+    assert len(sqlite_cards) == 0
+
+  def test_row_without_fields_raises_value_error(self):
+    sqlite_cards = gaggle.SqliteCards(gaggle.FieldSchema())
+    with pytest.raises(ValueError, match='empty row'):
+      sqlite_cards.extend([[], ['a', 'b']])
+
+  def test_getitem_after_delete(self):
+    sqlite_cards = gaggle.SqliteCards(gaggle.FieldSchema())
+    sqlite_cards.extend([[f'a{idx}', f'b{idx}'] for idx in range(5)])
+    assert sqlite_cards.delete_by_field('Field0', 'a1') == 1
+    assert len(sqlite_cards) == 4
+    assert sqlite_cards[1].as_str_list() == ['a2', 'b2']
+    sqlite_cards.append(['a5', 'b5'])
+    assert sqlite_cards[-1].as_str_list() == ['a5', 'b5']
+
+  def test_context_manager_closes_connection(self):
+    with gaggle.SqliteCards(gaggle.FieldSchema()) as sqlite_cards:
+      sqlite_cards.append(['a', 'b'])
+    with pytest.raises(sqlite3.ProgrammingError):
+      sqlite_cards.column('Field0')
+
+  def test_deck_close_closes_connection(self, well_formed_file):
+    with gaggle.AnkiDeck.from_file(
+        well_formed_file, storage=gaggle.DeckStorage.SQLITE) as deck:
+      pass
+    with pytest.raises(sqlite3.ProgrammingError):
+      deck.column('Tags')
+
+
+class TestGuidIndex:
+
+  @pytest.fixture(params=[
+      gaggle.DeckStorage.ROWS, gaggle.DeckStorage.COLUMNAR,
+      gaggle.DeckStorage.SQLITE
+  ])
+  def deck(self, request, well_formed_file):
+    return gaggle.AnkiDeck.from_file(well_formed_file, storage=request.param)
+
+  @pytest.fixture
+  def new_card(self, deck):
+    values = next(iter(deck)).as_str_list()
+    values[0] = 'new_guid'
+    values[3] = 'new value'
+    return gaggle.AnkiCard.from_schema(
+        values,
+        gaggle.FieldSchema.from_header({
+            'guid_idx': 0,
+            'note_type_idx': 1,
+            'deck_idx': 2,
+            'tags_idx': 6
+        }))
+
+  def test_get_by_guid(self, deck):
+    card = deck.get_by_guid('card7_field0')
+    assert card.as_str_list() == as_str_lists(deck)[7]
+
+  def test_get_by_guid_missing(self, deck):
+    assert deck.get_by_guid('This GUID does not exist') is None
+
+  def test_get_by_guid_builds_index_once(self, deck, mocker):
+    if isinstance(deck.cards, gaggle.SqliteCards):
+      pytest.skip('SqliteCards are looked up through the database index')
+    column = mocker.spy(deck, 'column')
+    deck.get_by_guid('card1_field0')
+    deck.get_by_guid('card2_field0')
+    assert column.call_count == 1
+
+  def test_upsert_inserts(self, deck, new_card):
+    deck.upsert(new_card)
+    assert len(as_str_lists(deck)) == 21
+    assert as_str_lists(deck)[-1] == new_card.as_str_list()
+    assert deck.get_by_guid('new_guid').get_field('Field3') == 'new value'
+
+  def test_upsert_replaces(self, deck, new_card):
+    new_card.set_field('GUID', 'card4_field0')
+    deck.upsert(new_card)
+    assert len(as_str_lists(deck)) == 20
+    assert as_str_lists(deck)[4] == new_card.as_str_list()
+    assert deck.get_by_guid('card4_field0').get_field('Field3') == 'new value'
+
+  def test_remove_by_guid(self, deck):
+    expected = as_str_lists(deck)
+    del expected[5]
+    deck.remove_by_guid('card5_field0')
+    assert as_str_lists(deck) == expected
+    assert deck.get_by_guid('card5_field0') is None
+    assert deck.get_by_guid('card6_field0').as_str_list() == expected[5]
+
+  def test_remove_by_guid_missing_raises_key_error(self, deck):
+    with pytest.raises(KeyError):
+      deck.remove_by_guid('This GUID does not exist')
+
+  def test_remove_by_guids(self, deck):
+    expected = as_str_lists(deck)
+    for position in (12, 5, 0):
+      del expected[position]
+    deck.remove_by_guids(
+        ['card12_field0', 'card0_field0', 'card5_field0', 'card0_field0'])
+    assert as_str_lists(deck) == expected
+    assert deck.get_by_guid('card5_field0') is None
+    for guid in ('card1_field0', 'card6_field0', 'card19_field0'):
+      card = deck.get_by_guid(guid)
+      assert card is not None
+      assert card.guid == guid
+    assert deck.removed_guids == {
+        'card0_field0', 'card5_field0', 'card12_field0'
+    }
+
+  def test_remove_by_guids_missing_removes_nothing(self, deck):
+    expected = as_str_lists(deck)
+    with pytest.raises(KeyError):
+      deck.remove_by_guids(['card5_field0', 'This GUID does not exist'])
+    assert as_str_lists(deck) == expected
+    assert not deck.removed_guids
+
+  def test_no_guid_column_raises_value_error(self):
+    deck = gaggle.AnkiDeck({}, [])
+    with pytest.raises(ValueError):
+      deck.get_by_guid('guid')
+
+  def test_streamed_deck_raises_type_error(self, well_formed_file):
+    deck = gaggle.AnkiDeck.open_stream(well_formed_file)
+    with pytest.raises(TypeError):
+      deck.get_by_guid('card0_field0')
+
+  def test_reindex_after_direct_modification(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    deck.get_by_guid('card0_field0')
+    assert isinstance(deck.cards, list)
+    deck.cards.reverse()
+    deck.reindex()
+    assert deck.get_by_guid('card0_field0') is cards_of(deck)[-1]
+
+
+class TestTagIndex:
+
+  def test_cards_with_tags_matches_scan(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    tag = cards_of(deck)[3].tags.split()[0]
+    expected = [
+        card for card in deck
+        if tag.casefold() in map(str.casefold, card.tags.split())
+    ]
+    assert deck.cards_with_tags(all_of=[tag]) == expected
+
+  def test_cards_with_tags_none_of(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(
+        well_formed_file, storage=gaggle.DeckStorage.SQLITE)
+    tag = cards_of(deck)[3].tags.split()[0]
+    cards = deck.cards_with_tags(none_of=[tag])
+    assert all(tag not in card.tags.split() for card in cards)
+
+  def test_tag_index_built_once(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    assert deck.tag_index is deck.tag_index
+
+  def test_upsert_discards_tag_index(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    card = cards_of(deck)[0]
+    card.set_field('Tags', 'new_tag')
+    deck.upsert(card)
+    assert deck.cards_with_tags(all_of=['new_tag']) == [card]
+
+
+class TestDeckTrie:
+
+  def test_cards_in_deck_matches_scan(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    deck_name = cards_of(deck)[2].deck_name
+    expected = [
+        card for card in deck if card.deck_name == deck_name or
+        card.deck_name.startswith(f'{deck_name}::')
+    ]
+    assert deck.cards_in_deck(deck_name) == expected
+
+  def test_upsert_discards_deck_trie(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    card = cards_of(deck)[0]
+    card.set_field('Deck', 'Parent::Child')
+    deck.upsert(card)
+    assert deck.cards_in_deck('Parent') == [card]
+    assert deck.deck_trie.children('Parent') == ['Parent::Child']
+
+
+class TestTextIndex:
+
+  def test_search_text_matches_scan(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    deck.index_text(['Field3', 'Field4'])
+    assert deck.search_text('card12_field4') == [12]
+    assert deck.search_text(
+        'card1', substring=True) == [1] + list(range(10, 20))
+
+  def test_search_text_without_index_raises_value_error(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    with pytest.raises(ValueError):
+      deck.search_text('card1')
+
+  def test_upsert_updates_text_index(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    deck.index_text(['Field3'])
+    card = cards_of(deck)[2]
+    card.set_field('Field3', 'replaced value')
+    deck.upsert(card)
+    assert deck.search_text('replaced') == [2]
+    assert deck.search_text('card2_field3') == []
+
+  def test_remove_by_guid_rebuilds_text_index(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    deck.index_text(['Field3'])
+    deck.remove_by_guid('card0_field0')
+    assert deck.search_text('card5_field3') == [4]
+
+
+class TestWhere:
+
+  def test_where_predicate(self, well_formed_file):
+    expected = as_str_lists(gaggle.AnkiDeck.from_file(well_formed_file))[3:5]
+    deck = gaggle.AnkiDeck.from_file(
+        well_formed_file,
+        where=lambda row: row[0] in ('card3_field0', 'card4_field0'))
+    assert as_str_lists(deck) == expected
+
+  @pytest.mark.parametrize('options', [{}, {
+      'memory_map': True
+  }, {
+      'workers': 2
+  }, {
+      'storage': gaggle.DeckStorage.COLUMNAR
+  }])
+  def test_where_declarative(self, well_formed_file, options):
+    expected = as_str_lists(gaggle.AnkiDeck.from_file(well_formed_file))[7:8]
+    deck = gaggle.AnkiDeck.from_file(
+        well_formed_file, where={'Deck': 'card7_field2'}, **options)
+    assert as_str_lists(deck) == expected
+
+  def test_where_declarative_multiple_entries(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(
+        well_formed_file,
+        where={
+            'Deck': 'card7_field2',
+            'Tags': 'card8_field6'
+        })
+    assert not as_str_lists(deck)
+
+  def test_where_declarative_callable_value(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(
+        well_formed_file,
+        where={'GUID': lambda guid: guid.endswith('9_field0')})
+    assert [card.guid for card in deck] == ['card9_field0', 'card19_field0']
+
+  def test_where_rejected_rows_create_no_cards(self, well_formed_file, mocker):
+    from_schema = mocker.spy(gaggle.AnkiCard, 'from_schema')
+    gaggle.AnkiDeck.from_file(well_formed_file, where=lambda row: False)
+    from_schema.assert_not_called()
+
+  def test_where_non_reserved_field_raises_value_error(self, well_formed_file):
+    with pytest.raises(ValueError):
+      gaggle.AnkiDeck.from_file(well_formed_file, where={'Field3': 'value'})
+
+  def test_compile_row_filter_hierarchy(self):
+    header = {'deck_idx': 0, 'tags_idx': 1}
+    predicate = gaggle._compile_row_filter({
+        'Deck': 'A::B',
+        'Tags': 'lang'
+    }, header)
+    assert predicate(['A::B::C', 'x Lang::French'])
+    assert not predicate(['A::BC', 'lang'])
+    assert not predicate(['A::B', 'language'])
+    assert not predicate(['A::B'])
+
+
+class TestColumns:
+
+  @pytest.mark.parametrize('options', [{}, {
+      'memory_map': True
+  }, {
+      'storage': gaggle.DeckStorage.COLUMNAR
+  }, {
+      'storage': gaggle.DeckStorage.SQLITE
+  }])
+  def test_columns_by_name(self, well_formed_file, options):
+    deck = gaggle.AnkiDeck.from_file(
+        well_formed_file, columns=['Field4', 'Tags', 'GUID'], **options)
+    assert as_str_lists(deck)[3] == [
+        'card3_field4', 'card3_field6', 'card3_field0'
+    ]
+    assert deck.header['tags_idx'] == 1
+    assert deck.header['guid_idx'] == 2
+    assert 'deck_idx' not in deck.header
+    assert 'note_type_idx' not in deck.header
+    card = next(iter(deck))
+    assert card.tags == 'card0_field6'
+    assert card.guid == 'card0_field0'
+
+  def test_columns_by_index(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(well_formed_file, columns=[3])
+    assert as_str_lists(deck)[0] == ['card0_field3']
+    assert next(iter(deck)).fields == {'Field3': 'card0_field3'}
+
+  def test_columns_with_field_names(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(
+        well_formed_file,
+        field_names=['', '', '', 'Front', 'Back', 'Extra'],
+        columns=['Back', 'Front'])
+    card = next(iter(deck))
+    assert card.get_field('Front') == 'card0_field3'
+    assert card.get_field('Back') == 'card0_field4'
+
+  def test_columns_after_where(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(
+        well_formed_file, where={'Deck': 'card5_field2'}, columns=['Field3'])
+    assert as_str_lists(deck) == [['card5_field3']]
+
+  def test_columns_write_as_tsv_header(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(
+        well_formed_file, columns=['Field3', 'Tags'])
+    written = io.StringIO()
+    deck.write_header(written)
+    assert '#tags column:2\n' in written.getvalue()
+    assert 'guid column' not in written.getvalue()
+
+  def test_columns_no_content(
+      self, case_anki_export_file_well_formed_header_no_content):
+    deck = gaggle.AnkiDeck.from_file(
+        case_anki_export_file_well_formed_header_no_content, columns=['Tags'])
+    assert deck.header['tags_idx'] == 0
+    assert not as_str_lists(deck)
+
+  def test_project_columns_leaves_header_unchanged(self):
+    header = {'separator': 'tab', 'guid_idx': 0, 'tags_idx': 2}
+    schema = gaggle.FieldSchema.from_header(gaggle._field_settings(header))
+    records, projected_header, _ = gaggle._project_columns([['a', 'b', 'c']],
+                                                           header, schema,
+                                                           ['Tags'])
+    assert [list(record) for record in records] == [['c']]
+    assert projected_header == {'separator': 'tab', 'tags_idx': 0}
+    assert header == {'separator': 'tab', 'guid_idx': 0, 'tags_idx': 2}
+
+  @pytest.mark.parametrize('columns', [['Missing'], [7]])
+  def test_columns_missing_raises_value_error(self, well_formed_file, columns):
+    with pytest.raises(ValueError):
+      gaggle.AnkiDeck.from_file(well_formed_file, columns=columns)
+
+
+class TestDirtyTracking:
+
+  @pytest.fixture
+  def deck(self, well_formed_file):
+    return gaggle.AnkiDeck.from_file(well_formed_file)
+
+  def test_loaded_deck_is_clean(self, deck):
+    assert deck.changed_cards() == []
+    assert deck.removed_guids == frozenset()
+
+  def test_set_field_marks_card(self, deck):
+    deck.cards[3].set_field('Field3', 'edited')
+    assert deck.changed_cards() == [deck.cards[3]]
+
+  @pytest.mark.parametrize(
+      'storage', [gaggle.DeckStorage.COLUMNAR, gaggle.DeckStorage.SQLITE])
+  def test_upsert_tracked_for_any_storage(self, well_formed_file, storage):
+    deck = gaggle.AnkiDeck.from_file(well_formed_file, storage=storage)
+    card = deck.get_by_guid('card2_field0')
+    assert card is not None
+    card.set_field('Field3', 'edited')
+    deck.upsert(card)
+    assert [changed.guid for changed in deck.changed_cards()
+           ] == ['card2_field0']
+
+  def test_added_modified_removed(self, deck):
+    edited = deck.cards[1]
+    edited.set_field('Field3', 'edited')
+    deck.upsert(edited)
+    added = gaggle.AnkiCard.from_layout(
+        ('new_guid',) + tuple(deck.cards[0].as_str_list()[1:]),
+        deck.cards[0].layout)
+    deck.upsert(added)
+    deck.remove_by_guid('card5_field0')
+    assert deck.changed_cards() == [edited, added]
+    assert deck.removed_guids == {'card5_field0'}
+
+  def test_added_then_removed_is_not_reported(self, deck):
+    added = gaggle.AnkiCard.from_layout(
+        ('new_guid',) + tuple(deck.cards[0].as_str_list()[1:]),
+        deck.cards[0].layout)
+    deck.upsert(added)
+    deck.remove_by_guid('new_guid')
+    assert deck.changed_cards() == []
+    assert deck.removed_guids == frozenset()
+
+  def test_checkpoint_clears_changes(self, deck):
+    deck.cards[0].set_field('Field3', 'edited')
+    deck.remove_by_guid('card5_field0')
+    deck.checkpoint()
+    assert deck.changed_cards() == []
+    assert deck.removed_guids == frozenset()
+    assert not deck.cards[0].is_modified
+
+  def test_reindex_reconciles_direct_changes(self, deck):
+    removed = deck.get_by_guid('card5_field0')
+    assert removed is not None
+    deck.remove_by_guid('card5_field0')
+    added = gaggle.AnkiCard.from_layout(
+        ('new_guid',) + tuple(removed.as_str_list()[1:]), removed.layout)
+    deck.upsert(added)
+    deck.cards.remove(added)
+    deck.cards.append(removed)
+    deck.reindex()
+    assert deck.removed_guids == frozenset()
+    assert deck.changed_cards() == [removed]
+    assert as_str_lists(deck.delta()) == [removed.as_str_list()]
+
+  def test_delta_keeps_header(self, deck):
+    deck.cards[4].set_field('Field3', 'edited')
+    delta = deck.delta()
+    assert delta.header == deck.header
+    assert as_str_lists(delta) == [deck.cards[4].as_str_list()]
+
+
+class TestFingerprint:
+
+  @pytest.fixture
+  def deck(self, well_formed_file):
+    return gaggle.AnkiDeck.from_file(well_formed_file)
+
+  def test_card_fingerprint_invalidated_on_edit(self, deck):
+    card = deck.cards[0]
+    fingerprint = card.fingerprint
+    card.set_field('Field3', 'edited')
+    assert card.fingerprint != fingerprint
+    card.set_field('Field3', 'card0_field3')
+    assert card.fingerprint == fingerprint
+
+  def test_card_fingerprint_ignores_field_names(self, deck):
+    card = deck.cards[0]
+    assert gaggle.AnkiCard(card.as_str_list()).fingerprint == card.fingerprint
+
+  @pytest.mark.parametrize(
+      'storage', [gaggle.DeckStorage.COLUMNAR, gaggle.DeckStorage.SQLITE])
+  def test_deck_fingerprint_matches_across_storage(self, well_formed_file, deck,
+                                                   storage):
+    other = gaggle.AnkiDeck.from_file(well_formed_file, storage=storage)
+    assert other.fingerprint() == deck.fingerprint()
+
+  def test_deck_fingerprint_invalidated_on_edit(self, deck):
+    fingerprint = deck.fingerprint()
+    deck.cards[7].set_field('Field3', 'edited')
+    assert deck.fingerprint() != fingerprint
+
+  @pytest.mark.parametrize('storage', list(gaggle.DeckStorage))
+  def test_deck_fingerprint_cached(self, well_formed_file, storage, mocker):
+    deck = gaggle.AnkiDeck.from_file(well_formed_file, storage=storage)
+    fingerprint = deck.fingerprint()
+    merkle_root_spy = mocker.spy(gaggle.digest, 'merkle_root')
+    assert deck.fingerprint() == fingerprint
+    assert merkle_root_spy.call_count == 0
+
+  def test_deck_fingerprint_invalidated_on_reindex(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(
+        well_formed_file, storage=gaggle.DeckStorage.COLUMNAR)
+    fingerprint = deck.fingerprint()
+    column = deck.column('Field3')
+    assert isinstance(column, list)
+    column[7] = 'edited'
+    deck.reindex()
+    assert deck.fingerprint() != fingerprint
+
+  def test_deck_fingerprint_invalidated_on_columnar_edit(
+      self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(
+        well_formed_file, storage=gaggle.DeckStorage.COLUMNAR)
+    fingerprint = deck.fingerprint()
+    cards_of(deck)[7].set_field('Field3', 'edited')
+    assert deck.fingerprint() != fingerprint
+    cards_of(deck)[7].set_field('Field3', 'card7_field3')
+    assert deck.fingerprint() == fingerprint
+
+  @pytest.mark.parametrize('storage', list(gaggle.DeckStorage))
+  def test_deck_fingerprint_invalidated_on_upsert_and_remove(
+      self, well_formed_file, storage):
+    deck = gaggle.AnkiDeck.from_file(well_formed_file, storage=storage)
+    fingerprint = deck.fingerprint()
+    card = cards_of(deck)[3]
+    edited = gaggle.AnkiCard.from_layout(
+        tuple(card.as_str_list()[:3]) + ('edited',) +
+        tuple(card.as_str_list()[4:]), card.layout)
+    deck.upsert(edited)
+    edited_fingerprint = deck.fingerprint()
+    assert edited_fingerprint != fingerprint
+    deck.remove_by_guid(card.guid)
+    assert deck.fingerprint() not in (fingerprint, edited_fingerprint)
+
+  def test_deck_fingerprint_invalidated_on_transform(self, deck):
+    fingerprint = deck.fingerprint()
+    deck.transform({'Field3': str.upper}, executor=gaggle.ExecutorType.THREAD)
+    assert deck.fingerprint() != fingerprint
+
+  def test_deck_fingerprint_invalidated_on_replaced_cards(self, deck):
+    fingerprint = deck.fingerprint()
+    schema = gaggle.FieldSchema.from_header(gaggle._field_settings(deck.header))
+    deck.cards = gaggle.ColumnarCards.from_records(
+        as_str_lists(deck)[1:], schema)
+    assert deck.fingerprint() != fingerprint
+
+  def test_deck_fingerprint_changes_with_order(self, deck):
+    fingerprint = deck.fingerprint()
+    deck.cards.reverse()
+    assert deck.fingerprint() != fingerprint
+
+  def test_cards_changed_from(self, deck):
+    fingerprints = deck.card_fingerprints()
+    deck.cards[2].set_field('Field3', 'edited')
+    added = gaggle.AnkiCard.from_layout(
+        ('new_guid',) + tuple(deck.cards[0].as_str_list()[1:]),
+        deck.cards[0].layout)
+    deck.upsert(added)
+    assert deck.cards_changed_from(fingerprints) == [deck.cards[2], added]
+
+  def test_card_fingerprints_without_guid_raises_value_error(self, deck):
+    del deck.header['guid_idx']
+    with pytest.raises(ValueError):
+      deck.card_fingerprints()
+
+
+def transform_upper(value):
+  return value.upper()
+
+
+def transform_fail_card3(value):
+  if value == 'card3_field3':
+    raise RuntimeError(value)
+  return value.upper()
+
+
+class TestTransform:
+
+  @pytest.fixture
+  def deck(self, well_formed_file):
+    return gaggle.AnkiDeck.from_file(well_formed_file)
+
+  @pytest.mark.parametrize('workers, executor', [(None, 'process'),
+                                                 (2, 'process'), (2, 'thread')])
+  def test_transform_in_order(self, deck, workers, executor):
+    deck.transform({
+        'Field3': transform_upper,
+        'Field4': transform_upper
+    },
+                   workers=workers,
+                   executor=executor,
+                   chunk_size=3)
+    assert [card.get_field('Field3') for card in deck
+           ] == [f'CARD{idx}_FIELD3' for idx in range(20)]
+    assert [card.get_field('Field4') for card in deck
+           ] == [f'CARD{idx}_FIELD4' for idx in range(20)]
+    assert deck.cards[0].get_field('Field5') == 'card0_field5'
+
+  def test_transform_unpicklable_falls_back(self, deck):
+    deck.transform({'Field3': lambda value: value + '!'}, workers=2)
+    assert deck.cards[19].get_field('Field3') == 'card19_field3!'
+
+  @pytest.mark.parametrize('workers', [None, 2])
+  def test_transform_failed_chunk_unchanged(self, deck, workers):
+    with pytest.raises(exceptions.CardsNotTransformedException) as e:
+      deck.transform({'Field3': transform_fail_card3},
+                     workers=workers,
+                     chunk_size=5)
+    assert list(e.value.failures) == [range(0, 5)]
+    assert isinstance(e.value.failures[range(0, 5)], RuntimeError)
+    assert deck.cards[4].get_field('Field3') == 'card4_field3'
+    assert deck.cards[5].get_field('Field3') == 'CARD5_FIELD3'
+
+  def test_transform_columnar(self, well_formed_file):
+    deck = gaggle.AnkiDeck.from_file(
+        well_formed_file, storage=gaggle.DeckStorage.COLUMNAR)
+    deck.transform({'Field3': transform_upper}, chunk_size=7)
+    assert deck.column('Field3') == [f'CARD{idx}_FIELD3' for idx in range(20)]
+    assert len(deck.changed_cards()) == 20
+
+  def test_transform_records_changed_cards(self, deck):
+    deck.transform({'Field3': lambda value: value.replace('card1_', 'x_')})
+    assert [card.guid for card in deck.changed_cards()] == ['card1_field0']
+
+  def test_transform_reindexes(self, deck):
+    assert deck.get_by_guid('card0_field0') is deck.cards[0]
+    deck.transform({'GUID': transform_upper})
+    assert deck.get_by_guid('card0_field0') is None
+    assert deck.get_by_guid('CARD0_FIELD0') is deck.cards[0]
+
+  def test_transform_unknown_field_raises_key_error(self, deck):
+    with pytest.raises(KeyError):
+      deck.transform({'Missing': transform_upper})
+
+  def test_transform_invalid_chunk_size_raises_value_error(self, deck):
+    with pytest.raises(ValueError):
+      deck.transform({'Field3': transform_upper}, chunk_size=0)
+
+
+class TestValidate:
+
+  @pytest.fixture
+  def header(self):
+    return {'guid_idx': 0, 'tags_idx': 3}
+
+  def test_well_formed_deck_is_valid(self, well_formed_file):
+    report = gaggle.AnkiDeck.from_file(well_formed_file).validate()
+    assert report.is_valid
+    assert report.num_rows == 20
+    assert str(report) == 'No issues found in 20 rows.'
+
+  def test_field_name_diagnostics_aggregated(self, well_formed_file):
+    with warnings.catch_warnings(record=True) as records:
+      warnings.simplefilter('always')
+      deck = gaggle.AnkiDeck.from_file(
+          well_formed_file, field_names=['Not GUID', '', '', 'Front', 'Front'])
+    report = deck.validate(sample_size=3)
+    assert not records
+    assert report.counts == {
+        gaggle.ValidationIssue.MISMATCHED_FIELD_NAME: 20,
+        gaggle.ValidationIssue.DUPLICATE_FIELD_NAME: 20,
+    }
+    assert report.sample_rows[gaggle.ValidationIssue.DUPLICATE_FIELD_NAME] == [
+        0, 1, 2
+    ]
+    assert len(
+        report.messages[gaggle.ValidationIssue.DUPLICATE_FIELD_NAME]) == 1
+
+  def test_row_issues(self, header):
+    schema = gaggle.FieldSchema.from_header(gaggle._field_settings(header))
+    rows = [
+        ['a', 'x', 'y', 'tag'],
+        ['', 'x', 'y', 'tag'],
+        ['a', 'x', 'y', 'tag'],
+        ['b', 'x', 'y'],
+        ['c', 'x', 'y', 'tag'],
+    ]
+    deck = gaggle.AnkiDeck(
+        header, [gaggle.AnkiCard.from_schema(row, schema) for row in rows])
+    report = deck.validate()
+    assert not report.is_valid
+    assert report.counts == {
+        gaggle.ValidationIssue.EMPTY_GUID: 1,
+        gaggle.ValidationIssue.DUPLICATE_GUID: 1,
+        gaggle.ValidationIssue.INCONSISTENT_ROW_WIDTH: 1,
+        gaggle.ValidationIssue.MISSING_RESERVED_COLUMN: 1,
+    }
+    assert report.sample_rows == {
+        gaggle.ValidationIssue.EMPTY_GUID: [1],
+        gaggle.ValidationIssue.DUPLICATE_GUID: [2],
+        gaggle.ValidationIssue.INCONSISTENT_ROW_WIDTH: [3],
+        gaggle.ValidationIssue.MISSING_RESERVED_COLUMN: [3],
+    }
+    assert str(report).startswith('Found 4 issues in 5 rows:')
+
+  def test_inconsistent_row_width_samples_in_row_order(self, header):
+    schema = gaggle.FieldSchema.from_header(gaggle._field_settings(header))
+    widths = [4, 5, 4, 3, 4, 5, 3, 4, 4]
+    rows = [
+        [f'guid{row}'] + ['x'] * (width - 1) for row, width in enumerate(widths)
+    ]
+    deck = gaggle.AnkiDeck(
+        header, (gaggle.AnkiCard.from_schema(row, schema) for row in rows))
+    report = deck.validate(sample_size=3)
+    issue = gaggle.ValidationIssue.INCONSISTENT_ROW_WIDTH
+    assert report.num_rows == len(rows)
+    assert report.counts[issue] == 4
+    assert report.sample_rows[issue] == [1, 3, 5]
+    assert report.messages[issue] == [
+        'Expected 4 fields but instead got 5',
+        'Expected 4 fields but instead got 3',
+    ]
+
+  def test_streamed_deck_matches_loaded_deck(self, well_formed_file):
+    loaded_report = gaggle.AnkiDeck.from_file(well_formed_file).validate()
+    streamed_report = gaggle.AnkiDeck.open_stream(well_formed_file).validate()
+    assert str(streamed_report) == str(loaded_report)
+
+  def test_negative_sample_size_raises_value_error(self, well_formed_file):
+    with pytest.raises(ValueError):
+      gaggle.AnkiDeck.from_file(well_formed_file).validate(sample_size=-1)
+
+
+class TestMemoryMap:
+
+  def test_memory_map_matches_from_file(self, well_formed_file):
+    expected_deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    mapped_deck = gaggle.AnkiDeck.from_file(well_formed_file, memory_map=True)
+    assert mapped_deck.header == expected_deck.header
+    assert as_str_lists(mapped_deck) == as_str_lists(expected_deck)
+
+  def test_memory_map_no_content(
+      self, case_anki_export_file_well_formed_header_no_content):
+    mapped_deck = gaggle.AnkiDeck.from_file(
+        case_anki_export_file_well_formed_header_no_content, memory_map=True)
+    assert not list(mapped_deck)
+
+  def test_read_header_settings_from_buffer_finds_body(self):
+    buffer = b'#separator:tab\n#html:false\nvalue0\tvalue1\n'
+    header, body_start = gaggle.read_header_settings_from_buffer(buffer)
+    assert header == {'separator': 'tab', 'html': 'false'}
+    assert buffer[body_start:] == b'value0\tvalue1\n'
+
+  @pytest.mark.parametrize('block_size', [1, 8, 2**20])
+  @pytest.mark.parametrize(
+      'rows', [
+          [['a', 'b'], ['c', 'd']],
+          [['quoted\ttab', 'b'], ['c', 'd']],
+          [['a', 'multi\nline'], ['c', 'with "quotes"']],
+          [['a', 'crlf\r\nline'], [], ['', '']],
+      ],
+      ids=['plain', 'tab', 'newline', 'crlf'])
+  def test_iterate_buffer_records_matches_csv_reader(self, rows, block_size):
+    text = io.StringIO(newline='')
+    csv.writer(
+        text, dialect=gaggle._ANKI_EXPORT_CONTENT_DIALECT).writerows(rows)
+    buffer = text.getvalue().encode(gaggle._ANKI_EXPORT_ENCODING)
+    text.seek(0)
+    expected_rows = list(
+        csv.reader(text, dialect=gaggle._ANKI_EXPORT_CONTENT_DIALECT))
+    assert list(gaggle.iterate_buffer_records(
+        buffer, block_size=block_size)) == expected_rows
+    cards = gaggle._store_encoded_cards(buffer, 0, gaggle.FieldSchema(),
+                                        block_size)
+    assert [card.as_str_list() for card in cards] == expected_rows
+
+  def test_iterate_buffer_records_stops_at_end(self):
+    buffer = b'"a"\tb\nc\td\n'
+    assert list(gaggle.iterate_buffer_records(buffer, 0, 6)) == [['a', 'b']]
+    assert list(gaggle.iterate_buffer_records(buffer, 0, 4)) == [['a', '']]
+
+  def test_memory_map_keeps_rows_encoded(self, well_formed_file):
+    mapped_deck = gaggle.AnkiDeck.from_file(well_formed_file, memory_map=True)
+    card = cards_of(mapped_deck)[3]
+    assert isinstance(card, gaggle.EncodedAnkiCard)
+    assert card._encoded
+    assert card.guid == 'card3_field0'
+    assert not card._encoded
+
+  def test_encoded_card_set_field(self):
+    card = gaggle.EncodedAnkiCard.from_encoded(
+        'caf\u00e9\tb'.encode(gaggle._ANKI_EXPORT_ENCODING),
+        gaggle.FieldSchema())
+    card.set_field('Field1', 'edited')
+    assert card.as_str_list() == ['caf\u00e9', 'edited']
+    assert card.is_modified
+
+  def test_encoded_card_empty_row(self):
+    card = gaggle.EncodedAnkiCard.from_encoded(b'', gaggle.FieldSchema())
+    assert card.as_str_list() == []
+
+  def test_encoded_card_missing_attribute_raises_attribute_error(self):
+    card = gaggle.EncodedAnkiCard.from_encoded(b'a', gaggle.FieldSchema())
+    with pytest.raises(AttributeError):
+      card.missing  # pylint: disable=pointless-statement,no-member
+
+  def test_encoded_card_pickles_decoded(self):
+    card = gaggle.EncodedAnkiCard.from_encoded(b'a\tb', gaggle.FieldSchema())
+    assert pickle.loads(pickle.dumps(card)).as_str_list() == ['a', 'b']
+
+
+class TestParallelParse:
+
+  @pytest.mark.slow
+  def test_workers_matches_from_file(self, well_formed_file, mocker):
+    parallel_spy = mocker.spy(gaggle, '_iterate_records_in_parallel')
+    expected_deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    parallel_deck = gaggle.AnkiDeck.from_file(well_formed_file, workers=3)
+    assert parallel_spy.call_count == 1
+    assert parallel_deck.header == expected_deck.header
+    assert as_str_lists(parallel_deck) == as_str_lists(expected_deck)
+
+  def test_one_worker_parses_sequentially(self, well_formed_file, mocker):
+    parallel_spy = mocker.spy(gaggle, '_iterate_records_in_parallel')
+    expected_deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    deck = gaggle.AnkiDeck.from_file(well_formed_file, workers=1)
+    assert parallel_spy.call_count == 0
+    assert as_str_lists(deck) == as_str_lists(expected_deck)
+
+  @pytest.mark.parametrize('parts', [1, 2, 3, 10])
+  def test_find_record_boundaries_keeps_quoted_newlines(self, parts):
+    buffer = b'a\t"b\nc"\n"d\n\ne"\tf\ng\th\n'
+    boundaries = gaggle.find_record_boundaries(buffer, 0, len(buffer), parts)
+    records = [
+        record for start, end in zip(boundaries, boundaries[1:])
+        for record in gaggle.iterate_buffer_records(buffer, start, end)
+    ]
+    assert records == list(gaggle.iterate_buffer_records(buffer))
+    assert boundaries[0] == 0 and boundaries[-1] == len(buffer)
+
+
+class TestAsync:
+
+  def test_afrom_file_matches_from_file(self, well_formed_file):
+    expected_deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    deck = asyncio.run(gaggle.AnkiDeck.afrom_file(well_formed_file))
+    assert deck.header == expected_deck.header
+    assert as_str_lists(deck) == as_str_lists(expected_deck)
+
+  @pytest.mark.parametrize('chunk_size', [1, 3, 1024])
+  def test_aiter_cards_matches_iter(self, well_formed_file, chunk_size):
+
+    async def collect(deck):
+      return [card.as_str_list() async for card in deck.aiter_cards(chunk_size)]
+
+    deck = gaggle.AnkiDeck.open_stream(well_formed_file)
+    assert asyncio.run(collect(deck)) == as_str_lists(deck)
+
+  def test_async_for_iterates_deck(self, well_formed_file):
+
+    async def collect(deck):
+      return [card async for card in deck]
+
+    deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    assert asyncio.run(collect(deck)) == list(deck)
+
+
+class NonSeekableStream(io.RawIOBase):
+  """Binary stream which, like a pipe, cannot seek or tell."""
+
+  def __init__(self, content):
+    self._content = io.BytesIO(content)
+
+  def readable(self):
+    return True
+
+  def readinto(self, b):
+    data = self._content.read(len(b))
+    b[:len(data)] = data
+    return len(data)
+
+
+class ReadOnlyStream:
+  """Object whose only method is read(), returning fewer bytes than asked."""
+
+  def __init__(self, content):
+    self._content = io.BytesIO(content)
+
+  def read(self, size=-1):
+    return self._content.read(min(size, 7) if size >= 0 else size)
+
+
+class TestFromStream:
+
+  def test_from_stream_binary_non_seekable_matches_from_file(
+      self, well_formed_file):
+    expected_deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    with open(well_formed_file, 'rb') as f:
+      stream = NonSeekableStream(f.read())
+    assert not stream.seekable()
+    deck = gaggle.AnkiDeck.from_stream(stream)
+    assert deck.header == expected_deck.header
+    assert as_str_lists(deck) == as_str_lists(expected_deck)
+    assert not stream.closed
+
+  @pytest.mark.parametrize('compress', [bytes, gzip.compress])
+  def test_from_stream_read_only_matches_from_file(self, well_formed_file,
+                                                   compress):
+    expected_deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    with open(well_formed_file, 'rb') as f:
+      stream = ReadOnlyStream(compress(f.read()))
+    deck = gaggle.AnkiDeck.from_stream(stream)
+    assert deck.header == expected_deck.header
+    assert as_str_lists(deck) == as_str_lists(expected_deck)
+
+  def test_from_stream_text_matches_from_file(self, well_formed_file):
+    expected_deck = gaggle.AnkiDeck.from_file(well_formed_file)
+    with open(well_formed_file, **gaggle.READ_PARAMS) as f:
+      deck = gaggle.AnkiDeck.from_stream(f)
+    assert as_str_lists(deck) == as_str_lists(expected_deck)
+
+  def test_read_header_settings_pushes_back_first_line(self):
+    lines = ['#separator:tab\n', '#html:false\n', 'value0\tvalue1\n', 'next\n']
+    header, body = gaggle.read_header_settings(lines)
+    assert header == {'separator': 'tab', 'html': 'false'}
+    assert list(body) == lines[2:]
+
+  def test_read_header_settings_stream_body(self):
+    f = io.StringIO('#separator:tab\n#html:false\nvalue0\tvalue1\n')
+    header, body = gaggle.read_header_settings(f)
+    assert header == {'separator': 'tab', 'html': 'false'}
+    assert list(body) == ['value0\tvalue1\n']
+
+  def test_read_header_settings_header_only(self):
+    header, body = gaggle.read_header_settings(['#separator:tab\n'])
+    assert header == {'separator': 'tab'}
+    assert not list(body)
+
+  def test_parse_header_settings_reformats_header(self):
+    header, body = gaggle.parse_header_settings(
+        ['#separator:tab\n', '#guid column:1\n', 'value0\tvalue1\n'])
+    assert header == {'separator': 'tab', 'guid_idx': 0}
+    assert list(body) == ['value0\tvalue1\n']
@@ -16,3 +16,253 @@
 # pylint: disable=missing-module-docstring
 # pylint: disable=missing-class-docstring
 # pylint: disable=redefined-outer-name
+import asyncio
+import gzip
+import io
+import lzma
+
+import pytest
+
+from gaggle import exceptions
+from gaggle import gaggle
+
+
+def test_gaggle_lazy_opens_stream(
+    case_anki_export_file_well_formed_header_well_formed_content):
+  test_gaggle = gaggle.Gaggle(
+      case_anki_export_file_well_formed_header_well_formed_content, lazy=True)
+  deck = test_gaggle.get_deck(0)
+  assert isinstance(deck.cards, gaggle.AnkiExportStream)
+  assert len(list(deck)) == 20
+
+
+class TestAddDecksFromFiles:
+
+  @pytest.fixture
+  def files(self, case_anki_export_file_well_formed_header_well_formed_content,
+            case_anki_export_file_well_formed_header_no_content):
+    return [
+        case_anki_export_file_well_formed_header_well_formed_content,
+        case_anki_export_file_well_formed_header_no_content,
+        case_anki_export_file_well_formed_header_well_formed_content,
+    ]
+
+  @pytest.mark.slow
+  @pytest.mark.parametrize('executor', ['process', 'thread'])
+  def test_add_decks_from_files_preserves_order(self, files, executor):
+    test_gaggle = gaggle.Gaggle()
+    test_gaggle.add_decks_from_files(files, max_workers=2, executor=executor)
+    deck_sizes = [len(list(deck)) for deck in test_gaggle]
+    assert deck_sizes == [20, 0, 20]
+
+  def test_add_decks_from_files_collects_failures(self, files):
+    missing_file = 'This file does not exist.txt'
+    test_gaggle = gaggle.Gaggle()
+    with pytest.raises(exceptions.DecksNotLoadedException) as exception_info:
+      test_gaggle.add_decks_from_files([missing_file, *files],
+                                       executor='thread')
+    assert list(exception_info.value.failures) == [missing_file]
+    assert isinstance(exception_info.value.failures[missing_file],
+                      FileNotFoundError)
+    assert len(test_gaggle.decks) == len(files)
+
+  def test_add_decks_from_files_invalid_executor_raises_value_error(
+      self, files):
+    with pytest.raises(ValueError):
+      gaggle.Gaggle().add_decks_from_files(files, executor='invalid')
+
+
+def test_awrite_deck_to_file_matches_write_deck_to_file(
+    tmp_path, case_anki_export_file_well_formed_header_well_formed_content):
+  test_gaggle = gaggle.Gaggle()
+  asyncio.run(
+      test_gaggle.aadd_deck_from_file(
+          case_anki_export_file_well_formed_header_well_formed_content))
+  test_gaggle.write_deck_to_file(0, 'sync', destination=str(tmp_path))
+  asyncio.run(
+      test_gaggle.awrite_deck_to_file(0, 'async', destination=str(tmp_path)))
+  assert (tmp_path / 'sync').read_bytes() == (tmp_path / 'async').read_bytes()
+
+
+class TestCompression:
+
+  @pytest.fixture
+  def test_gaggle(self,
+                  case_anki_export_file_well_formed_header_well_formed_content):
+    return gaggle.Gaggle(
+        case_anki_export_file_well_formed_header_well_formed_content)
+
+  @pytest.mark.parametrize('compression, magic_bytes', [
+      ('gzip', b'\x1f\x8b'),
+      ('bz2', b'BZh'),
+      ('xz', b'\xfd7zXZ\x00'),
+  ])
+  def test_write_deck_to_file_compressed_round_trip(self, tmp_path, test_gaggle,
+                                                    compression, magic_bytes):
+    test_gaggle.write_deck_to_file(
+        0,
+        'deck',
+        destination=str(tmp_path),
+        extension='.txt',
+        compression=compression,
+        compression_level=1)
+    written_file, = tmp_path.iterdir()
+    assert written_file.read_bytes().startswith(magic_bytes)
+    deck = gaggle.AnkiDeck.from_file(written_file)
+    expected_deck = test_gaggle.get_deck(0)
+    assert deck.header == expected_deck.header
+    assert [card.as_str_list() for card in deck
+           ] == [card.as_str_list() for card in expected_deck]
+
+  def test_write_deck_to_file_compression_from_extension(
+      self, tmp_path, test_gaggle):
+    test_gaggle.write_deck_to_file(
+        0, 'deck', destination=str(tmp_path), extension='.txt.gz')
+    assert (tmp_path / 'deck.txt.gz').read_bytes().startswith(b'\x1f\x8b')
+
+  @pytest.mark.parametrize('memory_map', [False, True])
+  def test_from_file_compressed_matches_uncompressed(
+      self, tmp_path,
+      case_anki_export_file_well_formed_header_well_formed_content, memory_map):
+    file_path = case_anki_export_file_well_formed_header_well_formed_content
+    compressed_path = tmp_path / 'deck.txt.xz'
+    with open(file_path, 'rb') as f:
+      compressed_path.write_bytes(lzma.compress(f.read()))
+    expected_deck = gaggle.AnkiDeck.from_file(file_path)
+    deck = gaggle.AnkiDeck.from_file(compressed_path, memory_map=memory_map)
+    stream_deck = gaggle.AnkiDeck.open_stream(compressed_path)
+    expected_cards = [card.as_str_list() for card in expected_deck]
+    assert [card.as_str_list() for card in deck] == expected_cards
+    assert [card.as_str_list() for card in stream_deck] == expected_cards
+
+  def test_from_file_txt_extension_not_sniffed(
+      self, tmp_path, mocker,
+      case_anki_export_file_well_formed_header_well_formed_content):
+    file_path = tmp_path / 'deck.txt'
+    with open(case_anki_export_file_well_formed_header_well_formed_content,
+              'rb') as f:
+      file_path.write_bytes(f.read())
+    detect_compression = mocker.spy(gaggle, 'detect_compression')
+    deck = gaggle.AnkiDeck.from_file(file_path)
+    stream_deck = gaggle.AnkiDeck.open_stream(file_path)
+    assert len(list(deck)) == len(list(stream_deck)) == 20
+    assert detect_compression.call_count == 0
+
+  def test_from_stream_gzip(
+      self, case_anki_export_file_well_formed_header_well_formed_content):
+    file_path = case_anki_export_file_well_formed_header_well_formed_content
+    with open(file_path, 'rb') as f:
+      stream = io.BytesIO(gzip.compress(f.read()))
+    deck = gaggle.AnkiDeck.from_stream(stream)
+    assert len(list(deck)) == 20
+    assert not stream.closed
+
+  def test_write_deck_to_file_invalid_compression_raises_value_error(
+      self, tmp_path, test_gaggle):
+    with pytest.raises(ValueError):
+      test_gaggle.write_deck_to_file(
+          0, destination=str(tmp_path), compression='zip')
+
+
+def test_build_deck_trie_spans_decks(
+    case_anki_export_file_well_formed_header_well_formed_content):
+  test_gaggle = gaggle.Gaggle(
+      case_anki_export_file_well_formed_header_well_formed_content)
+  test_gaggle.add_deck_from_file(
+      case_anki_export_file_well_formed_header_well_formed_content)
+  deck_trie = test_gaggle.build_deck_trie()
+  cards = test_gaggle.get_deck(0).cards
+  assert isinstance(cards, list)
+  deck_name = cards[0].deck_name
+  assert deck_trie.count() == 40
+  assert (0, 0) in deck_trie.keys(deck_name)
+  assert (1, 0) in deck_trie.keys(deck_name)
+
+
+def test_write_deck_to_file_delta(
+    tmp_path, case_anki_export_file_well_formed_header_well_formed_content):
+  test_gaggle = gaggle.Gaggle(
+      case_anki_export_file_well_formed_header_well_formed_content)
+  deck = test_gaggle.get_deck(0)
+  assert isinstance(deck.cards, list)
+  deck.cards[2].set_field('Field3', 'edited')
+  test_gaggle.write_deck_to_file(
+      0, 'delta', destination=str(tmp_path), delta=True)
+  written_deck = gaggle.AnkiDeck.from_file(tmp_path / 'delta')
+  assert written_deck.header == deck.header
+  assert [card.as_str_list() for card in written_deck
+         ] == [deck.cards[2].as_str_list()]
+
+
+class TestMerge:
+
+  @pytest.fixture
+  def schema(self):
+    return gaggle.FieldSchema.from_header({'guid_idx': 0, 'tags_idx': 2})
+
+  @pytest.fixture
+  def merge_gaggle(self, schema):
+    other_schema = gaggle.FieldSchema.from_header({'guid_idx': 0},
+                                                  ['', 'Front', 'Extra'])
+    first_deck = gaggle.AnkiDeck({
+        'guid_idx': 0,
+        'tags_idx': 2
+    }, [
+        gaggle.AnkiCard.from_schema(['a', 'first a', 'tag'], schema),
+        gaggle.AnkiCard.from_schema(['b', 'first b', ''], schema),
+        gaggle.AnkiCard.from_schema(['a', 'repeated a', ''], schema),
+    ])
+    second_deck = gaggle.AnkiDeck({'guid_idx': 0}, [
+        gaggle.AnkiCard.from_schema(['c', 'second c', 'extra c'], other_schema),
+        gaggle.AnkiCard.from_schema(['b', 'second b', 'extra b'], other_schema),
+    ])
+    test_gaggle = gaggle.Gaggle()
+    test_gaggle.add_deck(first_deck)
+    test_gaggle.add_deck(second_deck)
+    return test_gaggle
+
+  def test_merge_first_wins(self, merge_gaggle):
+    merged = merge_gaggle.merge()
+    assert [card.as_str_list() for card in merged] == [
+        ['a', 'first a', 'tag', '', ''],
+        ['b', 'first b', '', '', ''],
+        ['c', '', '', 'second c', 'extra c'],
+    ]
+
+  def test_merge_last_wins_keeps_first_position(self, merge_gaggle):
+    merged = merge_gaggle.merge(on_conflict='last_wins')
+    assert [card.as_str_list() for card in merged] == [
+        ['a', 'repeated a', '', '', ''],
+        ['b', '', '', 'second b', 'extra b'],
+        ['c', '', '', 'second c', 'extra c'],
+    ]
+
+  def test_merge_custom_resolver(self, merge_gaggle):
+    merged = merge_gaggle.merge(on_conflict=lambda kept, incoming: incoming if
+                                kept.get_field('Field1') == 'first a' else kept)
+    assert [card.guid for card in merged] == ['a', 'b', 'c']
+    assert merged.get_by_guid('a').get_field('Field1') == 'repeated a'
+    assert merged.get_by_guid('b').get_field('Field1') == 'first b'
+
+  def test_merge_by_callable_key(self, merge_gaggle):
+    merged = merge_gaggle.merge(key=lambda card: card.guid in ('a', 'b'))
+    assert [card.guid for card in merged] == ['a', 'c']
+
+  def test_merge_reconciled_header(self, merge_gaggle):
+    merged = merge_gaggle.merge()
+    assert merged.header == {
+        'separator': 'tab',
+        'has_html': 'false',
+        'guid_idx': 0,
+        'tags_idx': 2,
+    }
+    assert merged.cards[0].layout.names == ('GUID', 'Field1', 'Tags', 'Front',
+                                            'Extra')
+
+  def test_merge_missing_key_field_raises_key_error(self, merge_gaggle):
+    with pytest.raises(KeyError):
+      merge_gaggle.merge(key='Front')
+
+  def test_merge_invalid_policy_raises_value_error(self, merge_gaggle):
+    with pytest.raises(ValueError):
+      merge_gaggle.merge(on_conflict='newest')
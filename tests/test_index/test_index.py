@@ -0,0 +1,193 @@
+# Copyright 2023 The Gaggle Authors. All Rights Reserved.
+#
+# This file is part of Gaggle.
+#
+# Gaggle is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Gaggle is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Gaggle. If not, see <https://www.gnu.org/licenses/>.
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=redefined-outer-name
+import pytest
+
+from gaggle import index
+
+TAGS = [
+    'Language::French verbs',
+    'Language::German',
+    'verbs',
+    '',
+    'language::french::irregular Verbs',
+]
+
+
+@pytest.fixture
+def tag_index():
+  return index.TagIndex.from_tags(TAGS)
+
+
+class TestBitset:
+
+  @pytest.mark.parametrize('positions', [[], [0], [3, 7, 8], [0, 63, 64, 1000]])
+  def test_round_trip(self, positions):
+    bitset = index.bitset_from_positions(positions)
+    assert list(index.positions_from_bitset(bitset)) == positions
+
+  def test_bitset_value(self):
+    assert index.bitset_from_positions([0, 2]) == 0b101
+
+
+class TestTagIndex:
+
+  def test_tags_interned_once(self, tag_index):
+    assert tag_index.tag_names == [
+        'Language::French', 'verbs', 'Language::German',
+        'language::french::irregular'
+    ]
+    assert tag_index.tag_id('VERBS') == tag_index.tag_id('verbs') == 1
+
+  def test_num_cards(self, tag_index):
+    assert tag_index.num_cards == 5
+
+  def test_exact_tag(self, tag_index):
+    assert tag_index.query(all_of=['verbs']) == [0, 2, 4]
+
+  def test_hierarchical_prefix(self, tag_index):
+    assert tag_index.query(all_of=['Language']) == [0, 1, 4]
+    assert tag_index.query(all_of=['language::FRENCH']) == [0, 4]
+
+  def test_prefix_does_not_match_partial_name(self, tag_index):
+    assert tag_index.query(all_of=['Lang']) == []
+
+  def test_and_or_not(self, tag_index):
+    assert tag_index.query(all_of=['Language', 'verbs']) == [0, 4]
+    assert tag_index.query(any_of=['Language::German', 'verbs']) == [0, 1, 2, 4]
+    assert tag_index.query(none_of=['Language']) == [2, 3]
+    assert tag_index.query(
+        all_of=['verbs'], none_of=['Language::French::irregular']) == [0, 2]
+
+  def test_empty_query_matches_every_card(self, tag_index):
+    assert tag_index.query() == [0, 1, 2, 3, 4]
+
+  def test_unknown_tag(self, tag_index):
+    assert tag_index.bitset('unknown') == 0
+
+
+DECK_NAMES = ['A::B::C', 'A', 'A::B', 'D', 'A::E', 'A::B::C']
+
+
+@pytest.fixture
+def deck_trie():
+  return index.DeckTrie.from_names(DECK_NAMES)
+
+
+class TestDeckTrie:
+
+  def test_root_holds_every_card(self, deck_trie):
+    assert deck_trie.count() == 6
+    assert deck_trie.keys() == [0, 1, 2, 3, 4, 5]
+
+  def test_subtree_keys(self, deck_trie):
+    assert deck_trie.keys('A') == [0, 1, 2, 4, 5]
+    assert deck_trie.keys('A::B') == [0, 2, 5]
+    assert deck_trie.keys('A::B::C') == [0, 5]
+
+  def test_subtree_counts(self, deck_trie):
+    assert deck_trie.count('A::B') == 3
+    assert deck_trie.counts() == {'A': 5, 'D': 1}
+    assert deck_trie.counts('A') == {'A::B': 3, 'A::E': 1}
+
+  def test_children(self, deck_trie):
+    assert deck_trie.children() == ['A', 'D']
+    assert deck_trie.children('A') == ['A::B', 'A::E']
+    assert deck_trie.children('A::B::C') == []
+
+  def test_missing_deck(self, deck_trie):
+    assert 'A::X' not in deck_trie
+    assert deck_trie.count('A::X') == 0
+    assert deck_trie.keys('A::X') == []
+    assert deck_trie.children('A::X') == []
+
+  def test_prefix_is_not_a_deck(self, deck_trie):
+    assert 'A::B::' not in deck_trie
+    assert deck_trie.keys('A:') == []
+
+  def test_add_invalidates_cached_keys(self, deck_trie):
+    assert deck_trie.keys('A::B') == [0, 2, 5]
+    deck_trie.add('A::B::F', 6)
+    assert deck_trie.keys('A::B') == [0, 2, 5, 6]
+    assert deck_trie.keys('A::E') == [4]
+
+
+CARD_FIELDS = [
+    {
+        'Front': 'The quick <b>brown</b> fox',
+        'Back': 'jumps'
+    },
+    {
+        'Front': 'lazy dog',
+        'Back': 'The brown dog &amp; fox'
+    },
+    {
+        'Front': 'Brownies',
+        'Back': ''
+    },
+]
+
+
+@pytest.fixture
+def text_index():
+  text_index = index.TextIndex(['Front', 'Back'], has_html=True)
+  for position, fields in enumerate(CARD_FIELDS):
+    text_index.add(position, fields)
+  return text_index
+
+
+class TestTextIndex:
+
+  def test_normalise_text_strips_html(self):
+    assert index.normalise_text('<b>A</b>&amp;B', has_html=True) == ' a &b'
+    assert index.normalise_text('<b>A</b>', has_html=False) == '<b>a</b>'
+
+  def test_token_search_ranked_by_field(self, text_index):
+    assert text_index.search('brown') == [0, 1]
+    assert text_index.search('DOG') == [1]
+    assert text_index.search('fox brown') == [0, 1]
+
+  def test_token_search_html_is_not_a_token(self, text_index):
+    assert text_index.search('b') == []
+
+  def test_substring_search(self, text_index):
+    assert text_index.search('brown', substring=True) == [0, 2, 1]
+    assert text_index.search('wn', substring=True) == [0, 2, 1]
+    assert text_index.search('dog & fox', substring=True) == [1]
+
+  def test_search_restricted_to_fields(self, text_index):
+    assert text_index.search('brown', field_names=['Back']) == [1]
+    with pytest.raises(ValueError):
+      text_index.search('brown', field_names=['Missing'])
+
+  def test_add_replaces_card(self, text_index):
+    text_index.add(0, {'Front': 'red', 'Back': ''})
+    assert text_index.search('brown') == [1]
+    assert text_index.search('red') == [0]
+    assert len(text_index) == 3
+
+  def test_remove(self, text_index):
+    text_index.remove(1)
+    assert text_index.search('dog') == []
+    assert text_index.search('row', substring=True) == [0, 2]
+    with pytest.raises(KeyError):
+      text_index.remove(1)
+
+  def test_invalid_ngram_length(self):
+    with pytest.raises(ValueError):
+      index.TextIndex(['Front'], ngram_length=0)